@@ -0,0 +1,394 @@
+"""
+Cold archive for old telemetry: moves whole closed months out of the telemetry table into one
+compressed file per device and month under ARCHIVE_DIR, recorded in telemetry_archives. The
+metrics and export endpoints merge archived rows with live ones; summaries read the rollups,
+which archiving keeps.
+Run: python -m archive [--once] [--month YYYY-MM]  (a separate process alongside the worker)
+
+File layout (little-endian): header (magic, metric count, block count, row count), one index
+entry per block (first/last timestamp, offset, length, rows), then the blocks. A block holds up
+to ARCHIVE_BLOCK_ROWS rows, zlib-compressed: int64 timestamps in microseconds (the first one
+absolute, then deltas from the previous row) followed by one int32 column per metric in stored
+hundredths. Reads mmap the file and decompress only the blocks overlapping the range.
+"""
+import argparse
+import asyncio
+import heapq
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import AsyncIterator, Callable, Sequence
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from operator import itemgetter
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import Integer, delete, func, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from ingest import as_utc
+from models import METRIC_COLUMNS, METRIC_SCALE, Telemetry, TelemetryArchive, TelemetryDaily
+from partitions import month_start
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MAGIC = b"TCA1"
+ARCHIVE_BLOCK_ROWS = 4_096
+ARCHIVE_ZLIB_LEVEL = 6
+_HEADER = struct.Struct("<4sHII")  # magic, metric count, block count, row count
+_BLOCK = struct.Struct("<qqQII")  # first and last timestamp (us), offset, length, rows
+_BIG_ENDIAN = sys.byteorder == "big"
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# (timestamp in microseconds since the epoch, *metrics in stored hundredths)
+ArchiveRow = tuple[int, ...]
+
+# Stored integers instead of ScaledInteger floats, as written to the files
+_RAW_METRICS = tuple(type_coerce(getattr(Telemetry, name), Integer) for name in METRIC_COLUMNS)
+
+
+def to_micros(ts: datetime) -> int:
+    return (as_utc(ts) - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+def _little_endian(values: array) -> bytes:
+    if _BIG_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def encode_archive(rows: Sequence[ArchiveRow]) -> bytes:
+    """The archive file for rows sorted by timestamp."""
+    index, blocks = [], []
+    offset = _HEADER.size + _BLOCK.size * -(-len(rows) // ARCHIVE_BLOCK_ROWS)
+    for start in range(0, len(rows), ARCHIVE_BLOCK_ROWS):
+        timestamps, *metrics = zip(*rows[start : start + ARCHIVE_BLOCK_ROWS])
+        deltas = array("q", [timestamps[0]])
+        deltas.extend(b - a for a, b in zip(timestamps, timestamps[1:]))
+        body = _little_endian(deltas) + b"".join(_little_endian(array("i", column)) for column in metrics)
+        block = zlib.compress(body, ARCHIVE_ZLIB_LEVEL)
+        index.append(_BLOCK.pack(timestamps[0], timestamps[-1], offset, len(block), len(timestamps)))
+        blocks.append(block)
+        offset += len(block)
+    header = _HEADER.pack(ARCHIVE_MAGIC, len(METRIC_COLUMNS), len(blocks), len(rows))
+    return header + b"".join(index) + b"".join(blocks)
+
+
+def write_archive(path: Path, rows: Sequence[ArchiveRow]) -> None:
+    """Write the file atomically: a reader sees the previous content or the new one."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(encode_archive(rows))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_archive(path: Path, start_us: int, end_us: int) -> tuple[int, int, list[ArchiveRow]]:
+    """
+    Rows with start_us <= timestamp <= end_us, as (index of the first returned row in the file,
+    rows in the file, rows). Only blocks overlapping the range are decompressed.
+    """
+    with (
+        path.open("rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        memoryview(mm) as view,
+    ):
+        magic, metric_count, block_count, total = _HEADER.unpack_from(view, 0)
+        if magic != ARCHIVE_MAGIC or metric_count != len(METRIC_COLUMNS):
+            raise ValueError(f"Not a telemetry archive: {path}")
+        first_index, rows, position = None, [], 0
+        for block in range(block_count):
+            entry = _HEADER.size + _BLOCK.size * block
+            first_us, last_us, offset, length, count = _BLOCK.unpack_from(view, entry)
+            if last_us < start_us or first_us > end_us:
+                position += count
+                continue
+            body = zlib.decompress(view[offset : offset + length])
+            timestamps = list(accumulate(_from_little_endian("q", body[: 8 * count])))
+            columns = [
+                _from_little_endian("i", body[8 * count + 4 * count * i : 8 * count + 4 * count * (i + 1)])
+                for i in range(metric_count)
+            ]
+            lo, hi = bisect_left(timestamps, start_us), bisect_right(timestamps, end_us)
+            if first_index is None:
+                first_index = position + lo
+            rows.extend(zip(timestamps[lo:hi], *(column[lo:hi] for column in columns)))
+            position += count
+    return (first_index if first_index is not None else 0), total, rows
+
+
+def archive_path(device_id: str, month: datetime, generation: int) -> Path:
+    """File of a device-month relative to ARCHIVE_DIR; each rewrite is a new generation."""
+    return Path(device_id) / f"{month:%Y-%m}.{generation}.tca"
+
+
+async def archive_files(
+    session: AsyncSession, device_id: str, start_time: datetime, end_time: datetime
+) -> list[tuple[datetime, Path]]:
+    """
+    (month start, file) of the device's archived months overlapping the range, by month; none
+    when ARCHIVE_DIR is unset.
+    """
+    archive_dir = database.get_settings().archive_dir
+    if not archive_dir:
+        return []
+    stmt = (
+        select(TelemetryArchive.month_start, TelemetryArchive.path)
+        .where(
+            TelemetryArchive.device_id == device_id,
+            TelemetryArchive.month_start >= month_start(as_utc(start_time)),
+            TelemetryArchive.month_start <= end_time,
+        )
+        .order_by(TelemetryArchive.month_start)
+    )
+    return [(as_utc(month), Path(archive_dir) / path) for month, path in (await session.execute(stmt)).all()]
+
+
+async def read_archived(
+    session: AsyncSession,
+    device_id: str,
+    start_time: datetime,
+    end_time: datetime,
+    after: tuple[datetime, int] | None = None,
+) -> list[tuple]:
+    """
+    Archived samples of the device in [start_time, end_time] (after the keyset position after)
+    as (timestamp, *metrics, id) tuples like the metrics query. Archived rows have no telemetry
+    id: each gets a negative one from its position in the file, so (timestamp, id) keeps them
+    unique and ordered for cursors, ahead of live rows with the same timestamp.
+    """
+    rows = []
+    start_us, end_us = to_micros(start_time), to_micros(end_time)
+    for _month, path in await archive_files(session, device_id, start_time, end_time):
+        first, total, archived = await asyncio.to_thread(read_archive, path, start_us, end_us)
+        for i, (ts, *metrics) in enumerate(archived, start=first - total):
+            rows.append((from_micros(ts), *(value / METRIC_SCALE for value in metrics), i))
+    if after is not None:
+        key = (as_utc(after[0]), after[1])
+        rows = [row for row in rows if (row[0], row[-1]) > key]
+    return rows
+
+
+async def archived_buckets(
+    session: AsyncSession, device_id: str, start_time: datetime, end_time: datetime, resolution: int
+) -> dict[datetime, tuple[int, list[float], list[float], list[float]]]:
+    """Epoch-aligned buckets of archived samples: start -> (count, mins, maxs, sums) per metric."""
+    stats: dict[int, tuple[list[int], list[int], list[int], list[int]]] = {}
+    width = resolution * 1_000_000
+    start_us, end_us = to_micros(start_time), to_micros(end_time)
+    for _month, path in await archive_files(session, device_id, start_time, end_time):
+        _first, _total, rows = await asyncio.to_thread(read_archive, path, start_us, end_us)
+        for ts, *metrics in rows:
+            entry = stats.get(ts - ts % width)
+            if entry is None:
+                stats[ts - ts % width] = ([1], list(metrics), list(metrics), list(metrics))
+                continue
+            entry[0][0] += 1
+            for i, value in enumerate(metrics):
+                entry[1][i] = min(entry[1][i], value)
+                entry[2][i] = max(entry[2][i], value)
+                entry[3][i] += value
+    return {
+        from_micros(start): (count[0], *([v / METRIC_SCALE for v in values] for values in (mins, maxs, sums)))
+        for start, (count, mins, maxs, sums) in stats.items()
+    }
+
+
+async def merge_chunks(
+    archived: Sequence[Sequence[Any]],
+    chunks: AsyncIterator[Sequence[Sequence[Any]]],
+    key: Callable[[Sequence[Any]], Any],
+    chunk_rows: int,
+) -> AsyncIterator[Sequence[Sequence[Any]]]:
+    """Merge sorted archived rows into a stream of sorted row chunks, keeping it sorted by key."""
+    i = 0
+    async for chunk in chunks:
+        if i < len(archived) and chunk:
+            j = bisect_right(archived, key(chunk[-1]), lo=i, key=key)
+            chunk = list(heapq.merge(archived[i:j], chunk, key=key))
+            i = j
+        yield chunk
+    for start in range(i, len(archived), chunk_rows):
+        yield archived[start : start + chunk_rows]
+
+
+async def archive_device_month(
+    session_factory: async_sessionmaker[AsyncSession], device_id: str, month: datetime
+) -> int:
+    """
+    Move the device's telemetry rows of the month starting at month into its archive file
+    (rewritten with the rows already archived, if any) and return how many were moved. The
+    file is written before the rows are deleted and the manifest updated in one transaction.
+    A crash in between leaves an unreferenced file that the next run overwrites. The previous
+    generation stays on disk for remove_superseded().
+    """
+    archive_dir = Path(database.get_settings().archive_dir)
+    where = (
+        Telemetry.device_id == device_id,
+        Telemetry.timestamp >= month,
+        Telemetry.timestamp < month_start(month, 1),
+    )
+    async with session_factory() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            # The DELETE below then removes exactly the rows read here, not samples inserted meanwhile
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        stmt = select(Telemetry.timestamp, *_RAW_METRICS).where(*where).order_by(Telemetry.timestamp, Telemetry.id)
+        live = [(to_micros(ts), *metrics) for ts, *metrics in (await session.execute(stmt)).all()]
+        if not live:
+            return 0
+        current = await session.get(TelemetryArchive, (device_id, month))
+        rows: Sequence[ArchiveRow] = live
+        if current is not None:
+            _first, _total, archived = await asyncio.to_thread(
+                read_archive, archive_dir / current.path, 0, 2**63 - 1
+            )
+            rows = list(heapq.merge(archived, live, key=itemgetter(0)))
+        generation = current.generation + 1 if current is not None else 1
+        path = archive_path(device_id, month, generation)
+        await asyncio.to_thread(write_archive, archive_dir / path, rows)
+        await session.execute(delete(Telemetry).where(*where))
+        if current is None:
+            current = TelemetryArchive(device_id=device_id, month_start=month)
+            session.add(current)
+        current.generation = generation
+        current.path = str(path)
+        current.row_count = len(rows)
+        current.archived_at = datetime.now(timezone.utc)
+        await session.commit()
+    return len(live)
+
+
+async def remove_superseded(session_factory: async_sessionmaker[AsyncSession], before: datetime) -> int:
+    """
+    Delete the files of archive generations replaced before `before` and return how many. A
+    rewritten month keeps its previous file for a while: requests (or read replicas behind on
+    telemetry_archives) that looked it up may still be reading it.
+    """
+    archive_dir = Path(database.get_settings().archive_dir)
+    async with session_factory() as session:
+        stmt = select(
+            TelemetryArchive.device_id, TelemetryArchive.month_start, TelemetryArchive.generation
+        ).where(TelemetryArchive.generation > 1, TelemetryArchive.archived_at < before)
+        entries = (await session.execute(stmt)).all()
+    removed = 0
+    for device_id, month, generation in entries:
+        for path in (archive_dir / device_id).glob(f"{as_utc(month):%Y-%m}.*.tca"):
+            old = path.name.split(".")[1]
+            if old.isdigit() and int(old) < generation:
+                path.unlink(missing_ok=True)
+                removed += 1
+    return removed
+
+
+async def archive_month(session_factory: async_sessionmaker[AsyncSession], month: datetime) -> int:
+    """Archive every device with samples in the month (from the daily rollups); returns rows moved."""
+    async with session_factory() as session:
+        stmt = (
+            select(TelemetryDaily.device_id)
+            .where(TelemetryDaily.bucket_start >= month, TelemetryDaily.bucket_start < month_start(month, 1))
+            .distinct()
+            .order_by(TelemetryDaily.device_id)
+        )
+        device_ids = (await session.execute(stmt)).scalars().all()
+    moved = 0
+    for device_id in device_ids:
+        moved += await archive_device_month(session_factory, device_id, month)
+    if moved:
+        logger.info(
+            "Archived %s telemetry rows of %s (%s devices)", moved, month.strftime("%Y-%m"), len(device_ids)
+        )
+    return moved
+
+
+async def archive_closed_months(
+    session_factory: async_sessionmaker[AsyncSession], now: datetime | None = None
+) -> int:
+    """
+    Archive the months older than ARCHIVE_AFTER_MONTHS full months before the current one, from
+    the newest month already archived (which a crash may have left partial) or the oldest rollup.
+    Returns rows moved. Samples arriving later for months before that stay in telemetry (reads
+    still merge them) until python -m archive --month re-sweeps the month. Files superseded more
+    than ARCHIVE_RETAIN_SECONDS ago are deleted.
+    """
+    settings = database.get_settings()
+    retained = datetime.now(timezone.utc) - timedelta(seconds=settings.archive_retain_seconds)
+    if removed := await remove_superseded(session_factory, retained):
+        logger.info("Removed %s superseded archive files", removed)
+    cutoff = month_start(now or datetime.now(timezone.utc), -settings.archive_after_months)
+    async with session_factory() as session:
+        first = (await session.execute(select(func.max(TelemetryArchive.month_start)))).scalar()
+        if first is None:
+            first = (await session.execute(select(func.min(TelemetryDaily.bucket_start)))).scalar()
+    if first is None:
+        return 0
+    moved = 0
+    month = month_start(as_utc(first))
+    while month < cutoff:
+        moved += await archive_month(session_factory, month)
+        month = month_start(month, 1)
+    return moved
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout,
+    )
+    parser = argparse.ArgumentParser(description="Move closed months of telemetry into the cold archive")
+    parser.add_argument("--once", action="store_true", help="Run one pass and exit")
+    parser.add_argument(
+        "--month",
+        type=lambda value: datetime.strptime(value, "%Y-%m").replace(tzinfo=timezone.utc),
+        help="Archive (or re-sweep for late samples) only this month, YYYY-MM, and exit",
+    )
+    args = parser.parse_args()
+    if not database.get_settings().archive_dir:
+        parser.error("ARCHIVE_DIR is not set")
+    asyncio.run(_run(args.once, args.month))
+
+
+async def _run(once: bool, month: datetime | None) -> None:
+    database.init_db()
+    interval = database.get_settings().archive_interval_seconds
+    try:
+        if month is not None:
+            await archive_month(database.async_session_factory, month)
+            return
+        while True:
+            try:
+                await archive_closed_months(database.async_session_factory)
+            except Exception as e:
+                logger.exception("Error during archiving: %s", e)
+            if once:
+                return
+            await asyncio.sleep(interval)
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
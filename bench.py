@@ -0,0 +1,331 @@
+"""
+Benchmark harness: seeds a synthetic fleet (N devices x M days at 30 s cadence) and measures
+POST /telemetry, POST /telemetry/batch, the metrics and summary endpoints and the worker's
+offline check at a given concurrency. Prints one JSON document (throughput, p50/p95/p99 latency
+per scenario, plus the commit and settings) to compare between commits.
+The API runs in process (httpx ASGI transport) unless --base-url points at a running server;
+seeding and the offline check always go straight to the database.
+Run: python -m bench [--database-url URL] [--devices N] [--days M] [--concurrency C] [--output FILE]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from ingest import insert_telemetry, latest_rows, upsert_device_snapshots, upsert_devices, upsert_rollups
+from models import Device
+from worker import check_offline_devices
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL_SECONDS = 30
+SEED_CHUNK_ROWS = 10_000
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///bench.sqlite"
+# Fleet starts here so runs are reproducible; samples are generated with a seeded RNG
+FLEET_START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+SCENARIOS = ("ingest", "ingest_batch", "metrics", "summary", "offline")
+BATCH_ITEMS = 100
+
+
+@dataclass
+class ScenarioResult:
+    requests: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    throughput_per_second: float = 0.0
+    latency_ms: dict[str, float] = field(default_factory=dict)
+    status_codes: dict[str, int] = field(default_factory=dict)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list[float], statuses: list[int], seconds: float) -> ScenarioResult:
+    """ScenarioResult from per-call latencies (seconds) and status codes; 2xx counts as success."""
+    ordered = sorted(latencies)
+    ms = [value * 1_000 for value in ordered]
+    return ScenarioResult(
+        requests=len(ordered),
+        errors=sum(1 for code in statuses if not 200 <= code < 300),
+        seconds=round(seconds, 3),
+        throughput_per_second=round(len(ordered) / seconds, 1) if seconds > 0 else 0.0,
+        latency_ms={
+            "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+            "p50": round(percentile(ms, 50), 3),
+            "p95": round(percentile(ms, 95), 3),
+            "p99": round(percentile(ms, 99), 3),
+            "max": round(ms[-1], 3) if ms else 0.0,
+        },
+        status_codes={str(code): count for code, count in sorted(Counter(statuses).items())},
+    )
+
+
+async def drive(calls: int, concurrency: int, call: Callable[[int], Awaitable[int]]) -> ScenarioResult:
+    """Run call(0) .. call(calls - 1) with at most concurrency in flight; call returns a status code."""
+    latencies: list[float] = []
+    statuses: list[int] = []
+    next_index = 0
+
+    async def runner() -> None:
+        nonlocal next_index
+        while next_index < calls:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                code = await call(index)
+            except Exception as exc:
+                logger.debug("Call %s failed: %s", index, exc)
+                code = 599
+            latencies.append(time.perf_counter() - start)
+            statuses.append(code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(runner() for _ in range(max(1, min(concurrency, calls)))))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def device_ids(devices: int) -> list[str]:
+    return [f"bench-{i:05d}" for i in range(devices)]
+
+
+def sample_metrics(rng: random.Random) -> dict[str, float]:
+    return {
+        "soc_percent": round(rng.uniform(5, 100), 2),
+        "voltage_v": round(rng.uniform(320, 420), 2),
+        "current_a": round(rng.uniform(-100, 100), 2),
+        "temp_c": round(rng.uniform(0, 45), 2),
+    }
+
+
+async def seed_fleet(
+    session_factory: async_sessionmaker[AsyncSession], devices: int, days: int, seed: int = 0
+) -> dict[str, float]:
+    """Insert devices x days of 30 s samples (and their rollups) from FLEET_START; returns rows and timing."""
+    rng = random.Random(seed)
+    ids = device_ids(devices)
+    per_device = days * 86_400 // SAMPLE_INTERVAL_SECONDS
+    started = time.perf_counter()
+    async with session_factory() as session:
+        await upsert_devices(session, {device_id: fleet_end(days) for device_id in ids})
+        await session.commit()
+    rows: list[dict[str, Any]] = []
+    total = 0
+    for step in range(per_device):
+        ts = FLEET_START + timedelta(seconds=step * SAMPLE_INTERVAL_SECONDS)
+        rows.extend({"device_id": device_id, "timestamp": ts, **sample_metrics(rng)} for device_id in ids)
+        if len(rows) >= SEED_CHUNK_ROWS or step == per_device - 1:
+            async with session_factory() as session:
+                await insert_telemetry(session, rows)
+                await upsert_rollups(session, rows)
+                if step == per_device - 1:
+                    await upsert_device_snapshots(session, latest_rows(rows))
+                await session.commit()
+            total += len(rows)
+            rows = []
+    seconds = time.perf_counter() - started
+    return {
+        "rows": total,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(total / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def fleet_end(days: int) -> datetime:
+    """Timestamp of the last seeded sample."""
+    return FLEET_START + timedelta(days=days, seconds=-SAMPLE_INTERVAL_SECONDS)
+
+
+def http_calls(
+    client, scenario: str, ids: list[str], days: int, seed: int = 0
+) -> Callable[[int], Awaitable[int]]:
+    """Per-index request of an HTTP scenario on an httpx.AsyncClient; returns the status code."""
+    rng = random.Random(seed)
+    # New samples continue after the seeded range, one per device per call round; batches use
+    # their own timeline a day later so the two ingest scenarios do not write the same samples
+    live_start = fleet_end(days) + timedelta(seconds=SAMPLE_INTERVAL_SECONDS)
+    if scenario == "ingest_batch":
+        live_start += timedelta(days=1)
+
+    def live_sample(index: int) -> dict[str, Any]:
+        device_id = ids[index % len(ids)]
+        ts = live_start + timedelta(seconds=(index // len(ids)) * SAMPLE_INTERVAL_SECONDS)
+        return {"device_id": device_id, "timestamp": ts.isoformat(), "metrics": sample_metrics(rng)}
+
+    async def ingest(index: int) -> int:
+        return (await client.post("/telemetry", json=live_sample(index))).status_code
+
+    async def ingest_batch(index: int) -> int:
+        items = [live_sample(index * BATCH_ITEMS + offset) for offset in range(BATCH_ITEMS)]
+        return (await client.post("/telemetry/batch", json=items)).status_code
+
+    async def metrics(index: int) -> int:
+        day = FLEET_START + timedelta(days=rng.randrange(days))
+        params = {"start_time": day.isoformat(), "end_time": (day + timedelta(days=1)).isoformat()}
+        return (await client.get(f"/devices/{rng.choice(ids)}/metrics", params=params)).status_code
+
+    async def summary(index: int) -> int:
+        day = (FLEET_START + timedelta(days=rng.randrange(days))).date().isoformat()
+        return (await client.get(f"/devices/{rng.choice(ids)}/summary", params={"date": day})).status_code
+
+    return {"ingest": ingest, "ingest_batch": ingest_batch, "metrics": metrics, "summary": summary}[scenario]
+
+
+async def bench_offline(
+    session_factory: async_sessionmaker[AsyncSession], days: int, runs: int
+) -> ScenarioResult:
+    """
+    Time check_offline_devices with the whole fleet stale: each run first sets every device back
+    online (untimed), so each pass flips and alerts every device.
+    """
+    now = fleet_end(days) + timedelta(hours=1)
+    latencies: list[float] = []
+    statuses: list[int] = []
+    for _ in range(runs):
+        async with session_factory() as session:
+            await session.execute(update(Device).values(status="online"))
+            await session.commit()
+        start = time.perf_counter()
+        await check_offline_devices(session_factory, now=now)
+        latencies.append(time.perf_counter() - start)
+        statuses.append(200)
+    return summarize(latencies, statuses, sum(latencies))
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_bench(args: argparse.Namespace) -> dict[str, Any]:
+    import httpx
+
+    database.init_db()
+    session_factory = database.async_session_factory
+    ids = device_ids(args.devices)
+    report: dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "dialect": database.engine.dialect.name,
+            "target": args.base_url or "in-process",
+            "devices": args.devices,
+            "days": args.days,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "seed": None,
+        "scenarios": {},
+    }
+    try:
+        if not args.skip_seed:
+            await database.create_tables()
+            report["seed"] = await seed_fleet(session_factory, args.devices, args.days, args.seed)
+            logger.info("Seeded %s rows", report["seed"]["rows"])
+        scenarios = [name for name in args.scenarios.split(",") if name]
+        http_scenarios = [name for name in scenarios if name != "offline"]
+        if http_scenarios:
+            if args.base_url:
+                client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+                lifespan = None
+            else:
+                from main import app
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+                lifespan = app.router.lifespan_context(app)
+            async with client:
+                if lifespan is not None:
+                    await lifespan.__aenter__()
+                try:
+                    for name in http_scenarios:
+                        calls = args.requests // BATCH_ITEMS if name == "ingest_batch" else args.requests
+                        result = await drive(
+                            max(1, calls), args.concurrency, http_calls(client, name, ids, args.days, args.seed)
+                        )
+                        report["scenarios"][name] = asdict(result)
+                        logger.info("%s: %s", name, result)
+                finally:
+                    if lifespan is not None:
+                        await lifespan.__aexit__(None, None, None)
+        if "offline" in scenarios:
+            result = await bench_offline(session_factory, args.days, args.offline_runs)
+            report["scenarios"]["offline"] = asdict(result)
+            logger.info("offline: %s", result)
+    finally:
+        await database.engine.dispose()
+        await database.query_engine.dispose()
+    return report
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr,
+    )
+    parser = argparse.ArgumentParser(description="Seed a synthetic fleet and benchmark the API and worker")
+    parser.add_argument(
+        "--database-url", help=f"Database to seed and query (default: DATABASE_URL or {DEFAULT_DATABASE_URL})"
+    )
+    parser.add_argument("--base-url", help="Benchmark a running API (e.g. http://127.0.0.1:8000) instead of in process")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2_000, help="Calls per HTTP scenario (batch: / 100)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--offline-runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed for samples and request mix")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse an already seeded database")
+    parser.add_argument(
+        "--rate-limit", action="store_true", help="Keep the per-device rate limit (in process; off by default)"
+    )
+    parser.add_argument("--output", type=Path, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS) - {""}
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    # Settings are read on first use, so the environment decides what the in-process API sees
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.setdefault("DATABASE_URL", DEFAULT_DATABASE_URL)
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_REQUESTS"] = str(2**31 - 1)
+    report = asyncio.run(run_bench(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Read-through caches for the query endpoints: device existence (primed by ingestion) and daily
+summaries of closed days. Each cache is an in-process TTL + LRU map in front of an optional
+shared backend (Redis, CACHE_BACKEND=redis) so replicas reuse each other's work.
+"""
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from typing import Generic, Protocol, TypeVar
+
+from metrics import CACHE_ENTRIES, CACHE_EVICTIONS, CACHE_REQUESTS
+from redis_client import REDIS_ERRORS, RedisPool
+from schemas import DailySummaryResponse
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+REDIS_KEY_PREFIX = "cache"
+# A day's summary is cached once the day ended this long ago; later samples for it invalidate it
+SUMMARY_CLOSED_AFTER = timedelta(hours=1)
+
+
+class LocalCache(Generic[V]):
+    """Bounded in-process map: entries expire after their TTL and the least recently used go first."""
+
+    __slots__ = ("name", "_max_entries", "_ttl", "_entries")
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            CACHE_ENTRIES.labels(self.name).set(len(self._entries))
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: V) -> None:
+        if self._max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        if evicted:
+            CACHE_EVICTIONS.labels(self.name).inc(evicted)
+        CACHE_ENTRIES.labels(self.name).set(len(self._entries))
+
+    def delete(self, key: str) -> None:
+        if self._entries.pop(key, None) is not None:
+            CACHE_ENTRIES.labels(self.name).set(len(self._entries))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        CACHE_ENTRIES.labels(self.name).set(0)
+
+
+class SharedCacheBackend(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None: ...
+
+    async def delete(self, *keys: str) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class RedisCacheBackend:
+    """Shared cache entries in Redis. Errors count as misses (reads) or are ignored (writes), and logged."""
+
+    def __init__(self, url: str, pool_size: int = 4, timeout_seconds: float = 0.5):
+        self._pool = RedisPool(url, pool_size, timeout_seconds)
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            (value,) = await self._pool.execute([("GET", key)])
+            return value
+        except REDIS_ERRORS as exc:
+            logger.warning("Cache: Redis GET failed: %s", exc)
+            return None
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        try:
+            await self._pool.execute([("SET", key, value, "PX", max(1, int(ttl_seconds * 1_000)))])
+        except REDIS_ERRORS as exc:
+            logger.warning("Cache: Redis SET failed: %s", exc)
+
+    async def delete(self, *keys: str) -> None:
+        try:
+            await self._pool.execute([("DEL", *keys)])
+        except REDIS_ERRORS as exc:
+            logger.warning("Cache: Redis DEL failed: %s", exc)
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+
+class ReadThroughCache(Generic[V]):
+    """
+    LocalCache in front of an optional shared backend: get() tries this process first, then the
+    backend (and keeps what it finds locally); set() and invalidate() go to both.
+    """
+
+    def __init__(
+        self,
+        local: LocalCache[V],
+        shared: SharedCacheBackend | None = None,
+        encode: Callable[[V], bytes] | None = None,
+        decode: Callable[[bytes], V] | None = None,
+        ttl_seconds: float = 300.0,
+    ):
+        self.local = local
+        self._shared = shared
+        self._encode = encode
+        self._decode = decode
+        self._ttl = ttl_seconds
+
+    def _shared_key(self, key: str) -> str:
+        return f"{REDIS_KEY_PREFIX}:{self.local.name}:{key}"
+
+    async def get(self, key: str) -> V | None:
+        value = self.local.get(key)
+        if value is not None:
+            CACHE_REQUESTS.labels(self.local.name, "hit").inc()
+            return value
+        if self._shared is not None:
+            raw = await self._shared.get(self._shared_key(key))
+            if raw is not None:
+                value = self._decode(raw)
+                self.local.set(key, value)
+                CACHE_REQUESTS.labels(self.local.name, "shared_hit").inc()
+                return value
+        CACHE_REQUESTS.labels(self.local.name, "miss").inc()
+        return None
+
+    async def set(self, key: str, value: V) -> None:
+        self.local.set(key, value)
+        if self._shared is not None:
+            await self._shared.set(self._shared_key(key), self._encode(value), self._ttl)
+
+    async def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self.local.delete(key)
+        if self._shared is not None and keys:
+            await self._shared.delete(*(self._shared_key(key) for key in keys))
+
+
+def summary_key(device_id: str, day: str) -> str:
+    return f"{device_id}:{day}"
+
+
+def summary_is_closed(day_start: datetime, now: datetime | None = None) -> bool:
+    """Whether the summary of the UTC day starting at day_start no longer changes (normally)."""
+    now = now or datetime.now(timezone.utc)
+    return day_start + timedelta(days=1) + SUMMARY_CLOSED_AFTER <= now
+
+
+_device_cache: ReadThroughCache[bool] | None = None
+_summary_cache: ReadThroughCache[DailySummaryResponse] | None = None
+_shared: SharedCacheBackend | None = None
+
+
+def _shared_backend() -> SharedCacheBackend | None:
+    global _shared
+    from database import get_settings
+    s = get_settings()
+    if s.cache_backend == "redis" and _shared is None:
+        _shared = RedisCacheBackend(s.redis_url, s.cache_redis_pool_size)
+    return _shared
+
+
+def get_device_cache() -> ReadThroughCache[bool]:
+    """
+    Devices known to exist. Only positive answers are cached (devices are not deleted by the API),
+    so a device's first sample is visible on the next read.
+    """
+    global _device_cache
+    if _device_cache is None:
+        from database import get_settings
+        s = get_settings()
+        _device_cache = ReadThroughCache(
+            LocalCache("device", s.cache_max_entries, s.cache_device_ttl_seconds),
+            _shared_backend(),
+            encode=lambda _value: b"1",
+            decode=lambda _raw: True,
+            ttl_seconds=s.cache_device_ttl_seconds,
+        )
+    return _device_cache
+
+
+def get_summary_cache() -> ReadThroughCache[DailySummaryResponse]:
+    """DailySummaryResponse objects of closed days, keyed by summary_key()."""
+    global _summary_cache
+    if _summary_cache is None:
+        from database import get_settings
+        s = get_settings()
+        _summary_cache = ReadThroughCache(
+            LocalCache("summary", s.cache_max_entries, s.cache_summary_ttl_seconds),
+            _shared_backend(),
+            encode=lambda value: value.model_dump_json().encode(),
+            decode=DailySummaryResponse.model_validate_json,
+            ttl_seconds=s.cache_summary_ttl_seconds,
+        )
+    return _summary_cache
+
+
+async def close_caches() -> None:
+    global _device_cache, _summary_cache, _shared
+    for cache in (_device_cache, _summary_cache):
+        if cache is not None:
+            cache.local.clear()
+    if _shared is not None:
+        await _shared.close()
+    _device_cache = _summary_cache = _shared = None
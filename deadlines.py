@@ -0,0 +1,98 @@
+"""
+Per-device offline deadlines for the event-driven worker mode: a min-heap of last_seen + threshold
+with lazy deletion, and the PostgreSQL LISTEN channel that feeds it last_seen updates
+(migrations/005_device_last_seen_notify.sql).
+"""
+import heapq
+import json
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+LAST_SEEN_CHANNEL = "device_last_seen"
+
+
+class DeadlineHeap:
+    """
+    Deadline per key; update and pop are O(log n). Superseded heap entries are skipped when they
+    surface and the heap is rebuilt once they outnumber the live ones, so size stays O(live keys).
+    """
+
+    __slots__ = ("_deadlines", "_heap")
+
+    def __init__(self) -> None:
+        self._deadlines: dict[str, datetime] = {}
+        self._heap: list[tuple[datetime, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def get(self, key: str) -> datetime | None:
+        return self._deadlines.get(key)
+
+    def push(self, key: str, deadline: datetime) -> bool:
+        """Set key's deadline if it is later than the current one (or new); returns whether it changed."""
+        current = self._deadlines.get(key)
+        if current is not None and deadline <= current:
+            return False
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._deadlines) + 1_024:
+            self._heap = [(d, k) for k, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def discard(self, key: str) -> None:
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self) -> datetime | None:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime, limit: int) -> list[tuple[str, datetime]]:
+        """Remove and return up to limit (key, deadline) pairs due at or before now, earliest first."""
+        due = []
+        while len(due) < limit:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            deadline, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append((key, deadline))
+        return due
+
+    def _drop_stale(self) -> None:
+        heap, deadlines = self._heap, self._deadlines
+        while heap and deadlines.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+
+def parse_last_seen_payload(payload: str) -> tuple[str, datetime]:
+    """(device_id, last_seen) from a device_last_seen notification payload."""
+    data = json.loads(payload)
+    last_seen = datetime.fromisoformat(data["last_seen"])
+    if last_seen.tzinfo is None:
+        last_seen = last_seen.replace(tzinfo=timezone.utc)
+    return data["device_id"], last_seen
+
+
+async def listen_last_seen(conn: AsyncConnection, callback: Callable[[str, datetime], None]):
+    """
+    LISTEN on the device_last_seen channel with the asyncpg connection behind conn and call
+    callback(device_id, last_seen) per notification. Returns the driver connection, whose
+    is_closed() tells the caller when the channel was lost.
+    """
+    raw = (await conn.get_raw_connection()).driver_connection
+
+    def on_notify(_conn, _pid, _channel, payload: str) -> None:
+        callback(*parse_last_seen_payload(payload))
+
+    await raw.add_listener(LAST_SEEN_CHANNEL, on_notify)
+    return raw
+
+
+def deadline_for(last_seen: datetime, threshold: timedelta) -> datetime:
+    if last_seen.tzinfo is None:
+        last_seen = last_seen.replace(tzinfo=timezone.utc)
+    return last_seen + threshold
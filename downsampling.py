@@ -0,0 +1,68 @@
+"""Downsampling for metrics queries: SQL time buckets and largest-triangle-three-buckets (LTTB)."""
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Integer, cast, func, literal_column
+from sqlalchemy.sql.elements import ColumnElement
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def bucket_expression(dialect: str, column: ColumnElement, resolution_seconds: int) -> ColumnElement:
+    """
+    Start of the resolution-wide bucket containing column, aligned to the Unix epoch.
+    PostgreSQL uses date_bin (14+); SQLite floors the epoch seconds (bucket_start converts back).
+    The width is rendered inline, not bound, so the same expression can appear in GROUP BY.
+    """
+    seconds = int(resolution_seconds)
+    if dialect == "postgresql":
+        return func.date_bin(
+            literal_column(f"interval '{seconds} seconds'"),
+            column,
+            literal_column("timestamptz '1970-01-01 00:00:00+00'"),
+        )
+    epoch_seconds = cast(func.strftime("%s", column), Integer)
+    return epoch_seconds - epoch_seconds % literal_column(str(seconds))
+
+
+def bucket_start(value: datetime | int) -> datetime:
+    """Normalise a bucket_expression value to an aware datetime."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    return EPOCH + timedelta(seconds=value)
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], threshold: int) -> list[int]:
+    """
+    Indices of the points kept by largest-triangle-three-buckets: first and last point plus,
+    for each of threshold - 2 buckets, the point forming the largest triangle with the previously
+    kept point and the average of the next bucket. Single linear pass over the input.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(x[avg_start:avg_end]) / span
+        avg_y = sum(y[avg_start:avg_end]) / span
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = x[a], y[a]
+        dx, dy = ax - avg_x, avg_y - ay
+        max_area = -1.0
+        next_a = range_start
+        for j in range(range_start, range_end):
+            area = abs(dx * (y[j] - ay) - (ax - x[j]) * dy)
+            if area > max_area:
+                max_area = area
+                next_a = j
+        kept.append(next_a)
+        a = next_a
+    kept.append(n - 1)
+    return kept
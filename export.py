@@ -0,0 +1,237 @@
+"""
+Columnar telemetry export for analytics pulls: Arrow IPC stream or Parquet, written batch by
+batch as the database cursor yields chunks of rows. Metrics are read as their stored integer
+hundredths and scaled into float32 columns by Arrow compute, so no Python float or model is
+created per row. Archived months (archive.py) are read from their files and merged in.
+Served by GET /telemetry/export; the CLI writes the same bytes to a file:
+Run: python -m export --device-id ID [--device-id ID ...] --start-time T --end-time T
+         [--format parquet|arrow] --output FILE
+"""
+import argparse
+import asyncio
+import heapq
+import logging
+import sys
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from operator import itemgetter
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import Integer, Row, Select, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+from archive import ArchiveRow, archive_files, read_archive, to_micros
+from ingest import as_utc
+from metrics import METRICS_ROWS_RETURNED
+from models import METRIC_COLUMNS, METRIC_SCALE, Telemetry
+from partitions import month_start
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Rows per database chunk, Arrow record batch and Parquet row group
+EXPORT_CHUNK_ROWS = 50_000
+
+# timestamp is int64 microseconds since the epoch (UTC); device_id is dictionary-encoded
+EXPORT_SCHEMA = pa.schema(
+    [
+        pa.field("device_id", pa.dictionary(pa.int32(), pa.string()), nullable=False),
+        pa.field("timestamp", pa.timestamp("us", tz="UTC"), nullable=False),
+        *(pa.field(name, pa.float32(), nullable=False) for name in METRIC_COLUMNS),
+    ]
+)
+# Stored integers instead of ScaledInteger floats: scaled per column in record_batch()
+_EXPORT_COLUMNS = (
+    Telemetry.timestamp,
+    *(type_coerce(getattr(Telemetry, name), Integer) for name in METRIC_COLUMNS),
+)
+_SCALE = pa.scalar(METRIC_SCALE, pa.float32())
+
+
+def record_batch(device_id: str, rows: Sequence[Row | ArchiveRow]) -> pa.RecordBatch:
+    """
+    One device's (timestamp, *scaled integer metrics) rows as an EXPORT_SCHEMA batch; timestamps
+    are datetimes (database) or microseconds since the epoch (archive).
+    """
+    timestamps, *metrics = zip(*rows)
+    indices = pa.repeat(pa.scalar(0, pa.int32()), len(rows))
+    device = pa.DictionaryArray.from_arrays(indices, pa.array([device_id]))
+    columns = [device, pa.array(timestamps, pa.timestamp("us", tz="UTC"))]
+    for values in metrics:
+        columns.append(pc.divide(pa.array(values, pa.int32()).cast(pa.float32()), _SCALE))
+    return pa.RecordBatch.from_arrays(columns, schema=EXPORT_SCHEMA)
+
+
+async def export_batches(
+    session: AsyncSession,
+    device_ids: Sequence[str],
+    start_time: datetime,
+    end_time: datetime,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> AsyncIterator[pa.RecordBatch]:
+    """
+    Record batches of the devices' samples in [start_time, end_time], by device then timestamp.
+    Live rows are one streamed range seek on idx_telemetry_device_timestamp per device (per month
+    when part of the range is archived), so memory is one chunk or one archived device-month.
+    """
+    start_time, end_time = as_utc(start_time), as_utc(end_time)
+    for device_id in device_ids:
+        files = dict(await archive_files(session, device_id, start_time, end_time))
+        if not files:
+            async for batch in _live_batches(session, device_id, start_time, end_time, True, chunk_rows):
+                yield batch
+            continue
+        window = start_time
+        while window <= end_time:
+            month = month_start(window)
+            upper = month_start(month, 1)
+            last = upper > end_time
+            window_end = end_time if last else upper
+            path = files.get(month)
+            if path is None:
+                async for batch in _live_batches(session, device_id, window, window_end, last, chunk_rows):
+                    yield batch
+            else:
+                _first, _total, archived = await asyncio.to_thread(
+                    read_archive, path, to_micros(window), to_micros(end_time)
+                )
+                # Samples that arrived after the month was archived: few, merged by timestamp
+                live = (await session.execute(_live_stmt(device_id, window, window_end, last))).all()
+                rows = list(heapq.merge(archived, ((to_micros(ts), *m) for ts, *m in live), key=itemgetter(0)))
+                for start in range(0, len(rows), chunk_rows):
+                    yield record_batch(device_id, rows[start : start + chunk_rows])
+            window = upper
+
+
+def _live_stmt(device_id: str, start_time: datetime, end_time: datetime, inclusive_end: bool) -> Select:
+    return (
+        select(*_EXPORT_COLUMNS)
+        .where(
+            Telemetry.device_id == device_id,
+            Telemetry.timestamp >= start_time,
+            Telemetry.timestamp <= end_time if inclusive_end else Telemetry.timestamp < end_time,
+        )
+        .order_by(Telemetry.timestamp, Telemetry.id)
+    )
+
+
+async def _live_batches(
+    session: AsyncSession,
+    device_id: str,
+    start_time: datetime,
+    end_time: datetime,
+    inclusive_end: bool,
+    chunk_rows: int,
+) -> AsyncIterator[pa.RecordBatch]:
+    stmt = _live_stmt(device_id, start_time, end_time, inclusive_end)
+    result = await session.stream(stmt.execution_options(yield_per=chunk_rows))
+    async for rows in result.partitions():
+        yield record_batch(device_id, rows)
+
+
+class _ChunkSink:
+    """Write-only file object for the Arrow/Parquet writers; take() returns what they wrote since."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def encode_export(batches: AsyncIterator[pa.RecordBatch], fmt: str) -> AsyncIterator[bytes]:
+    """
+    The batches as an Arrow IPC stream or a zstd-compressed Parquet file (one row group per
+    batch), yielded as bytes after every batch. An export without rows is a valid empty file.
+    """
+    sink = _ChunkSink()
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+    else:
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression="zstd")
+    try:
+        async for batch in batches:
+            writer.write_batch(batch)
+            if data := sink.take():
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+async def stream_export(
+    session: AsyncSession,
+    device_ids: Sequence[str],
+    start_time: datetime,
+    end_time: datetime,
+    fmt: str,
+) -> AsyncIterator[bytes]:
+    """The export of the devices' samples in [start_time, end_time] as bytes, ready to stream."""
+    exported = 0
+
+    async def batches() -> AsyncIterator[pa.RecordBatch]:
+        nonlocal exported
+        async for batch in export_batches(session, device_ids, start_time, end_time):
+            exported += batch.num_rows
+            yield batch
+
+    async for data in encode_export(batches(), fmt):
+        yield data
+    METRICS_ROWS_RETURNED.labels(fmt).observe(exported)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout,
+    )
+    parser = argparse.ArgumentParser(description="Export telemetry of a device set as Parquet or Arrow IPC")
+    parser.add_argument("--device-id", action="append", required=True, help="Device to export (repeatable)")
+    parser.add_argument("--start-time", type=datetime.fromisoformat, required=True, help="ISO 8601")
+    parser.add_argument("--end-time", type=datetime.fromisoformat, required=True, help="ISO 8601")
+    parser.add_argument("--format", choices=sorted(EXPORT_MEDIA_TYPES), default="parquet")
+    parser.add_argument("--output", type=Path, required=True, help="File to write")
+    args = parser.parse_args()
+    asyncio.run(_run(args.device_id, args.start_time, args.end_time, args.format, args.output))
+
+
+async def _run(device_ids: list[str], start_time: datetime, end_time: datetime, fmt: str, output: Path) -> None:
+    database.init_db()
+    try:
+        session = await database.read_router.open_session()
+        try:
+            with output.open("wb") as f:
+                async for data in stream_export(session, sorted(set(device_ids)), start_time, end_time, fmt):
+                    f.write(data)
+        finally:
+            await session.close()
+    finally:
+        await database.engine.dispose()
+        await database.query_engine.dispose()
+    logger.info("Exported to %s (%s bytes)", output, output.stat().st_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""Telemetry write path: bulk telemetry inserts, dialect-aware device upserts and rollup maintenance."""
+import asyncio
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import case, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from cache import get_device_cache, get_summary_cache, summary_is_closed, summary_key
+from models import METRIC_COLUMNS, Alert, Device, Telemetry, TelemetryDaily, TelemetryHourly
+from rules import alert_values, get_rule_engine
+from schemas import BatchItemError, ErrorDetail, TelemetryCreate
+from sharding import device_shard
+
+logger = logging.getLogger(__name__)
+
+_telemetry_batch_adapter = TypeAdapter(list[TelemetryCreate])
+
+# Rows per devices upsert statement (up to 8 bind params each, under the 32,767 of asyncpg)
+UPSERT_CHUNK_ROWS = 2_000
+# Devices the last_seen coalescer remembers as written (least recently seen forgotten first)
+COALESCER_MAX_KNOWN = 100_000
+# Rollup tables maintained at ingest time and their bucket width in seconds
+ROLLUPS = ((TelemetryHourly, 3_600), (TelemetryDaily, 86_400))
+# Rows per rollup upsert statement (15 bind params each)
+ROLLUP_CHUNK_ROWS = 1_000
+
+
+def validate_telemetry_batch(
+    items: Sequence[Any],
+) -> tuple[list[tuple[int, TelemetryCreate]], list[BatchItemError]]:
+    """Validate raw items; return (index, sample) pairs for valid items and errors for the rest."""
+    try:
+        # Common case: the whole batch validates in a single pass
+        return list(enumerate(_telemetry_batch_adapter.validate_python(items))), []
+    except ValidationError as exc:
+        rejected: dict[int, BatchItemError] = {}
+        for e in exc.errors():
+            index = e["loc"][0]
+            if index not in rejected:
+                rejected[index] = BatchItemError(index=index, detail=e["msg"], errors=[])
+            rejected[index].errors.append(
+                ErrorDetail(loc=[str(p) for p in e["loc"][1:]], msg=e["msg"], type=e["type"])
+            )
+    remaining = [i for i in range(len(items)) if i not in rejected]
+    valid = list(zip(remaining, _telemetry_batch_adapter.validate_python([items[i] for i in remaining])))
+    return valid, sorted(rejected.values(), key=lambda r: r.index)
+
+
+def telemetry_values(item: TelemetryCreate) -> dict[str, Any]:
+    """Column values for one telemetry row."""
+    return {
+        "device_id": item.device_id,
+        "timestamp": item.timestamp,
+        "soc_percent": item.metrics.soc_percent,
+        "voltage_v": item.metrics.voltage_v,
+        "current_a": item.metrics.current_a,
+        "temp_c": item.metrics.temp_c,
+    }
+
+
+def as_utc(ts: datetime) -> datetime:
+    """Treat naive timestamps as UTC so samples can be compared and bucketed."""
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+def bucket_floor(ts: datetime, seconds: int) -> datetime:
+    """Start of the epoch-aligned bucket of the given width containing ts (UTC)."""
+    epoch = int(as_utc(ts).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+
+def _dialect_insert(session: AsyncSession):
+    """(insert, greatest, least) constructs for ON CONFLICT upserts on the session's dialect."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert, func.greatest, func.least
+    if dialect == "sqlite":
+        # SQLite's multi-argument max()/min() are the scalar GREATEST/LEAST
+        return sqlite.insert, func.max, func.min
+    raise NotImplementedError(f"Upsert not supported for dialect {dialect!r}")
+
+
+async def upsert_devices(
+    session: AsyncSession,
+    last_seen: Mapping[str, datetime],
+    readings: Mapping[str, Mapping[str, Any]] | None = None,
+    offline_before: datetime | None = None,
+) -> None:
+    """
+    INSERT ... ON CONFLICT DO UPDATE one devices row per device_id. last_seen only moves
+    forward, so late or concurrent samples never rewind it and first-ever samples cannot race.
+    Only a newer sample sets status back to online, so a late sample cannot revive an offline device.
+    readings (the metrics of the sample at last_seen, for every device) update the metric snapshot
+    under the same condition, with ties going to the latest write. Devices whose last_seen is older
+    than offline_before (historical backfills) are written offline instead, so nothing alerts on them.
+    """
+    if not last_seen:
+        return
+    dialect_insert, greatest, _least = _dialect_insert(session)
+    # Sorted so concurrent batches lock device rows in the same order
+    device_ids = sorted(last_seen)
+    for start in range(0, len(device_ids), UPSERT_CHUNK_ROWS):
+        values = []
+        for device_id in device_ids[start:start + UPSERT_CHUNK_ROWS]:
+            seen = last_seen[device_id]
+            stale = offline_before is not None and as_utc(seen) < offline_before
+            value = {
+                "device_id": device_id,
+                "last_seen": seen,
+                "status": "offline" if stale else "online",
+                "shard": device_shard(device_id),
+            }
+            if readings is not None:
+                metrics = readings[device_id]
+                for name in METRIC_COLUMNS:
+                    value[name] = metrics[name]
+            values.append(value)
+        stmt = dialect_insert(Device).values(values)
+        excluded = stmt.excluded
+        set_ = {
+            "last_seen": greatest(Device.last_seen, excluded.last_seen),
+            "status": case((excluded.last_seen > Device.last_seen, excluded.status), else_=Device.status),
+        }
+        if readings is not None:
+            for name in METRIC_COLUMNS:
+                set_[name] = case(
+                    (excluded.last_seen >= Device.last_seen, excluded[name]), else_=getattr(Device, name)
+                )
+        stmt = stmt.on_conflict_do_update(index_elements=[Device.device_id], set_=set_)
+        await session.execute(stmt)
+
+
+def latest_rows(rows: Sequence[Mapping[str, Any]]) -> dict[str, Mapping[str, Any]]:
+    """Newest telemetry row per device (the first one wins timestamp ties)."""
+    latest: dict[str, Mapping[str, Any]] = {}
+    for row in rows:
+        current = latest.get(row["device_id"])
+        if current is None or as_utc(row["timestamp"]) > as_utc(current["timestamp"]):
+            latest[row["device_id"]] = row
+    return latest
+
+
+async def upsert_device_snapshots(
+    session: AsyncSession,
+    latest: Mapping[str, Mapping[str, Any]],
+    offline_before: datetime | None = None,
+) -> None:
+    """upsert_devices from the newest telemetry row per device: last_seen plus the metric snapshot."""
+    last_seen = {device_id: row["timestamp"] for device_id, row in latest.items()}
+    await upsert_devices(session, last_seen, latest, offline_before)
+
+
+async def insert_telemetry(session: AsyncSession, rows: Sequence[Mapping[str, Any]]) -> None:
+    """Insert telemetry rows; SQLAlchemy batches them into multi-row INSERT ... VALUES."""
+    if not rows:
+        return
+    await session.execute(insert(Telemetry), list(rows))
+
+
+def rollup_values(rows: Sequence[Mapping[str, Any]], seconds: int) -> list[dict[str, Any]]:
+    """Aggregate telemetry rows into one rollup row per (device_id, bucket), sorted by key."""
+    acc: dict[tuple[str, datetime], dict[str, Any]] = {}
+    for row in rows:
+        key = (row["device_id"], bucket_floor(row["timestamp"], seconds))
+        agg = acc.get(key)
+        if agg is None:
+            agg = {"device_id": key[0], "bucket_start": key[1], "sample_count": 1}
+            for name in METRIC_COLUMNS:
+                value = row[name]
+                agg[f"{name}_sum"] = agg[f"{name}_min"] = agg[f"{name}_max"] = value
+            acc[key] = agg
+            continue
+        agg["sample_count"] += 1
+        for name in METRIC_COLUMNS:
+            value = row[name]
+            agg[f"{name}_sum"] += value
+            if value < agg[f"{name}_min"]:
+                agg[f"{name}_min"] = value
+            if value > agg[f"{name}_max"]:
+                agg[f"{name}_max"] = value
+    return [acc[key] for key in sorted(acc)]
+
+
+async def upsert_rollups(session: AsyncSession, rows: Sequence[Mapping[str, Any]]) -> None:
+    """
+    Fold telemetry rows into the hourly and daily rollups: counts and sums are added, min/max
+    widened. Rows are pre-aggregated so a batch costs one upsert row per device and bucket.
+    """
+    if not rows:
+        return
+    dialect_insert, greatest, least = _dialect_insert(session)
+    for model, seconds in ROLLUPS:
+        table = model.__table__
+        values = rollup_values(rows, seconds)
+        for start in range(0, len(values), ROLLUP_CHUNK_ROWS):
+            stmt = dialect_insert(model).values(values[start:start + ROLLUP_CHUNK_ROWS])
+            excluded = stmt.excluded
+            set_ = {"sample_count": table.c.sample_count + excluded.sample_count}
+            for name in METRIC_COLUMNS:
+                set_[f"{name}_sum"] = table.c[f"{name}_sum"] + excluded[f"{name}_sum"]
+                set_[f"{name}_min"] = least(table.c[f"{name}_min"], excluded[f"{name}_min"])
+                set_[f"{name}_max"] = greatest(table.c[f"{name}_max"], excluded[f"{name}_max"])
+            stmt = stmt.on_conflict_do_update(index_elements=[model.device_id, model.bucket_start], set_=set_)
+            await session.execute(stmt)
+
+
+async def write_telemetry(session: AsyncSession, items: Sequence[TelemetryCreate]) -> None:
+    """
+    Upsert the devices referenced by items, insert all samples, update the rollups and record the
+    alerts the metric rules raise. Once the transaction commits (database.commit_session), the rule
+    state moves forward, devices are recorded as existing in this process's device cache and cached
+    summaries of closed days that received late samples are invalidated.
+    """
+    rows = [telemetry_values(item) for item in items]
+    latest = latest_rows(rows)
+    device_ids = list(latest)
+    coalescer = get_last_seen_coalescer()
+    if coalescer is not None:
+        latest, deferred = coalescer.split(latest)
+        database.after_commit(session, partial(coalescer.committed, latest, deferred))
+    await upsert_device_snapshots(session, latest)
+    await insert_telemetry(session, rows)
+    await upsert_rollups(session, rows)
+    engine = get_rule_engine()
+    if engine is not None:
+        events, states = engine.evaluate(rows)
+        if events:
+            await session.execute(insert(Alert), alert_values(events, datetime.now(timezone.utc)))
+        database.after_commit(session, partial(engine.committed, states, events))
+
+    database.after_commit(session, partial(_update_caches, device_ids, closed_summary_keys(rows)))
+
+
+def closed_summary_keys(rows: Sequence[Mapping[str, Any]]) -> set[str]:
+    """Summary cache keys of the closed days the telemetry rows fall on (stale once they commit)."""
+    keys = set()
+    for row in rows:
+        day_start = bucket_floor(row["timestamp"], 86_400)
+        if summary_is_closed(day_start):
+            keys.add(summary_key(row["device_id"], day_start.date().isoformat()))
+    return keys
+
+
+async def _update_caches(device_ids: Sequence[str], closed_days: set[str]) -> None:
+    """After commit: the written devices exist and cached summaries of the closed days are stale."""
+    device_cache = get_device_cache()
+    for device_id in device_ids:
+        device_cache.local.set(device_id, True)
+    if closed_days:
+        await get_summary_cache().invalidate(*closed_days)
+
+
+class LastSeenCoalescer:
+    """
+    Keeps the newest sample per device in memory and writes last_seen and the metric snapshot to
+    devices on an interval, so a device sending at 10 Hz costs one devices write per interval
+    instead of ten per second.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        flush_interval_seconds: float,
+        max_known: int = COALESCER_MAX_KNOWN,
+    ):
+        self._session_factory = session_factory
+        self._flush_interval = flush_interval_seconds
+        self._max_known = max_known
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._pending: dict[str, Mapping[str, Any]] = {}
+        self._task: asyncio.Task | None = None
+
+    def split(
+        self, latest: Mapping[str, Mapping[str, Any]]
+    ) -> tuple[dict[str, Mapping[str, Any]], dict[str, Mapping[str, Any]]]:
+        """
+        Split the newest telemetry row per device into (immediate, deferred). Immediate devices have
+        no committed devices row from this process yet: they must be upserted now so the telemetry
+        foreign key is satisfied. Pass both to committed() once the transaction commits.
+        """
+        immediate: dict[str, Mapping[str, Any]] = {}
+        deferred: dict[str, Mapping[str, Any]] = {}
+        for device_id, row in latest.items():
+            if device_id in self._known:
+                self._known.move_to_end(device_id)
+                deferred[device_id] = row
+            else:
+                immediate[device_id] = row
+        return immediate, deferred
+
+    def committed(
+        self, immediate: Mapping[str, Mapping[str, Any]], deferred: Mapping[str, Mapping[str, Any]]
+    ) -> None:
+        """Remember the immediate devices as written and keep the deferred rows for the next flush."""
+        for device_id in immediate:
+            self._known[device_id] = None
+            self._known.move_to_end(device_id)
+        while len(self._known) > self._max_known:
+            self._known.popitem(last=False)
+        for device_id, row in deferred.items():
+            self._keep_newest(device_id, row)
+
+    def _keep_newest(self, device_id: str, row: Mapping[str, Any]) -> None:
+        current = self._pending.get(device_id)
+        if current is None or as_utc(row["timestamp"]) > as_utc(current["timestamp"]):
+            self._pending[device_id] = row
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        async with self._session_factory() as session:
+            try:
+                await upsert_device_snapshots(session, pending)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                # Keep the values for the next attempt unless newer ones arrived meanwhile
+                for device_id, row in pending.items():
+                    self._keep_newest(device_id, row)
+                raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush coalesced devices.last_seen and snapshots")
+
+
+_coalescer: LastSeenCoalescer | None = None
+
+
+def get_last_seen_coalescer() -> LastSeenCoalescer | None:
+    """Return the running coalescer, or None when devices is written on every ingest."""
+    return _coalescer
+
+
+async def start_last_seen_coalescer() -> None:
+    global _coalescer
+    s = database.get_settings()
+    if s.last_seen_flush_interval_seconds <= 0 or _coalescer is not None:
+        return
+    if database.async_session_factory is None:
+        database.init_db()
+    _coalescer = LastSeenCoalescer(database.async_session_factory, s.last_seen_flush_interval_seconds)
+    _coalescer.start()
+
+
+async def stop_last_seen_coalescer() -> None:
+    global _coalescer
+    if _coalescer is None:
+        return
+    coalescer, _coalescer = _coalescer, None
+    await coalescer.stop()
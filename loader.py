@@ -0,0 +1,234 @@
+"""
+Bulk loader for historical telemetry backfill from CSV or NDJSON files (optionally .gz).
+Rows are validated with the same rules as POST /telemetry, streamed in chunks and written
+with COPY on PostgreSQL (multi-row INSERT on SQLite). The rate limiter is not applied.
+Run: python -m loader FILE [FILE ...] [--chunk-rows N]
+
+CSV columns: device_id,timestamp,soc_percent,voltage_v,current_a,temp_c
+NDJSON lines: the POST /telemetry body ({"device_id", "timestamp", "metrics": {...}})
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import sys
+import time
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, TextIO
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from cache import close_caches, get_summary_cache
+from ingest import (
+    as_utc,
+    closed_summary_keys,
+    insert_telemetry,
+    latest_rows,
+    telemetry_values,
+    upsert_device_snapshots,
+    upsert_devices,
+    upsert_rollups,
+    validate_telemetry_batch,
+)
+from models import METRIC_COLUMNS, to_scaled
+from schemas import TelemetryCreate
+from worker import OFFLINE_THRESHOLD_MINUTES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 10_000
+COPY_COLUMNS = ("device_id", "timestamp", *METRIC_COLUMNS)
+
+
+@dataclass
+class LoadStats:
+    rows: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def _open_text(path: Path) -> TextIO:
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return path.open("r", encoding="utf-8", newline="")
+
+
+def _file_format(path: Path) -> str:
+    suffixes = [s for s in path.suffixes if s != ".gz"]
+    ext = suffixes[-1] if suffixes else ""
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ndjson", ".jsonl"):
+        return "ndjson"
+    raise ValueError(f"Unsupported file type for {path} (expected .csv, .ndjson or .jsonl)")
+
+
+def _read_items(path: Path) -> Iterator[tuple[int, Any]]:
+    """Yield (line number, raw item) pairs shaped like the POST /telemetry body."""
+    fmt = _file_format(path)
+    with _open_text(path) as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {
+                    "device_id": row.get("device_id"),
+                    "timestamp": row.get("timestamp"),
+                    "metrics": {name: row.get(name) for name in METRIC_COLUMNS},
+                }
+        else:
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_num, json.loads(line)
+                except json.JSONDecodeError:
+                    # Not an object: validation rejects it with a line number like any other bad row
+                    yield line_num, line
+
+
+def _chunks(items: Iterator[tuple[int, Any]], size: int) -> Iterator[list[tuple[int, Any]]]:
+    chunk: list[tuple[int, Any]] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_record(item: TelemetryCreate) -> tuple:
+    m = item.metrics
+    # COPY bypasses SQLAlchemy type processing: metrics go in as their stored integer hundredths
+    return (
+        item.device_id,
+        as_utc(item.timestamp),
+        to_scaled(m.soc_percent),
+        to_scaled(m.voltage_v),
+        to_scaled(m.current_a),
+        to_scaled(m.temp_c),
+    )
+
+
+def _offline_cutoff() -> datetime:
+    """Backfilled devices last seen before this are already offline: the worker must not alert on them."""
+    return datetime.now(timezone.utc) - timedelta(minutes=OFFLINE_THRESHOLD_MINUTES)
+
+
+async def _write_chunk(session: AsyncSession, items: list[TelemetryCreate], rows: list[dict]) -> None:
+    if session.get_bind().dialect.name == "postgresql":
+        conn = await session.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "telemetry", records=[_copy_record(item) for item in items], columns=COPY_COLUMNS
+        )
+    else:
+        await insert_telemetry(session, rows)
+    await upsert_rollups(session, rows)
+
+
+async def load_file(
+    path: Path,
+    session_factory: async_sessionmaker[AsyncSession],
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    latest: dict[str, Mapping[str, Any]] | None = None,
+) -> LoadStats:
+    """
+    Load one file chunk by chunk, one transaction per chunk. Devices seen for the first time are
+    upserted before their chunk (telemetry FK); the newest row per device is collected in latest
+    and upserted (last_seen and metric snapshot) once by load_files at the end. Devices whose
+    newest sample is older than the worker's offline threshold are written offline.
+    """
+    if latest is None:
+        latest = {}
+    stats = LoadStats()
+    started = time.monotonic()
+    for chunk in _chunks(_read_items(path), chunk_rows):
+        valid, rejected = validate_telemetry_batch([raw for _, raw in chunk])
+        for error in rejected[:5]:
+            logger.warning("%s line %s rejected: %s", path, chunk[error.index][0], error.detail)
+        stats.rejected += len(rejected)
+        items = [item for _, item in valid]
+        rows = [telemetry_values(item) for item in items]
+        new_devices: dict[str, datetime] = {}
+        for device_id, row in latest_rows(rows).items():
+            current = latest.get(device_id)
+            if current is None:
+                new_devices[device_id] = row["timestamp"]
+            if current is None or as_utc(row["timestamp"]) > as_utc(current["timestamp"]):
+                latest[device_id] = row
+        async with session_factory() as session:
+            await upsert_devices(session, new_devices, offline_before=_offline_cutoff())
+            await _write_chunk(session, items, rows)
+            await session.commit()
+        # Backfilled closed days: drop their cached summaries (locally and in the shared cache)
+        if closed := closed_summary_keys(rows):
+            await get_summary_cache().invalidate(*closed)
+        stats.rows += len(items)
+        stats.seconds = time.monotonic() - started
+        logger.info(
+            "%s: %s rows loaded (%.0f rows/s), %s rejected",
+            path, stats.rows, stats.rows_per_second, stats.rejected,
+        )
+    stats.seconds = time.monotonic() - started
+    return stats
+
+
+async def load_files(
+    paths: list[Path],
+    session_factory: async_sessionmaker[AsyncSession],
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> LoadStats:
+    total = LoadStats()
+    latest: dict[str, Mapping[str, Any]] = {}
+    started = time.monotonic()
+    for path in paths:
+        stats = await load_file(path, session_factory, chunk_rows, latest)
+        total.rows += stats.rows
+        total.rejected += stats.rejected
+    async with session_factory() as session:
+        await upsert_device_snapshots(session, latest, _offline_cutoff())
+        await session.commit()
+    total.seconds = time.monotonic() - started
+    logger.info(
+        "Done: %s rows for %s devices in %.1fs (%.0f rows/s), %s rejected",
+        total.rows, len(latest), total.seconds, total.rows_per_second, total.rejected,
+    )
+    return total
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout,
+    )
+    parser = argparse.ArgumentParser(description="Bulk-load historical telemetry from CSV/NDJSON files")
+    parser.add_argument("paths", nargs="+", type=Path, help="CSV, NDJSON or JSONL files, optionally .gz")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per transaction")
+    args = parser.parse_args()
+    asyncio.run(_run(args.paths, args.chunk_rows))
+
+
+async def _run(paths: list[Path], chunk_rows: int) -> None:
+    database.init_db()
+    try:
+        await load_files(paths, database.async_session_factory, chunk_rows)
+    finally:
+        await close_caches()
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
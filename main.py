@@ -1,28 +1,83 @@
+import heapq
 import logging
-from datetime import datetime, timedelta
-from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Literal
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from sqlalchemy import func, select
-from sqlalchemy.exc import SQLAlchemyError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_session
-from models import Device, Telemetry
-from rate_limiter import get_rate_limiter
+from archive import archived_buckets, merge_chunks, read_archived
+from cache import close_caches, get_device_cache, get_summary_cache, summary_is_closed, summary_key
+from database import get_read_session, get_session
+from downsampling import bucket_expression, bucket_start, lttb_indices
+from export import EXPORT_MEDIA_TYPES, stream_export
+from ingest import (
+    as_utc,
+    bucket_floor,
+    start_last_seen_coalescer,
+    stop_last_seen_coalescer,
+    validate_telemetry_batch,
+    write_telemetry,
+)
+from metrics import (
+    METRICS_ROWS_RETURNED,
+    PHASE_SECONDS,
+    RATE_LIMITED,
+    RequestMetricsMiddleware,
+    render as render_metrics,
+)
+from models import METRIC_COLUMNS, Device, Telemetry, TelemetryDaily, TelemetryHourly
+from rate_limiter import close_rate_limiter, get_rate_limiter
 from schemas import (
     DailySummaryResponse,
+    DeviceLatest,
+    DeviceLatestResponse,
     ErrorDetail,
     ErrorResponse,
     MetricSummary,
+    RangeSummaryResponse,
+    SummaryBatchRequest,
+    SummaryBatchResponse,
+    TelemetryBatchResponse,
+    TelemetryBucket,
+    TelemetryBucketsResponse,
     TelemetryCreate,
     TelemetryMetricsResponse,
     TelemetryRow,
 )
+from serializers import (
+    ROW_FIELDS,
+    decode_cursor,
+    encode_columnar_chunk,
+    encode_cursor,
+    encode_metrics_page,
+    encode_ndjson_rows,
+)
+from write_buffer import get_write_buffer, start_write_buffer, stop_write_buffer
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Battery Telemetry API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await start_last_seen_coalescer()
+    await start_write_buffer()
+    try:
+        yield
+    finally:
+        await stop_write_buffer()
+        await stop_last_seen_coalescer()
+        await close_rate_limiter()
+        await close_caches()
+
+
+app = FastAPI(title="Battery Telemetry API", version="0.1.0", lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
 
 
 @app.exception_handler(RequestValidationError)
@@ -38,6 +93,16 @@ async def validation_exception_handler(_request: Request, exc: RequestValidation
     )
 
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(_request: Request, exc: PoolTimeoutError) -> JSONResponse:
+    logger.warning("Database pool exhausted: %s", exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=ErrorResponse(detail="Database busy, retry later").model_dump(),
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.exception_handler(SQLAlchemyError)
 async def sql_exception_handler(_request: Request, exc: SQLAlchemyError) -> JSONResponse:
     logger.exception("Database error: %s", exc)
@@ -53,6 +118,7 @@ async def http_exception_handler(_request: Request, exc: HTTPException) -> JSONR
     return JSONResponse(
         status_code=exc.status_code,
         content=ErrorResponse(detail=detail).model_dump(),
+        headers=exc.headers,
     )
 
 
@@ -61,138 +127,572 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/telemetry", status_code=status.HTTP_201_CREATED)
 async def post_telemetry(
     body: TelemetryCreate,
     session: AsyncSession = Depends(get_session),
 ):
     limiter = get_rate_limiter()
-    if await limiter.is_rate_limited(body.device_id):
+    with PHASE_SECONDS.labels("rate_limit").time():
+        limited = await limiter.is_rate_limited(body.device_id)
+    if limited:
+        RATE_LIMITED.labels("telemetry").inc()
         raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded")
-    result = await session.execute(select(Device).where(Device.device_id == body.device_id))
-    device = result.scalar_one_or_none()
-    if device is None:
-        device = Device(
-            device_id=body.device_id,
-            last_seen=body.timestamp,
-            status="online",
-        )
-        session.add(device)
-    else:
-        device.last_seen = body.timestamp
-        device.status = "online"
-    session.add(
-        Telemetry(
-            device_id=body.device_id,
-            timestamp=body.timestamp,
-            soc_percent=body.metrics.soc_percent,
-            voltage_v=body.metrics.voltage_v,
-            current_a=body.metrics.current_a,
-            temp_c=body.metrics.temp_c,
-        )
-    )
+    buffer = get_write_buffer()
+    if buffer is not None:
+        if not buffer.offer(body):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Ingest buffer full, retry later",
+                headers={"Retry-After": "1"},
+            )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "accepted"})
+    with PHASE_SECONDS.labels("write").time():
+        await write_telemetry(session, [body])
     return {"status": "created"}
 
 
+# Upper bound on samples per batch request (keeps one request's insert bounded)
+TELEMETRY_BATCH_MAX_ITEMS = 5_000
+
+
+@app.post("/telemetry/batch", response_model=TelemetryBatchResponse)
+async def post_telemetry_batch(
+    items: list[Any] = Body(..., min_length=1, max_length=TELEMETRY_BATCH_MAX_ITEMS),
+    session: AsyncSession = Depends(get_session),
+):
+    valid, rejected = validate_telemetry_batch(items)
+    limiter = get_rate_limiter()
+    accepted: list[TelemetryCreate] = []
+    rate_limited: list[int] = []
+    with PHASE_SECONDS.labels("rate_limit").time():
+        # One limiter call for the whole batch: samples counted per device, the earliest admitted
+        admitted = await limiter.admit(Counter(item.device_id for _, item in valid))
+    for index, item in valid:
+        if admitted[item.device_id] > 0:
+            admitted[item.device_id] -= 1
+            accepted.append(item)
+        else:
+            rate_limited.append(index)
+    if rate_limited:
+        RATE_LIMITED.labels("telemetry_batch").inc(len(rate_limited))
+    with PHASE_SECONDS.labels("write").time():
+        await write_telemetry(session, accepted)
+    return TelemetryBatchResponse(
+        accepted=len(accepted),
+        rejected=rejected,
+        rate_limited=rate_limited,
+    )
+
+
 # Max time range (7-day queries supported; slightly larger to be flexible)
 METRICS_MAX_RANGE_DAYS = 8
 # Cap rows so 7-day queries at 30s interval (~20k points) are fine without unbounded load
 METRICS_MAX_ROWS = 50_000
+# Default page; clients follow next_cursor for the rest of the range
+METRICS_DEFAULT_PAGE_SIZE = 10_000
+# Rows fetched from the server-side cursor and encoded per chunk in streaming formats
+METRICS_STREAM_CHUNK_ROWS = 5_000
+# Columns of a metrics row, in serializers.ROW_FIELDS order
+METRICS_ROW_COLUMNS = (
+    Telemetry.timestamp,
+    Telemetry.soc_percent,
+    Telemetry.voltage_v,
+    Telemetry.current_a,
+    Telemetry.temp_c,
+)
+# Bucketed queries are bounded by bucket count instead of METRICS_MAX_RANGE_DAYS
+METRICS_MAX_BUCKETS = 10_000
+
+
+async def _ensure_device(session: AsyncSession, device_id: str) -> None:
+    """404 unless the device exists; known devices are answered from the device cache."""
+    cache = get_device_cache()
+    if await cache.get(device_id):
+        return
+    with PHASE_SECONDS.labels("device_lookup").time():
+        exists = (await session.execute(select(Device.device_id).where(Device.device_id == device_id))).first()
+    if exists is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    await cache.set(device_id, True)
+
+
+def _row_key(row) -> tuple[datetime, int]:
+    """Metrics order of (timestamp, ..., id) rows from the database and the archive."""
+    return as_utc(row[0]), row[-1]
+
+
+async def _stream_metrics(session: AsyncSession, stmt: Select, fmt: str, archived: list[tuple]):
+    encode = encode_ndjson_rows if fmt == "ndjson" else encode_columnar_chunk
+    result = await session.stream(stmt.execution_options(yield_per=METRICS_STREAM_CHUNK_ROWS))
+    chunks = result.partitions()
+    if archived:
+        # Streamed rows carry no id; the archived rows go first on equal timestamps, as with cursors
+        archived = [row[:-1] for row in archived]
+        chunks = merge_chunks(
+            archived, chunks, key=lambda row: as_utc(row[0]), chunk_rows=METRICS_STREAM_CHUNK_ROWS
+        )
+    streamed = 0
+    async for rows in chunks:
+        streamed += len(rows)
+        yield encode(rows)
+    METRICS_ROWS_RETURNED.labels(fmt).observe(streamed)
 
 
-@app.get("/devices/{device_id}/metrics", response_model=TelemetryMetricsResponse)
+# Partial aggregates per bucket start: (count, [min per metric], [max per metric], [sum per metric])
+BucketStats = dict[datetime, tuple[int, list[float], list[float], list[float]]]
+
+
+def _fold_buckets(stats: BucketStats, partial: BucketStats) -> None:
+    """Merge partial bucket aggregates (rollups, raw telemetry, archived samples) into stats."""
+    for start, (count, mins, maxs, sums) in partial.items():
+        current = stats.get(start)
+        if current is None:
+            stats[start] = (count, list(mins), list(maxs), list(sums))
+            continue
+        stats[start] = (
+            current[0] + count,
+            [min(a, b) for a, b in zip(current[1], mins)],
+            [max(a, b) for a, b in zip(current[2], maxs)],
+            [a + b for a, b in zip(current[3], sums)],
+        )
+
+
+async def _bucket_stats(session: AsyncSession, stmt: Select) -> BucketStats:
+    """Run a (bucket, count, min, max, sum per metric) GROUP BY query into BucketStats."""
+    stats = {}
+    for row in (await session.execute(stmt)).all():
+        metrics = range(len(METRIC_COLUMNS))
+        stats[bucket_start(row[0])] = (
+            row[1],
+            [row[2 + 3 * i] for i in metrics],
+            [row[3 + 3 * i] for i in metrics],
+            [row[4 + 3 * i] for i in metrics],
+        )
+    return stats
+
+
+async def _metric_buckets(
+    session: AsyncSession, device_id: str, start_time: datetime, end_time: datetime, resolution: int
+) -> TelemetryBucketsResponse:
+    """
+    min/max/avg per metric in epoch-aligned buckets. For whole-hour resolutions the hours lying
+    entirely inside the range are folded from the hourly rollups (which keep archived months); the
+    partial hours at the edges and other resolutions aggregate raw telemetry and archived samples.
+    """
+    dialect = session.get_bind().dialect.name
+    stats: BucketStats = {}
+    raw_ranges = [(start_time, end_time)]
+    full_start = bucket_floor(start_time, 3_600)
+    if full_start < as_utc(start_time):
+        full_start += timedelta(hours=1)
+    full_end = bucket_floor(end_time, 3_600)
+    if resolution % 3_600 == 0 and full_start < full_end:
+        bucket = bucket_expression(dialect, TelemetryHourly.bucket_start, resolution)
+        aggregates = []
+        for name in METRIC_COLUMNS:
+            aggregates += [
+                func.min(getattr(TelemetryHourly, f"{name}_min")),
+                func.max(getattr(TelemetryHourly, f"{name}_max")),
+                func.sum(getattr(TelemetryHourly, f"{name}_sum")),
+            ]
+        stmt = (
+            select(bucket, func.sum(TelemetryHourly.sample_count), *aggregates)
+            .where(
+                TelemetryHourly.device_id == device_id,
+                TelemetryHourly.bucket_start >= full_start,
+                TelemetryHourly.bucket_start < full_end,
+            )
+            .group_by(bucket)
+        )
+        _fold_buckets(stats, await _bucket_stats(session, stmt))
+        # Edges: [start_time, full_start) and [full_end, end_time]
+        raw_ranges = [(start_time, full_start - timedelta(microseconds=1)), (full_end, end_time)]
+
+    bucket = bucket_expression(dialect, Telemetry.timestamp, resolution)
+    aggregates = []
+    for name in METRIC_COLUMNS:
+        column = getattr(Telemetry, name)
+        aggregates += [func.min(column), func.max(column), func.sum(column)]
+    for low, high in raw_ranges:
+        if as_utc(low) > as_utc(high):
+            continue
+        stmt = (
+            select(bucket, func.count(), *aggregates)
+            .where(Telemetry.device_id == device_id, Telemetry.timestamp >= low, Telemetry.timestamp <= high)
+            .group_by(bucket)
+        )
+        _fold_buckets(stats, await _bucket_stats(session, stmt))
+        _fold_buckets(stats, await archived_buckets(session, device_id, low, high, resolution))
+
+    buckets = []
+    for start in sorted(stats):
+        count, mins, maxs, sums = stats[start]
+        summaries = {
+            name: MetricSummary(min=mins[i], max=maxs[i], avg=sums[i] / count)
+            for i, name in enumerate(METRIC_COLUMNS)
+        }
+        buckets.append(TelemetryBucket(timestamp=start, count=count, **summaries))
+    return TelemetryBucketsResponse(device_id=device_id, resolution_seconds=resolution, buckets=buckets)
+
+
+@app.get(
+    "/devices/{device_id}/metrics",
+    response_model=TelemetryMetricsResponse | TelemetryBucketsResponse,
+)
 async def get_device_metrics(
     device_id: str,
     start_time: datetime = Query(..., description="Start of range (ISO 8601)"),
     end_time: datetime = Query(..., description="End of range (ISO 8601)"),
-    session: AsyncSession = Depends(get_session),
+    format: Literal["json", "ndjson", "columnar"] = Query(
+        "json",
+        description="json: one document (row-capped); ndjson: one row per line; "
+        "columnar: one {field: [values]} object per line. ndjson and columnar are streamed, uncapped",
+    ),
+    resolution: int | None = Query(
+        None, ge=1, description="Bucket width in seconds: return min/max/avg per metric per bucket"
+    ),
+    max_points: int | None = Query(
+        None, ge=3, description="Downsample raw rows to at most this many points (LTTB)"
+    ),
+    downsample_metric: Literal["soc_percent", "voltage_v", "current_a", "temp_c"] = Query(
+        "soc_percent", description="Metric whose shape LTTB preserves when max_points is set"
+    ),
+    page_size: int = Query(
+        METRICS_DEFAULT_PAGE_SIZE, ge=1, le=METRICS_MAX_ROWS, description="Rows per page (format=json)"
+    ),
+    cursor: str | None = Query(None, description="next_cursor of the previous page"),
+    session: AsyncSession = Depends(get_read_session),
 ):
     if start_time > end_time:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="start_time must be before or equal to end_time",
         )
-    if (end_time - start_time) > timedelta(days=METRICS_MAX_RANGE_DAYS):
+    if resolution is not None and max_points is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either resolution or max_points, not both",
+        )
+    if (resolution is not None or max_points is not None) and format != "json":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="resolution and max_points are only supported with format=json",
+        )
+    if resolution is not None:
+        if (end_time - start_time).total_seconds() / resolution > METRICS_MAX_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Time range must not exceed {METRICS_MAX_BUCKETS} buckets of {resolution} seconds",
+            )
+    elif (end_time - start_time) > timedelta(days=METRICS_MAX_RANGE_DAYS):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Time range must not exceed {METRICS_MAX_RANGE_DAYS} days",
         )
-    result = await session.execute(select(Device).where(Device.device_id == device_id))
-    if result.scalar_one_or_none() is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
-    # Query uses idx_telemetry_device_timestamp (device_id, timestamp)
-    stmt = (
-        select(Telemetry)
-        .where(
-            Telemetry.device_id == device_id,
-            Telemetry.timestamp >= start_time,
-            Telemetry.timestamp <= end_time,
-        )
-        .order_by(Telemetry.timestamp)
-        .limit(METRICS_MAX_ROWS)
-    )
-    rows = (await session.execute(stmt)).scalars().all()
-    data = [
-        TelemetryRow(
-            timestamp=r.timestamp,
-            soc_percent=float(r.soc_percent),
-            voltage_v=float(r.voltage_v),
-            current_a=float(r.current_a),
-            temp_c=float(r.temp_c),
-        )
-        for r in rows
+    await _ensure_device(session, device_id)
+    if resolution is not None:
+        with PHASE_SECONDS.labels("query").time():
+            buckets = await _metric_buckets(session, device_id, start_time, end_time, resolution)
+        METRICS_ROWS_RETURNED.labels("buckets").observe(len(buckets.buckets))
+        return buckets
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    range_filter = [
+        Telemetry.device_id == device_id,
+        Telemetry.timestamp >= start_time,
+        Telemetry.timestamp <= end_time,
     ]
-    return TelemetryMetricsResponse(device_id=device_id, data=data)
+    if after is not None:
+        range_filter.append(tuple_(Telemetry.timestamp, Telemetry.id) > tuple_(*after))
+    # Only the needed columns as tuples; metrics come back as floats from their scaled-integer storage
+    stmt = select(*METRICS_ROW_COLUMNS).where(*range_filter).order_by(Telemetry.timestamp, Telemetry.id)
+    with PHASE_SECONDS.labels("archive_read").time():
+        archived = await read_archived(session, device_id, start_time, end_time, after)
+    if format != "json":
+        return StreamingResponse(
+            _stream_metrics(session, stmt, format, archived), media_type="application/x-ndjson"
+        )
+    # Keyset page: one range seek on idx_telemetry_device_timestamp (device_id, timestamp, id);
+    # id is selected last for the cursor and ignored by the encoder
+    stmt = stmt.add_columns(Telemetry.id)
+    next_cursor = None
+    with PHASE_SECONDS.labels("query").time():
+        if max_points is not None:
+            # LTTB needs the whole range: refuse rather than downsample only its first rows
+            rows = (await session.execute(stmt.limit(METRICS_MAX_ROWS + 1))).all()
+            if archived:
+                rows = list(heapq.merge(archived, rows, key=_row_key))[: METRICS_MAX_ROWS + 1]
+            if len(rows) > METRICS_MAX_ROWS:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Time range holds more than {METRICS_MAX_ROWS} samples: "
+                    "narrow it or use resolution for max_points",
+                )
+            metric_index = ROW_FIELDS.index(downsample_metric)
+            x = [r[0].timestamp() for r in rows]
+            y = [r[metric_index] for r in rows]
+            rows = [rows[i] for i in lttb_indices(x, y, max_points)]
+        else:
+            rows = (await session.execute(stmt.limit(page_size + 1))).all()
+            if archived:
+                rows = list(heapq.merge(archived, rows, key=_row_key))[: page_size + 1]
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_cursor = encode_cursor(rows[-1][0], rows[-1][-1])
+    METRICS_ROWS_RETURNED.labels(format).observe(len(rows))
+    # Encoded straight from the tuples: no TelemetryRow per row and no second validation pass
+    # against response_model, which still documents the shape
+    with PHASE_SECONDS.labels("build_response").time():
+        body = encode_metrics_page(device_id, rows, next_cursor)
+    return Response(content=body, media_type="application/json")
+
+
+def _rollup_summary(row) -> dict[str, MetricSummary]:
+    """min/max/avg per metric from a rollup row (or aggregate) with sample_count and *_sum/min/max."""
+    if not row or not row.sample_count:
+        return {name: MetricSummary(min=0, max=0, avg=0) for name in METRIC_COLUMNS}
+    return {
+        name: MetricSummary(
+            min=getattr(row, f"{name}_min"),
+            max=getattr(row, f"{name}_max"),
+            avg=getattr(row, f"{name}_sum") / row.sample_count,
+        )
+        for name in METRIC_COLUMNS
+    }
 
 
 @app.get("/devices/{device_id}/summary", response_model=DailySummaryResponse)
 async def get_device_summary(
     device_id: str,
     date: str = Query(..., description="Date YYYY-MM-DD"),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
-    result = await session.execute(select(Device).where(Device.device_id == device_id))
-    if result.scalar_one_or_none() is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
     try:
         day_start = datetime.fromisoformat(date + "T00:00:00+00:00")
-        day_end = datetime.fromisoformat(date + "T23:59:59.999999+00:00")
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format, use YYYY-MM-DD")
-    agg = (
+    # Closed days no longer change: a cached summary also proves the device exists
+    # Normalized (e.g. 20260105 -> 2026-01-05): the key and the cached response use the same date
+    date = day_start.date().isoformat()
+    cache = get_summary_cache() if summary_is_closed(day_start) else None
+    key = summary_key(device_id, date)
+    if cache is not None and (cached := await cache.get(key)) is not None:
+        return cached
+    await _ensure_device(session, device_id)
+    # Primary-key lookup in the daily rollup maintained at ingest time
+    stmt = select(TelemetryDaily).where(
+        TelemetryDaily.device_id == device_id,
+        TelemetryDaily.bucket_start == day_start,
+    )
+    row = (await session.execute(stmt)).scalar_one_or_none()
+    response = DailySummaryResponse(device_id=device_id, date=date, summary=_rollup_summary(row))
+    if cache is not None:
+        await cache.set(key, response)
+    return response
+
+
+# Longest span answered by /summary/range (one daily rollup row per day)
+SUMMARY_MAX_RANGE_DAYS = 366
+
+
+@app.get("/devices/{device_id}/summary/range", response_model=RangeSummaryResponse)
+async def get_device_range_summary(
+    device_id: str,
+    start_date: date = Query(..., description="First day YYYY-MM-DD (inclusive)"),
+    end_date: date = Query(..., description="Last day YYYY-MM-DD (inclusive)"),
+    session: AsyncSession = Depends(get_read_session),
+):
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start_date must be before or equal to end_date",
+        )
+    if (end_date - start_date).days >= SUMMARY_MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Date range must not exceed {SUMMARY_MAX_RANGE_DAYS} days",
+        )
+    await _ensure_device(session, device_id)
+    columns = [func.sum(TelemetryDaily.sample_count).label("sample_count")]
+    for name in METRIC_COLUMNS:
+        columns += [
+            func.sum(getattr(TelemetryDaily, f"{name}_sum")).label(f"{name}_sum"),
+            func.min(getattr(TelemetryDaily, f"{name}_min")).label(f"{name}_min"),
+            func.max(getattr(TelemetryDaily, f"{name}_max")).label(f"{name}_max"),
+        ]
+    stmt = select(*columns).where(
+        TelemetryDaily.device_id == device_id,
+        TelemetryDaily.bucket_start >= datetime.combine(start_date, time.min, timezone.utc),
+        TelemetryDaily.bucket_start <= datetime.combine(end_date, time.min, timezone.utc),
+    )
+    row = (await session.execute(stmt)).one()
+    return RangeSummaryResponse(
+        device_id=device_id,
+        start_date=start_date,
+        end_date=end_date,
+        sample_count=row.sample_count or 0,
+        summary=_rollup_summary(row),
+    )
+
+
+# Devices per GET /devices/latest page
+LATEST_DEFAULT_PAGE_SIZE = 5_000
+LATEST_MAX_PAGE_SIZE = 10_000
+# Upper bound on device x date pairs per POST /devices/summary:batch
+SUMMARY_BATCH_MAX_PAIRS = 50_000
+
+
+@app.get("/devices/latest", response_model=DeviceLatestResponse)
+async def get_devices_latest(
+    device_id: list[str] | None = Query(None, description="Only these devices (repeat the parameter)"),
+    after: str | None = Query(None, description="next_after of the previous page"),
+    page_size: int = Query(LATEST_DEFAULT_PAGE_SIZE, ge=1, le=LATEST_MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Status, last_seen and latest sample of every device (or the listed ones), by device_id."""
+    if device_id is not None and len(device_id) > LATEST_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {LATEST_MAX_PAGE_SIZE} device_id values per request",
+        )
+    # The latest reading is the snapshot the devices upsert keeps: one row per device, no telemetry access
+    stmt = (
         select(
-            func.min(Telemetry.soc_percent).label("soc_min"),
-            func.max(Telemetry.soc_percent).label("soc_max"),
-            func.avg(Telemetry.soc_percent).label("soc_avg"),
-            func.min(Telemetry.voltage_v).label("v_min"),
-            func.max(Telemetry.voltage_v).label("v_max"),
-            func.avg(Telemetry.voltage_v).label("v_avg"),
-            func.min(Telemetry.current_a).label("i_min"),
-            func.max(Telemetry.current_a).label("i_max"),
-            func.avg(Telemetry.current_a).label("i_avg"),
-            func.min(Telemetry.temp_c).label("t_min"),
-            func.max(Telemetry.temp_c).label("t_max"),
-            func.avg(Telemetry.temp_c).label("t_avg"),
-        )
-        .where(
-            Telemetry.device_id == device_id,
-            Telemetry.timestamp >= day_start,
-            Telemetry.timestamp <= day_end,
+            Device.device_id,
+            Device.status,
+            Device.last_seen,
+            Device.soc_percent,
+            Device.voltage_v,
+            Device.current_a,
+            Device.temp_c,
         )
+        .order_by(Device.device_id)
+        .limit(page_size + 1)
     )
-    row = (await session.execute(agg)).one()
-    if row.soc_min is None:
-        summary = {
-            "soc_percent": MetricSummary(min=0, max=0, avg=0),
-            "voltage_v": MetricSummary(min=0, max=0, avg=0),
-            "current_a": MetricSummary(min=0, max=0, avg=0),
-            "temp_c": MetricSummary(min=0, max=0, avg=0),
-        }
-    else:
-        summary = {
-            "soc_percent": MetricSummary(min=float(row.soc_min), max=float(row.soc_max), avg=float(row.soc_avg)),
-            "voltage_v": MetricSummary(min=float(row.v_min), max=float(row.v_max), avg=float(row.v_avg)),
-            "current_a": MetricSummary(min=float(row.i_min), max=float(row.i_max), avg=float(row.i_avg)),
-            "temp_c": MetricSummary(min=float(row.t_min), max=float(row.t_max), avg=float(row.t_avg)),
-        }
-    return DailySummaryResponse(device_id=device_id, date=date, summary=summary)
+    if device_id is not None:
+        stmt = stmt.where(Device.device_id.in_(device_id))
+    if after is not None:
+        stmt = stmt.where(Device.device_id > after)
+    rows = (await session.execute(stmt)).all()
+    next_after = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_after = rows[-1].device_id
+    devices = [
+        DeviceLatest(
+            device_id=row.device_id,
+            status=row.status,
+            last_seen=row.last_seen,
+            latest=TelemetryRow(**dict(zip(ROW_FIELDS, row[2:]))) if row.soc_percent is not None else None,
+        )
+        for row in rows
+    ]
+    return DeviceLatestResponse(devices=devices, next_after=next_after)
+
+
+@app.post("/devices/summary:batch", response_model=SummaryBatchResponse)
+async def post_devices_summary_batch(
+    body: SummaryBatchRequest,
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Daily summaries for every (device, date) pair of the request from two queries: the known
+    devices, and the daily rollup rows of all pairs. Unknown devices are listed, not 404.
+    """
+    device_ids = sorted(set(body.device_ids))
+    dates = sorted(set(body.dates))
+    if len(device_ids) * len(dates) > SUMMARY_BATCH_MAX_PAIRS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {SUMMARY_BATCH_MAX_PAIRS} device_id x date pairs per request",
+        )
+    known = set(
+        (await session.execute(select(Device.device_id).where(Device.device_id.in_(device_ids)))).scalars()
+    )
+    day_starts = [datetime.combine(day, time.min, timezone.utc) for day in dates]
+    rollups = {}
+    if known:
+        stmt = select(TelemetryDaily).where(
+            TelemetryDaily.device_id.in_(sorted(known)),
+            TelemetryDaily.bucket_start.in_(day_starts),
+        )
+        for row in (await session.execute(stmt)).scalars():
+            rollups[(row.device_id, as_utc(row.bucket_start).date())] = row
+    summaries = [
+        DailySummaryResponse(
+            device_id=device,
+            date=day.isoformat(),
+            summary=_rollup_summary(rollups.get((device, day))),
+        )
+        for device in device_ids
+        if device in known
+        for day in dates
+    ]
+    return SummaryBatchResponse(
+        summaries=summaries,
+        unknown_device_ids=[device for device in device_ids if device not in known],
+    )
+
+
+# GET /telemetry/export bounds: devices per request and days per range
+EXPORT_MAX_DEVICES = 1_000
+EXPORT_MAX_RANGE_DAYS = 92
+
+
+@app.get("/telemetry/export")
+async def export_telemetry(
+    device_id: list[str] = Query(..., description="Devices to export (repeat the parameter)"),
+    start_time: datetime = Query(..., description="Start of range (ISO 8601)"),
+    end_time: datetime = Query(..., description="End of range (ISO 8601)"),
+    format: Literal["parquet", "arrow"] = Query(
+        "parquet", description="parquet: zstd-compressed file; arrow: Arrow IPC stream"
+    ),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """
+    Raw samples of a device set for analytics, streamed as typed columns (device_id, timestamp,
+    float32 metrics) ordered by device and timestamp. Not row-capped.
+    """
+    if start_time > end_time:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start_time must be before or equal to end_time",
+        )
+    if (end_time - start_time) > timedelta(days=EXPORT_MAX_RANGE_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Time range must not exceed {EXPORT_MAX_RANGE_DAYS} days",
+        )
+    device_ids = sorted(set(device_id))
+    if len(device_ids) > EXPORT_MAX_DEVICES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {EXPORT_MAX_DEVICES} device_id values per request",
+        )
+    with PHASE_SECONDS.labels("device_lookup").time():
+        known = set(
+            (await session.execute(select(Device.device_id).where(Device.device_id.in_(device_ids)))).scalars()
+        )
+    unknown = [device for device in device_ids if device not in known]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Device not found: {', '.join(unknown[:10])}",
+        )
+    return StreamingResponse(
+        stream_export(session, device_ids, start_time, end_time, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="telemetry.{format}"'},
+    )
+
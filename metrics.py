@@ -0,0 +1,109 @@
+"""
+Prometheus metrics for the API and worker (prometheus-client, per process). Metric objects live
+here so every module records into the same registry; GET /metrics renders it for the API and the
+worker serves it on WORKER_METRICS_PORT.
+"""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 10, 100, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "telemetry_http_request_seconds",
+    "Request latency (to the last body byte) by method, route template and status",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+PHASE_SECONDS = Histogram(
+    "telemetry_phase_seconds",
+    "Time spent in a step of request handling "
+    "(rate_limit, device_lookup, write, commit, query, archive_read, build_response)",
+    ["phase"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "telemetry_db_query_seconds",
+    "Statement execution time by pool and statement type (server-side cursors: until the first rows)",
+    ["pool", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMITED = Counter("telemetry_rate_limited_total", "Samples rejected by the rate limiter", ["endpoint"])
+METRICS_ROWS_RETURNED = Histogram(
+    "telemetry_metrics_rows_returned",
+    "Rows (or buckets) returned per GET /devices/{device_id}/metrics call, by format",
+    ["format"],
+    buckets=COUNT_BUCKETS,
+)
+WRITE_BUFFER_DROPPED = Counter(
+    "telemetry_write_buffer_dropped_total", "Acknowledged buffered samples dropped after every write attempt failed"
+)
+ALERTS_RAISED = Counter("telemetry_alerts_total", "Alerts raised, by alert type (rule name or offline)", ["type"])
+WORKER_CYCLE_SECONDS = Histogram(
+    "telemetry_worker_cycle_seconds",
+    "Duration of one offline detection pass (poll: full check, deadline: one firing of due devices)",
+    ["mode"],
+    buckets=LATENCY_BUCKETS,
+)
+WORKER_CYCLE_ALERTS = Histogram(
+    "telemetry_worker_cycle_alerts", "Offline alerts raised per detection pass", ["mode"], buckets=COUNT_BUCKETS
+)
+
+CACHE_REQUESTS = Counter(
+    "telemetry_cache_requests_total",
+    "Cache lookups by cache and result (hit = this process, shared_hit = shared backend, miss)",
+    ["cache", "result"],
+)
+CACHE_EVICTIONS = Counter(
+    "telemetry_cache_evictions_total", "Entries evicted from the in-process cache to respect its size limit", ["cache"]
+)
+CACHE_ENTRIES = Gauge("telemetry_cache_entries", "Entries in the in-process cache", ["cache"])
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "telemetry_db_pool_checkout_seconds",
+    "Time to get a connection from the pool, including waits for a free one",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "telemetry_db_pool_timeouts_total", "Checkouts that gave up after the pool timeout", ["pool"]
+)
+DB_POOL_CHECKED_OUT = Gauge("telemetry_db_pool_checked_out", "Connections currently checked out of the pool", ["pool"])
+DB_POOL_CAPACITY = Gauge("telemetry_db_pool_capacity", "Maximum connections of the pool (size + overflow)", ["pool"])
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording HTTP_REQUEST_SECONDS. Routes are labelled by their path template
+    (not the raw path), so label cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition body and content type for the default registry."""
+    return generate_latest(), CONTENT_TYPE_LATEST
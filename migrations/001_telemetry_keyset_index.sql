@@ -0,0 +1,10 @@
+-- Extend idx_telemetry_device_timestamp with id so keyset pages on /devices/{id}/metrics
+-- (ORDER BY timestamp, id; WHERE (timestamp, id) > cursor) are a single index range scan.
+-- Run outside a transaction: psql -d battery_telemetry -f migrations/001_telemetry_keyset_index.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_telemetry_device_timestamp_id
+    ON telemetry (device_id, timestamp DESC, id DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_telemetry_device_timestamp;
+
+ALTER INDEX idx_telemetry_device_timestamp_id RENAME TO idx_telemetry_device_timestamp;
@@ -0,0 +1,40 @@
+-- Convert telemetry into a table range-partitioned by month on timestamp (PostgreSQL 12+).
+-- The existing heap table is attached unchanged as partition telemetry_legacy covering everything
+-- before the start of next month, so no rows are copied. New months get their own partitions
+-- from the partition maintenance task (python -m partitions, also run by the worker).
+-- There is no DEFAULT partition: schemas.TelemetryCreate rejects timestamps outside the
+-- partitioned window (over a day ahead, or older than TELEMETRY_RETENTION_MONTHS) at validation.
+-- Attaching validates the legacy range with one scan of the old table while holding a lock;
+-- run it in a maintenance window on large tables.
+
+BEGIN;
+
+ALTER TABLE telemetry RENAME TO telemetry_legacy;
+ALTER INDEX idx_telemetry_device_timestamp RENAME TO idx_telemetry_legacy_device_timestamp;
+
+-- Same columns as the legacy table (so it can be attached whatever the metric column types are);
+-- primary keys of partitioned tables must include the partition key
+CREATE TABLE telemetry (
+    LIKE telemetry_legacy INCLUDING DEFAULTS,
+    FOREIGN KEY (device_id) REFERENCES devices(device_id) ON DELETE CASCADE,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE telemetry_id_seq OWNED BY telemetry.id;
+ALTER TABLE telemetry_legacy ALTER COLUMN id DROP DEFAULT;
+
+CREATE INDEX idx_telemetry_device_timestamp
+    ON telemetry (device_id, timestamp DESC, id DESC);
+
+DO $$
+DECLARE
+    legacy_end TIMESTAMPTZ := date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + INTERVAL '1 month';
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE telemetry ATTACH PARTITION telemetry_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        legacy_end
+    );
+END
+$$;
+
+COMMIT;
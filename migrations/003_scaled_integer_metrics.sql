@@ -0,0 +1,44 @@
+-- Store telemetry metrics and their rollups as integer hundredths instead of NUMERIC.
+-- Precision is unchanged (all columns were NUMERIC(p, 2)); rows get narrower and the driver
+-- decodes plain integers instead of NUMERIC. Deploy the application version that maps the
+-- columns as scaled integers (models.ScaledInteger) together with this migration.
+-- Each ALTER rewrites its table (all partitions for a partitioned telemetry) under an
+-- ACCESS EXCLUSIVE lock; run it in a maintenance window on large tables.
+
+BEGIN;
+
+ALTER TABLE telemetry
+    ALTER COLUMN soc_percent TYPE SMALLINT USING round(soc_percent * 100),
+    ALTER COLUMN voltage_v TYPE INTEGER USING round(voltage_v * 100),
+    ALTER COLUMN current_a TYPE SMALLINT USING round(current_a * 100),
+    ALTER COLUMN temp_c TYPE SMALLINT USING round(temp_c * 100);
+
+ALTER TABLE telemetry_hourly
+    ALTER COLUMN soc_percent_sum TYPE BIGINT USING round(soc_percent_sum * 100),
+    ALTER COLUMN soc_percent_min TYPE SMALLINT USING round(soc_percent_min * 100),
+    ALTER COLUMN soc_percent_max TYPE SMALLINT USING round(soc_percent_max * 100),
+    ALTER COLUMN voltage_v_sum TYPE BIGINT USING round(voltage_v_sum * 100),
+    ALTER COLUMN voltage_v_min TYPE INTEGER USING round(voltage_v_min * 100),
+    ALTER COLUMN voltage_v_max TYPE INTEGER USING round(voltage_v_max * 100),
+    ALTER COLUMN current_a_sum TYPE BIGINT USING round(current_a_sum * 100),
+    ALTER COLUMN current_a_min TYPE SMALLINT USING round(current_a_min * 100),
+    ALTER COLUMN current_a_max TYPE SMALLINT USING round(current_a_max * 100),
+    ALTER COLUMN temp_c_sum TYPE BIGINT USING round(temp_c_sum * 100),
+    ALTER COLUMN temp_c_min TYPE SMALLINT USING round(temp_c_min * 100),
+    ALTER COLUMN temp_c_max TYPE SMALLINT USING round(temp_c_max * 100);
+
+ALTER TABLE telemetry_daily
+    ALTER COLUMN soc_percent_sum TYPE BIGINT USING round(soc_percent_sum * 100),
+    ALTER COLUMN soc_percent_min TYPE SMALLINT USING round(soc_percent_min * 100),
+    ALTER COLUMN soc_percent_max TYPE SMALLINT USING round(soc_percent_max * 100),
+    ALTER COLUMN voltage_v_sum TYPE BIGINT USING round(voltage_v_sum * 100),
+    ALTER COLUMN voltage_v_min TYPE INTEGER USING round(voltage_v_min * 100),
+    ALTER COLUMN voltage_v_max TYPE INTEGER USING round(voltage_v_max * 100),
+    ALTER COLUMN current_a_sum TYPE BIGINT USING round(current_a_sum * 100),
+    ALTER COLUMN current_a_min TYPE SMALLINT USING round(current_a_min * 100),
+    ALTER COLUMN current_a_max TYPE SMALLINT USING round(current_a_max * 100),
+    ALTER COLUMN temp_c_sum TYPE BIGINT USING round(temp_c_sum * 100),
+    ALTER COLUMN temp_c_min TYPE SMALLINT USING round(temp_c_min * 100),
+    ALTER COLUMN temp_c_max TYPE SMALLINT USING round(temp_c_max * 100);
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Offline detection becomes a devices.status transition (online -> offline, back to online on a
+-- newer sample) instead of comparing against alert history. Devices already alerted for their
+-- current offline period are marked offline first so the new worker does not alert them again;
+-- the 60 second tolerance matches the previous worker's deduplication.
+-- Run outside a transaction: psql -d battery_telemetry -f migrations/004_device_status_transitions.sql
+
+UPDATE devices d
+SET status = 'offline'
+WHERE status = 'online'
+  AND EXISTS (
+      SELECT 1 FROM alerts a
+      WHERE a.device_id = d.device_id
+        AND a.last_seen >= d.last_seen - INTERVAL '60 seconds'
+  );
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_devices_online_last_seen
+    ON devices (last_seen) WHERE status = 'online';
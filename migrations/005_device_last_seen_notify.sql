@@ -0,0 +1,31 @@
+-- Publish devices.last_seen changes on the device_last_seen channel for the event-driven
+-- worker mode (WORKER_MODE=deadline). Payload: {"device_id": ..., "last_seen": ...}.
+-- Apply only for deadline mode. Notifications are queued even when no worker is listening, and
+-- at commit PostgreSQL serializes every notifying transaction on one database-wide lock, so each
+-- ingest transaction pays for it. migrations/005_device_last_seen_notify_down.sql removes them.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_device_last_seen() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'device_last_seen',
+        json_build_object('device_id', NEW.device_id, 'last_seen', NEW.last_seen)::text
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS devices_last_seen_notify_insert ON devices;
+CREATE TRIGGER devices_last_seen_notify_insert
+    AFTER INSERT ON devices
+    FOR EACH ROW EXECUTE FUNCTION notify_device_last_seen();
+
+DROP TRIGGER IF EXISTS devices_last_seen_notify_update ON devices;
+CREATE TRIGGER devices_last_seen_notify_update
+    AFTER UPDATE OF last_seen ON devices
+    FOR EACH ROW
+    WHEN (NEW.last_seen IS DISTINCT FROM OLD.last_seen)
+    EXECUTE FUNCTION notify_device_last_seen();
+
+COMMIT;
@@ -0,0 +1,11 @@
+-- Remove the devices.last_seen NOTIFY triggers of 005_device_last_seen_notify.sql, for databases
+-- running the worker in poll mode (including ones created from an older schema.sql that installed
+-- them): ingest transactions then no longer queue notifications.
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS devices_last_seen_notify_insert ON devices;
+DROP TRIGGER IF EXISTS devices_last_seen_notify_update ON devices;
+DROP FUNCTION IF EXISTS notify_device_last_seen();
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- Worker replicas split devices by shard: devices.shard (0-1023, the low 10 bits of the first
+-- three hex digits of md5(device_id), as computed by sharding.device_shard) and the lease table
+-- the replicas heartbeat into.
+-- Apply before deploying the application version that writes devices.shard. Devices created by
+-- the old version in between are picked up by re-running this file, which is idempotent; then
+-- run the final statement once no NULL shards remain.
+
+CREATE TABLE IF NOT EXISTS worker_leases (
+    worker_id VARCHAR(128) PRIMARY KEY,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+ALTER TABLE devices ADD COLUMN IF NOT EXISTS shard SMALLINT;
+
+UPDATE devices
+SET shard = ('x' || lpad(substr(md5(device_id), 1, 3), 8, '0'))::bit(32)::int % 1024
+WHERE shard IS NULL;
+
+-- ALTER TABLE devices ALTER COLUMN shard SET NOT NULL;
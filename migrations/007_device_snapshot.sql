@@ -0,0 +1,26 @@
+-- Latest reading on devices: the metrics of the sample at last_seen, kept by the devices upsert
+-- (stored like telemetry, as integer hundredths). Adding nullable columns is a metadata-only change.
+-- The backfill reads one telemetry row per device through idx_telemetry_device_timestamp; it is
+-- idempotent and only touches devices without a snapshot, so it can be re-run (or run in batches
+-- by device_id range) after deploying the version that writes the columns.
+
+ALTER TABLE devices
+    ADD COLUMN IF NOT EXISTS soc_percent SMALLINT,
+    ADD COLUMN IF NOT EXISTS voltage_v INTEGER,
+    ADD COLUMN IF NOT EXISTS current_a SMALLINT,
+    ADD COLUMN IF NOT EXISTS temp_c SMALLINT;
+
+UPDATE devices d
+SET soc_percent = t.soc_percent,
+    voltage_v = t.voltage_v,
+    current_a = t.current_a,
+    temp_c = t.temp_c
+FROM devices src
+CROSS JOIN LATERAL (
+    SELECT soc_percent, voltage_v, current_a, temp_c
+    FROM telemetry
+    WHERE telemetry.device_id = src.device_id AND telemetry.timestamp <= src.last_seen
+    ORDER BY telemetry.timestamp DESC, telemetry.id DESC
+    LIMIT 1
+) t
+WHERE d.device_id = src.device_id AND d.soc_percent IS NULL;
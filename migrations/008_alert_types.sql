@@ -0,0 +1,7 @@
+-- Metric alert rules (rules.py) write to alerts next to the worker's offline alerts: alert_type
+-- names the rule ('offline' for the existing rows, via the default) and detail holds the value
+-- that tripped it. A constant default and a nullable column are metadata-only changes.
+
+ALTER TABLE alerts
+    ADD COLUMN IF NOT EXISTS alert_type VARCHAR(32) NOT NULL DEFAULT 'offline',
+    ADD COLUMN IF NOT EXISTS detail VARCHAR(255);
@@ -0,0 +1,13 @@
+-- Cold archive (archive.py): device-months moved out of telemetry into files under ARCHIVE_DIR.
+-- Reads look up the files of a device's months here (primary key seek); rows are written by the
+-- archiver in the transaction that deletes the archived telemetry rows.
+
+CREATE TABLE IF NOT EXISTS telemetry_archives (
+    device_id VARCHAR(64) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+    month_start TIMESTAMPTZ NOT NULL,
+    generation INTEGER NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    row_count INTEGER NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (device_id, month_start)
+);
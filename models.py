@@ -1,8 +1,37 @@
 from datetime import datetime
-from decimal import Decimal
-from sqlalchemy import DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, SmallInteger, String, TypeDecorator, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
+# Metric columns shared by telemetry rows, rollups and API payloads
+METRIC_COLUMNS = ("soc_percent", "voltage_v", "current_a", "temp_c")
+# Devices hash into this many shards (sharding.device_shard) that worker replicas split between them
+DEVICE_SHARDS = 1_024
+# Metrics are stored as integer hundredths: same precision as the former NUMERIC(p, 2) columns
+METRIC_SCALE = 100
+
+
+def to_scaled(value: float) -> int:
+    """Metric value in stored units (hundredths)."""
+    return round(value * METRIC_SCALE)
+
+
+class ScaledInteger(TypeDecorator):
+    """Float metric stored as integer hundredths; binds and results are plain floats (no Decimal)."""
+
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, integer_type: type[Integer] = Integer):
+        super().__init__()
+        self.impl = integer_type()
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_scaled(value)
+
+    def process_result_value(self, value, dialect):
+        # float() also covers AVG(), which drivers may return as Decimal
+        return None if value is None else float(value) / METRIC_SCALE
+
 
 class Base(DeclarativeBase):
     pass
@@ -11,9 +40,25 @@ class Base(DeclarativeBase):
 class Device(Base):
     __tablename__ = "devices"
 
+    # Offline check: only online devices are candidates, found by last_seen
+    __table_args__ = (
+        Index(
+            "idx_devices_online_last_seen",
+            "last_seen",
+            postgresql_where=text("status = 'online'"),
+            sqlite_where=text("status = 'online'"),
+        ),
+    )
+
     device_id: Mapped[str] = mapped_column(String(64), primary_key=True)
     last_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     status: Mapped[str] = mapped_column(String(32), nullable=False, default="online")
+    shard: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    # Snapshot of the sample at last_seen, kept by the devices upsert (NULL until one arrives)
+    soc_percent: Mapped[float | None] = mapped_column(ScaledInteger(SmallInteger))
+    voltage_v: Mapped[float | None] = mapped_column(ScaledInteger(Integer))
+    current_a: Mapped[float | None] = mapped_column(ScaledInteger(SmallInteger))
+    temp_c: Mapped[float | None] = mapped_column(ScaledInteger(SmallInteger))
 
     telemetry_rows: Mapped[list["Telemetry"]] = relationship(
         "Telemetry", back_populates="device", cascade="all, delete-orphan"
@@ -32,14 +77,60 @@ class Telemetry(Base):
         String(64), ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False
     )
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
-    soc_percent: Mapped[Decimal] = mapped_column(Numeric(5, 2), nullable=False)
-    voltage_v: Mapped[Decimal] = mapped_column(Numeric(6, 2), nullable=False)
-    current_a: Mapped[Decimal] = mapped_column(Numeric(6, 2), nullable=False)
-    temp_c: Mapped[Decimal] = mapped_column(Numeric(4, 2), nullable=False)
+    soc_percent: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    voltage_v: Mapped[float] = mapped_column(ScaledInteger(Integer), nullable=False)
+    current_a: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    temp_c: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
 
     device: Mapped["Device"] = relationship("Device", back_populates="telemetry_rows")
 
 
+class RollupColumns:
+    """Per device and time bucket: sample count plus sum/min/max of every metric."""
+
+    device_id: Mapped[str] = mapped_column(
+        String(64), ForeignKey("devices.device_id", ondelete="CASCADE"), primary_key=True
+    )
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    sample_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    soc_percent_sum: Mapped[float] = mapped_column(ScaledInteger(BigInteger), nullable=False)
+    soc_percent_min: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    soc_percent_max: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    voltage_v_sum: Mapped[float] = mapped_column(ScaledInteger(BigInteger), nullable=False)
+    voltage_v_min: Mapped[float] = mapped_column(ScaledInteger(Integer), nullable=False)
+    voltage_v_max: Mapped[float] = mapped_column(ScaledInteger(Integer), nullable=False)
+    current_a_sum: Mapped[float] = mapped_column(ScaledInteger(BigInteger), nullable=False)
+    current_a_min: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    current_a_max: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    temp_c_sum: Mapped[float] = mapped_column(ScaledInteger(BigInteger), nullable=False)
+    temp_c_min: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+    temp_c_max: Mapped[float] = mapped_column(ScaledInteger(SmallInteger), nullable=False)
+
+
+class TelemetryHourly(RollupColumns, Base):
+    __tablename__ = "telemetry_hourly"
+
+
+class TelemetryDaily(RollupColumns, Base):
+    __tablename__ = "telemetry_daily"
+
+
+class TelemetryArchive(Base):
+    """Device-months moved out of telemetry into a cold archive file (archive.py)."""
+
+    __tablename__ = "telemetry_archives"
+
+    device_id: Mapped[str] = mapped_column(
+        String(64), ForeignKey("devices.device_id", ondelete="CASCADE"), primary_key=True
+    )
+    month_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Relative to ARCHIVE_DIR
+    path: Mapped[str] = mapped_column(String(255), nullable=False)
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
 class Alert(Base):
     __tablename__ = "alerts"
     __table_args__ = {"sqlite_autoincrement": True}
@@ -48,7 +139,22 @@ class Alert(Base):
     device_id: Mapped[str] = mapped_column(
         String(64), ForeignKey("devices.device_id", ondelete="CASCADE"), nullable=False
     )
+    # "offline" (worker) or the name of the metric rule that fired (rules.py)
+    alert_type: Mapped[str] = mapped_column(
+        String(32), nullable=False, default="offline", server_default="offline"
+    )
     detected_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Offline: last sample before the device went quiet; rules: the sample that tripped the rule
     last_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    detail: Mapped[str | None] = mapped_column(String(255))
 
     device: Mapped["Device"] = relationship("Device", back_populates="alerts_rows")
+
+
+class WorkerLease(Base):
+    """Live worker replicas: each renews its row; rows past expires_at are dead workers."""
+
+    __tablename__ = "worker_leases"
+
+    worker_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
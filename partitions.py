@@ -0,0 +1,163 @@
+"""
+Partition maintenance for a range-partitioned telemetry table (PostgreSQL, see
+migrations/002_partition_telemetry.sql): pre-creates monthly partitions ahead of time and
+detaches or drops partitions older than the retention period. No-op when telemetry is a plain table.
+Run: python -m partitions  (the worker also runs it periodically)
+"""
+import asyncio
+import logging
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "telemetry"
+
+_BOUND_RE = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    # None means MINVALUE / MAXVALUE
+    lower: datetime | None
+    upper: datetime | None
+
+
+@dataclass
+class PartitionPlan:
+    create: list[tuple[str, datetime, datetime]] = field(default_factory=list)
+    expire: list[str] = field(default_factory=list)
+
+
+def month_start(ts: datetime, offset: int = 0) -> datetime:
+    """First instant (UTC) of the month containing ts, shifted by offset months."""
+    ts = ts.astimezone(timezone.utc)
+    index = ts.year * 12 + ts.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARENT_TABLE}_p{start:%Y%m}"
+
+
+def parse_bound(expr: str) -> tuple[datetime | None, datetime | None]:
+    """Parse pg_get_expr(relpartbound) output: FOR VALUES FROM ('...') TO ('...')."""
+    match = _BOUND_RE.search(expr)
+    if match is None:
+        raise ValueError(f"Unsupported partition bound: {expr}")
+
+    def value(raw: str) -> datetime | None:
+        return None if raw in ("MINVALUE", "MAXVALUE") else datetime.fromisoformat(raw.strip("'"))
+
+    return value(match.group(1)), value(match.group(2))
+
+
+def plan_partitions(
+    existing: list[Partition], now: datetime, months_ahead: int, retention_months: int
+) -> PartitionPlan:
+    """
+    Months from the current one to months_ahead that no partition covers yet are created.
+    With retention_months > 0, partitions ending at or before the start of the oldest retained
+    month are expired (a partition holding any retained data is kept whole).
+    """
+    plan = PartitionPlan()
+    for offset in range(months_ahead + 1):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        overlaps = any(
+            (p.lower is None or p.lower < end) and (p.upper is None or p.upper > start) for p in existing
+        )
+        if not overlaps:
+            plan.create.append((partition_name(start), start, end))
+    if retention_months > 0:
+        cutoff = month_start(now, -retention_months)
+        plan.expire = sorted(p.name for p in existing if p.upper is not None and p.upper <= cutoff)
+    return plan
+
+
+async def list_partitions(session: AsyncSession) -> list[Partition] | None:
+    """Partitions of telemetry with their bounds, or None when telemetry is not partitioned."""
+    partitioned = await session.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:parent)"),
+        {"parent": PARENT_TABLE},
+    )
+    if partitioned.first() is None:
+        return None
+    rows = await session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:parent)"
+        ),
+        {"parent": PARENT_TABLE},
+    )
+    partitions = []
+    for name, bound in rows.all():
+        if bound == "DEFAULT":
+            continue
+        lower, upper = parse_bound(bound)
+        partitions.append(Partition(name, lower, upper))
+    return partitions
+
+
+async def maintain_partitions(
+    session_factory: async_sessionmaker[AsyncSession], now: datetime | None = None
+) -> PartitionPlan | None:
+    """Apply the partition plan for the configured look-ahead and retention; one transaction."""
+    s = database.get_settings()
+    now = now or datetime.now(timezone.utc)
+    async with session_factory() as session:
+        if session.get_bind().dialect.name != "postgresql":
+            return None
+        existing = await list_partitions(session)
+        if existing is None:
+            return None
+        plan = plan_partitions(
+            existing, now, s.telemetry_partition_months_ahead, s.telemetry_retention_months
+        )
+        for name, start, end in plan.create:
+            logger.info("Creating partition %s [%s, %s)", name, start.date(), end.date())
+            await session.execute(
+                text(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {PARENT_TABLE} '
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            )
+        for name in plan.expire:
+            logger.info("Expiring partition %s (%s)", name, s.telemetry_retention_action)
+            await session.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+            if s.telemetry_retention_action == "drop":
+                await session.execute(text(f'DROP TABLE "{name}"'))
+        await session.commit()
+    return plan
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout,
+    )
+    asyncio.run(_run())
+
+
+async def _run() -> None:
+    database.init_db()
+    try:
+        plan = await maintain_partitions(database.async_session_factory)
+        if plan is None:
+            logger.info("telemetry is not a partitioned PostgreSQL table; nothing to do")
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
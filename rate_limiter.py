@@ -1,39 +1,213 @@
-import asyncio
+"""
+Per-device rate limiting with a sliding-window counter: each device keeps the request count of the
+current and previous fixed window, and the previous count is weighted by how much of it still
+overlaps the sliding window. O(1) state and work per request.
+
+Backends:
+- memory: per process; updates never await, so no lock is needed on the event loop and
+  idle devices are evicted as they age out.
+- redis: counters live in Redis (or anything speaking its protocol), so the limit holds across
+  API replicas. One pipelined round trip per request, or per batch request for all its devices.
+"""
+import logging
+import math
 import time
-from collections import defaultdict
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Protocol
+
+from redis_client import REDIS_ERRORS, RedisPool
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "ratelimit"
+
+
+class RateLimitBackend(Protocol):
+    async def is_rate_limited(self, device_id: str) -> bool:
+        """Return True if the request should be rejected (rate limited); otherwise count it."""
+        ...
+
+    async def admit(self, counts: Mapping[str, int]) -> dict[str, int]:
+        """
+        Count counts[device_id] requests per device at once (a batch) and return how many of each
+        are admitted: the first ones, up to what the limit still allows.
+        """
+        ...
+
+    async def close(self) -> None: ...
+
+
+def sliding_window_estimate(previous: int, current: int, elapsed_fraction: float) -> float:
+    """Requests in the sliding window ending now: current window plus the overlapping share of the previous."""
+    return previous * (1.0 - elapsed_fraction) + current
 
 
 class RateLimiter:
-    """In-memory sliding-window rate limiter per device_id."""
+    """In-memory sliding-window-counter rate limiter per device_id."""
 
-    __slots__ = ("_max_requests", "_window_seconds", "_store", "_lock")
+    __slots__ = ("_max_requests", "_window_seconds", "_store")
 
     def __init__(self, max_requests: int, window_seconds: float):
         self._max_requests = max_requests
         self._window_seconds = window_seconds
-        self._store: dict[str, list[float]] = defaultdict(list)
-        self._lock = asyncio.Lock()
+        # device_id -> [window index, count in that window, count in the window before it],
+        # ordered by last access so idle devices sit at the front
+        self._store: OrderedDict[str, list[int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._store)
 
     async def is_rate_limited(self, device_id: str) -> bool:
         """Return True if the request should be rejected (rate limited)."""
+        # No await between read and write: the update is atomic on the event loop
+        return self.hit(device_id, time.monotonic())
+
+    async def admit(self, counts: Mapping[str, int]) -> dict[str, int]:
         now = time.monotonic()
-        cutoff = now - self._window_seconds
-        async with self._lock:
-            timestamps = self._store[device_id]
-            timestamps[:] = [t for t in timestamps if t > cutoff]
-            if len(timestamps) >= self._max_requests:
-                return True
-            timestamps.append(now)
+        admitted = {}
+        for device_id, n in counts.items():
+            admitted[device_id] = sum(not self.hit(device_id, now) for _ in range(n))
+        return admitted
+
+    def hit(self, device_id: str, now: float) -> bool:
+        position = now / self._window_seconds
+        window = math.floor(position)
+        state = self._store.get(device_id)
+        if state is None:
+            state = self._store[device_id] = [window, 0, 0]
+        else:
+            self._store.move_to_end(device_id)
+            if state[0] != window:
+                # Roll forward; a gap of more than one window leaves nothing to carry over
+                state[2] = state[1] if state[0] == window - 1 else 0
+                state[0], state[1] = window, 0
+        self._evict_idle(window)
+        if sliding_window_estimate(state[2], state[1], position - window) >= self._max_requests:
+            return True
+        state[1] += 1
+        return False
+
+    def _evict_idle(self, window: int) -> None:
+        """Drop devices not seen for two windows: their counters can no longer affect a decision."""
+        store = self._store
+        while store:
+            device_id, state = next(iter(store.items()))
+            if state[0] >= window - 1:
+                break
+            del store[device_id]
+
+    async def close(self) -> None:
+        self._store.clear()
+
+
+class RedisRateLimiter:
+    """
+    Sliding-window counter shared through Redis: one key per device and fixed window, incremented
+    and read with the previous window's key in one pipeline; a rejected request is decremented again.
+    If Redis is unreachable requests are allowed (fail open) and logged.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_requests: int,
+        window_seconds: float,
+        pool_size: int = 4,
+        timeout_seconds: float = 0.5,
+        key_prefix: str = REDIS_KEY_PREFIX,
+    ):
+        self._max_requests = max_requests
+        self._window_seconds = window_seconds
+        self._key_prefix = key_prefix
+        # Keys outlive the window they count so the next window can still read them
+        self._expire_ms = max(1, math.ceil(window_seconds * 2_000))
+        self._pool = RedisPool(url, pool_size, timeout_seconds)
+
+    def _key(self, device_id: str, window: int) -> str:
+        return f"{self._key_prefix}:{device_id}:{window}"
+
+    async def is_rate_limited(self, device_id: str) -> bool:
+        """Return True if the request should be rejected (rate limited)."""
+        # Wall clock, so every replica agrees on window boundaries
+        position = time.time() / self._window_seconds
+        window = math.floor(position)
+        current_key = self._key(device_id, window)
+        try:
+            current, _, previous = await self._pool.execute(
+                [
+                    ("INCR", current_key),
+                    ("PEXPIRE", current_key, self._expire_ms),
+                    ("GET", self._key(device_id, window - 1)),
+                ]
+            )
+            # current includes this request; the decision is made on the count before it
+            limited = (
+                sliding_window_estimate(int(previous or 0), current - 1, position - window)
+                >= self._max_requests
+            )
+            if limited:
+                await self._pool.execute([("DECR", current_key)])
+            return limited
+        except REDIS_ERRORS as exc:
+            logger.warning("Rate limiter: Redis error, allowing request: %s", exc)
             return False
 
+    async def admit(self, counts: Mapping[str, int]) -> dict[str, int]:
+        """All devices of a batch in one pipeline; the rejected share is handed back in a second one."""
+        position = time.time() / self._window_seconds
+        window = math.floor(position)
+        commands = []
+        for device_id, n in counts.items():
+            current_key = self._key(device_id, window)
+            commands += [
+                ("INCRBY", current_key, n),
+                ("PEXPIRE", current_key, self._expire_ms),
+                ("GET", self._key(device_id, window - 1)),
+            ]
+        try:
+            replies = await self._pool.execute(commands)
+            admitted, refunds = {}, []
+            for i, (device_id, n) in enumerate(counts.items()):
+                current, _, previous = replies[3 * i : 3 * i + 3]
+                # Request k of the n is admitted while the estimate before it stays under the limit
+                before = sliding_window_estimate(int(previous or 0), current - n, position - window)
+                admitted[device_id] = min(n, max(0, math.ceil(self._max_requests - before)))
+                if admitted[device_id] < n:
+                    refunds.append(("DECRBY", self._key(device_id, window), n - admitted[device_id]))
+            if refunds:
+                await self._pool.execute(refunds)
+            return admitted
+        except REDIS_ERRORS as exc:
+            logger.warning("Rate limiter: Redis error, allowing requests: %s", exc)
+            return dict(counts)
+
+    async def close(self) -> None:
+        await self._pool.close()
+
 
-_limiter: RateLimiter | None = None
+_limiter: RateLimitBackend | None = None
 
 
-def get_rate_limiter() -> RateLimiter:
+def get_rate_limiter() -> RateLimitBackend:
     global _limiter
     if _limiter is None:
         from database import get_settings
         s = get_settings()
-        _limiter = RateLimiter(s.rate_limit_requests, s.rate_limit_window_seconds)
+        if s.rate_limit_backend == "redis":
+            _limiter = RedisRateLimiter(
+                s.redis_url,
+                s.rate_limit_requests,
+                s.rate_limit_window_seconds,
+                pool_size=s.rate_limit_redis_pool_size,
+            )
+        else:
+            _limiter = RateLimiter(s.rate_limit_requests, s.rate_limit_window_seconds)
     return _limiter
+
+
+async def close_rate_limiter() -> None:
+    global _limiter
+    if _limiter is not None:
+        await _limiter.close()
+        _limiter = None
@@ -0,0 +1,139 @@
+"""
+Minimal asyncio Redis client (RESP2) with a small connection pool: pipelined commands with
+integer, status and bulk-string replies, AUTH and SELECT from the URL. No extra dependency; shared
+by the rate limiter and the cache.
+"""
+import asyncio
+from urllib.parse import unquote, urlsplit
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """One Redis connection; commands are sent as pipelines."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def open(cls, url: str, timeout: float) -> "RedisConnection":
+        parts = urlsplit(url)
+        if parts.scheme != "redis":
+            raise ValueError(f"Unsupported Redis URL scheme: {parts.scheme!r}")
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname or "localhost", parts.port or 6379), timeout
+        )
+        conn = cls(reader, writer)
+        setup = []
+        if parts.password:
+            auth = [unquote(parts.password)]
+            if parts.username:
+                auth.insert(0, unquote(parts.username))
+            setup.append(("AUTH", *auth))
+        db = parts.path.lstrip("/")
+        if db and db != "0":
+            setup.append(("SELECT", db))
+        if setup:
+            await asyncio.wait_for(conn.pipeline(setup), timeout)
+        return conn
+
+    @staticmethod
+    def encode(command: tuple) -> bytes:
+        out = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply type {kind!r}")
+
+    async def pipeline(self, commands: list[tuple]) -> list:
+        """Send all commands in one write, then read one reply per command (errors raised after all are read)."""
+        self._writer.write(b"".join(self.encode(c) for c in commands))
+        await self._writer.drain()
+        replies, error = [], None
+        for _ in commands:
+            try:
+                replies.append(await self._read_reply())
+            except RedisError as exc:
+                replies.append(None)
+                error = error or exc
+        if error is not None:
+            raise error
+        return replies
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+# What a caller should treat as "Redis unavailable"
+REDIS_ERRORS = (OSError, ConnectionError, RedisError, asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+
+class RedisPool:
+    """Up to size connections opened on demand; a connection that saw an error is discarded."""
+
+    def __init__(self, url: str, size: int = 4, timeout_seconds: float = 0.5):
+        self._url = url
+        self._timeout = timeout_seconds
+        self._idle: asyncio.LifoQueue[RedisConnection] = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(size)
+
+    async def _acquire(self) -> RedisConnection:
+        await self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        try:
+            return await RedisConnection.open(self._url, self._timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def execute(self, commands: list[tuple]) -> list:
+        """Run commands as one pipeline within the timeout; raises one of REDIS_ERRORS on failure."""
+        conn = await self._acquire()
+        healthy = False
+        try:
+            replies = await asyncio.wait_for(conn.pipeline(commands), self._timeout)
+            healthy = True
+            return replies
+        finally:
+            if healthy:
+                self._idle.put_nowait(conn)
+            else:
+                # Replies may be left unread on the socket: never reuse the connection
+                await conn.close()
+            self._slots.release()
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
@@ -0,0 +1,130 @@
+"""
+Rollup rebuild job: recomputes telemetry_hourly and telemetry_daily from raw telemetry for a range
+of whole days, live rows and archived months (archive.py) alike. Ingestion keeps the rollups
+current; run this once after creating the rollup tables on an existing database, or to repair a range.
+Run: python -m rollup --start-date YYYY-MM-DD --end-date YYYY-MM-DD [--device-id ID ...]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from archive import from_micros, read_archive, to_micros
+from ingest import ROLLUPS, upsert_rollups
+from models import METRIC_COLUMNS, METRIC_SCALE, Telemetry, TelemetryArchive
+from partitions import month_start
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_ROWS = 10_000
+
+
+async def rebuild_rollups(
+    session_factory: async_sessionmaker[AsyncSession],
+    start_date: date,
+    end_date: date,
+    device_ids: list[str] | None = None,
+    chunk_rows: int = REBUILD_CHUNK_ROWS,
+) -> int:
+    """
+    Replace the rollups of [start_date, end_date] (inclusive, UTC days) in one transaction and
+    return the number of telemetry rows folded in. Raw rows are streamed, so memory stays flat;
+    archived device-months in the range are read from their files one at a time.
+    """
+    range_start = datetime.combine(start_date, time.min, timezone.utc)
+    range_end = datetime.combine(end_date + timedelta(days=1), time.min, timezone.utc)
+    rows = 0
+    async with session_factory() as reader, session_factory() as writer:
+        for model, _seconds in ROLLUPS:
+            stmt = delete(model).where(model.bucket_start >= range_start, model.bucket_start < range_end)
+            if device_ids:
+                stmt = stmt.where(model.device_id.in_(device_ids))
+            await writer.execute(stmt)
+        query = select(
+            Telemetry.device_id,
+            Telemetry.timestamp,
+            *(getattr(Telemetry, name) for name in METRIC_COLUMNS),
+        ).where(Telemetry.timestamp >= range_start, Telemetry.timestamp < range_end)
+        if device_ids:
+            query = query.where(Telemetry.device_id.in_(device_ids))
+        result = await reader.stream(query.execution_options(yield_per=chunk_rows))
+        async for chunk in result.mappings().partitions():
+            await upsert_rollups(writer, chunk)
+            rows += len(chunk)
+        rows += await _fold_archives(reader, writer, range_start, range_end, device_ids, chunk_rows)
+        await writer.commit()
+    return rows
+
+
+async def _fold_archives(
+    reader: AsyncSession,
+    writer: AsyncSession,
+    range_start: datetime,
+    range_end: datetime,
+    device_ids: list[str] | None,
+    chunk_rows: int,
+) -> int:
+    """Fold the archived samples in [range_start, range_end) into the rollups; returns rows folded."""
+    stmt = select(TelemetryArchive.device_id, TelemetryArchive.path).where(
+        TelemetryArchive.month_start >= month_start(range_start),
+        TelemetryArchive.month_start < range_end,
+    )
+    if device_ids:
+        stmt = stmt.where(TelemetryArchive.device_id.in_(device_ids))
+    archives = (await reader.execute(stmt.order_by(TelemetryArchive.device_id, TelemetryArchive.month_start))).all()
+    if not archives:
+        return 0
+    archive_dir = database.get_settings().archive_dir
+    if not archive_dir:
+        # Rebuilding from live rows alone would drop the archived months from the rollups
+        raise ValueError("The range covers archived months: set ARCHIVE_DIR to rebuild their rollups")
+    rows = 0
+    start_us, end_us = to_micros(range_start), to_micros(range_end) - 1
+    for device_id, path in archives:
+        _first, _total, archived = await asyncio.to_thread(read_archive, Path(archive_dir) / path, start_us, end_us)
+        for start in range(0, len(archived), chunk_rows):
+            chunk = [
+                {
+                    "device_id": device_id,
+                    "timestamp": from_micros(ts),
+                    **{name: value / METRIC_SCALE for name, value in zip(METRIC_COLUMNS, metrics)},
+                }
+                for ts, *metrics in archived[start : start + chunk_rows]
+            ]
+            await upsert_rollups(writer, chunk)
+        rows += len(archived)
+    return rows
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stdout,
+    )
+    parser = argparse.ArgumentParser(description="Rebuild hourly/daily telemetry rollups for a date range")
+    parser.add_argument("--start-date", type=date.fromisoformat, required=True)
+    parser.add_argument("--end-date", type=date.fromisoformat, required=True)
+    parser.add_argument("--device-id", action="append", dest="device_ids", help="Limit to device (repeatable)")
+    args = parser.parse_args()
+    asyncio.run(_run(args.start_date, args.end_date, args.device_ids))
+
+
+async def _run(start_date: date, end_date: date, device_ids: list[str] | None) -> None:
+    database.init_db()
+    try:
+        rows = await rebuild_rollups(database.async_session_factory, start_date, end_date, device_ids)
+        logger.info("Rebuilt rollups for %s..%s from %s telemetry rows", start_date, end_date, rows)
+    finally:
+        await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Metric alert rules evaluated on the ingest path: each sample updates O(1) state per device and
+rule, and a rule that trips yields an alert written in the same transaction as the sample
+(alerts.alert_type names the rule). Threshold rules have hysteresis (fire at trigger, re-arm at
+clear); anomaly rules keep an exponentially weighted mean and variance and fire on a z-score.
+State is per process and starts empty, so with several API replicas each sees the samples it
+ingests, and a condition still present after a restart alerts once more. evaluate() works on
+copies: the state moves, and alerts are counted and logged, only once the ingest transaction
+commits (RuleEngine.committed). Devices idle for RULE_STATE_IDLE_SECONDS are forgotten.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from metrics import ALERTS_RAISED
+
+logger = logging.getLogger(__name__)
+
+# Rule state of a device that has not committed a sample for this long is dropped
+RULE_STATE_IDLE_SECONDS = 6 * 3_600
+
+
+@dataclass(frozen=True, slots=True)
+class AlertEvent:
+    device_id: str
+    alert_type: str
+    timestamp: datetime
+    detail: str
+
+
+@dataclass(frozen=True, slots=True)
+class ThresholdRule:
+    """
+    Fires when metric reaches trigger (from above when above=False) and re-arms only once it is
+    back past clear, so a value hovering at the limit alerts once.
+    """
+
+    name: str
+    metric: str
+    trigger: float
+    clear: float
+    above: bool = True
+
+    def new_state(self) -> list:
+        return [False]  # active
+
+    def update(self, state: list, value: float) -> str | None:
+        if self.above:
+            tripped, cleared = value >= self.trigger, value <= self.clear
+        else:
+            tripped, cleared = value <= self.trigger, value >= self.clear
+        if state[0]:
+            if cleared:
+                state[0] = False
+            return None
+        if tripped:
+            state[0] = True
+            return f"{self.metric}={value:g} {'>=' if self.above else '<='} {self.trigger:g}"
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class ZScoreRule:
+    """
+    Fires when a sample is more than threshold standard deviations from the exponentially weighted
+    mean of the metric (weight alpha per sample, roughly a 2/alpha - 1 sample window), after warmup
+    samples; re-arms once samples are back within half the threshold.
+    """
+
+    name: str
+    metric: str
+    alpha: float = 0.05
+    threshold: float = 4.0
+    warmup: int = 30
+
+    def new_state(self) -> list:
+        return [0, 0.0, 0.0, False]  # count, mean, variance, active
+
+    def update(self, state: list, value: float) -> str | None:
+        count, mean, variance, active = state
+        z = 0.0
+        if count >= self.warmup and variance > 0:
+            z = (value - mean) / math.sqrt(variance)
+        # Incremental EW mean/variance (West 1979)
+        diff = value - mean if count else 0.0
+        increment = self.alpha * diff
+        state[0] = count + 1
+        state[1] = mean + increment if count else value
+        state[2] = (1 - self.alpha) * (variance + diff * increment)
+        if active:
+            if abs(z) < self.threshold / 2:
+                state[3] = False
+            return None
+        if abs(z) >= self.threshold:
+            state[3] = True
+            return f"{self.metric}={value:g} z={z:.1f} (mean {mean:.2f})"
+        return None
+
+
+Rule = ThresholdRule | ZScoreRule
+
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+DEFAULT_RULES: tuple[Rule, ...] = (
+    ThresholdRule("over_temperature", "temp_c", trigger=55.0, clear=50.0),
+    ThresholdRule("deep_discharge", "soc_percent", trigger=5.0, clear=10.0, above=False),
+    ThresholdRule("voltage_sag", "voltage_v", trigger=300.0, clear=320.0, above=False),
+    ZScoreRule("temperature_anomaly", "temp_c"),
+)
+
+
+# device_id -> (timestamp of the newest evaluated sample, one state per rule)
+RuleStates = dict[str, tuple[datetime, list[list]]]
+
+
+class RuleEngine:
+    """Per-device state for every rule; evaluate() feeds it samples in timestamp order."""
+
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES, idle_seconds: float = RULE_STATE_IDLE_SECONDS):
+        self.rules = tuple(rules)
+        self._idle_seconds = idle_seconds
+        # device_id -> (newest sample timestamp, states, monotonic time of the last commit),
+        # ordered by last commit so idle devices sit at the front
+        self._devices: OrderedDict[str, tuple[datetime, list[list], float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def evaluate(self, rows: Sequence[Mapping[str, Any]]) -> tuple[list[AlertEvent], RuleStates]:
+        """
+        Run the rules over telemetry rows (device_id, timestamp, metrics) and return the alerts
+        they raise and the resulting states, to hand to committed() once the rows are stored.
+        Samples older than one already evaluated for the device are skipped: late data does not
+        move the state backwards in time.
+        """
+        events: list[AlertEvent] = []
+        pending: RuleStates = {}
+        for row in sorted(rows, key=lambda r: _as_utc(r["timestamp"])):
+            device_id, ts = row["device_id"], _as_utc(row["timestamp"])
+            entry = pending.get(device_id) or self._devices.get(device_id)
+            if entry is None:
+                states = [rule.new_state() for rule in self.rules]
+            elif ts < entry[0]:
+                continue
+            elif device_id in pending:
+                states = entry[1]
+            else:
+                states = [list(state) for state in entry[1]]
+            pending[device_id] = (ts, states)
+            for rule, state in zip(self.rules, states):
+                detail = rule.update(state, row[rule.metric])
+                if detail is not None:
+                    events.append(AlertEvent(device_id, rule.name, ts, detail))
+        return events, pending
+
+    def committed(self, pending: RuleStates, events: Sequence[AlertEvent], now: float | None = None) -> None:
+        """
+        Keep the states of a committed evaluation (unless a newer sample's state was committed
+        meanwhile), count and log its alerts, and drop devices idle for idle_seconds.
+        """
+        now = time.monotonic() if now is None else now
+        devices = self._devices
+        for device_id, (ts, states) in pending.items():
+            current = devices.get(device_id)
+            if current is not None and current[0] > ts:
+                continue
+            devices[device_id] = (ts, states, now)
+            devices.move_to_end(device_id)
+        while devices:
+            device_id, entry = next(iter(devices.items()))
+            if entry[2] >= now - self._idle_seconds:
+                break
+            del devices[device_id]
+        for event in events:
+            ALERTS_RAISED.labels(event.alert_type).inc()
+            logger.warning("[ALERT] Device %s %s - %s", event.device_id, event.alert_type, event.detail)
+
+
+def alert_values(events: Sequence[AlertEvent], detected_at: datetime) -> list[dict[str, Any]]:
+    """alerts rows for the events (last_seen is the sample that tripped the rule)."""
+    return [
+        {
+            "device_id": event.device_id,
+            "alert_type": event.alert_type,
+            "detected_at": detected_at,
+            "last_seen": event.timestamp,
+            "detail": event.detail,
+        }
+        for event in events
+    ]
+
+
+_engine: RuleEngine | None = None
+
+
+def get_rule_engine() -> RuleEngine | None:
+    """The process-wide engine with DEFAULT_RULES, or None when ALERT_RULES_ENABLED is false."""
+    global _engine
+    from database import get_settings
+    if not get_settings().alert_rules_enabled:
+        return None
+    if _engine is None:
+        _engine = RuleEngine()
+    return _engine
+
+
+def reset_rule_engine() -> None:
+    global _engine
+    _engine = None
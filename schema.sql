@@ -1,35 +1,113 @@
 -- Battery telemetry schema
 -- Run this against your PostgreSQL database to create tables and indexes.
 
--- Device metadata: last_seen and status for offline detection
+-- Device metadata: last_seen and status for offline detection, plus the latest reading
 CREATE TABLE IF NOT EXISTS devices (
     device_id VARCHAR(64) PRIMARY KEY,
     last_seen TIMESTAMPTZ NOT NULL,
-    status VARCHAR(32) NOT NULL DEFAULT 'online'
+    status VARCHAR(32) NOT NULL DEFAULT 'online',
+    -- Worker shard (0-1023) from md5(device_id), set by the application (sharding.device_shard)
+    shard SMALLINT NOT NULL,
+    -- Metrics of the sample at last_seen (integer hundredths, like telemetry), NULL until one arrives
+    soc_percent SMALLINT,
+    voltage_v INTEGER,
+    current_a SMALLINT,
+    temp_c SMALLINT
 );
 
--- Telemetry time-series: one row per sample per device
+-- Offline check: the worker scans only online devices by last_seen
+CREATE INDEX IF NOT EXISTS idx_devices_online_last_seen
+    ON devices (last_seen) WHERE status = 'online';
+
+-- The worker's deadline mode (WORKER_MODE=deadline) also needs the last_seen NOTIFY triggers of
+-- migrations/005_device_last_seen_notify.sql. They are not installed here: every notifying
+-- transaction takes a database-wide lock at commit, which poll mode should not pay on ingest.
+
+-- Telemetry time-series: one row per sample per device.
+-- Metrics are stored as integer hundredths (soc_percent 12.34 -> 1234); the API converts to floats
+-- (apply migrations/002_partition_telemetry.sql afterwards to partition it by month)
 CREATE TABLE IF NOT EXISTS telemetry (
     id BIGSERIAL PRIMARY KEY,
     device_id VARCHAR(64) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
     timestamp TIMESTAMPTZ NOT NULL,
-    soc_percent NUMERIC(5, 2) NOT NULL,
-    voltage_v NUMERIC(6, 2) NOT NULL,
-    current_a NUMERIC(6, 2) NOT NULL,
-    temp_c NUMERIC(4, 2) NOT NULL
+    soc_percent SMALLINT NOT NULL,
+    voltage_v INTEGER NOT NULL,
+    current_a SMALLINT NOT NULL,
+    temp_c SMALLINT NOT NULL
 );
 
--- Index for efficient 7-day range queries by device
+-- Index for efficient 7-day range queries by device; id makes keyset pagination a single range scan
 CREATE INDEX IF NOT EXISTS idx_telemetry_device_timestamp
-    ON telemetry (device_id, timestamp DESC);
+    ON telemetry (device_id, timestamp DESC, id DESC);
+
+-- Rollups maintained at ingest time: count, sum, min, max per metric per device per hour / UTC day.
+-- Summaries read these instead of scanning telemetry. Backfill existing data with: python -m rollup
+CREATE TABLE IF NOT EXISTS telemetry_hourly (
+    device_id VARCHAR(64) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+    bucket_start TIMESTAMPTZ NOT NULL,
+    sample_count INTEGER NOT NULL,
+    soc_percent_sum BIGINT NOT NULL,
+    soc_percent_min SMALLINT NOT NULL,
+    soc_percent_max SMALLINT NOT NULL,
+    voltage_v_sum BIGINT NOT NULL,
+    voltage_v_min INTEGER NOT NULL,
+    voltage_v_max INTEGER NOT NULL,
+    current_a_sum BIGINT NOT NULL,
+    current_a_min SMALLINT NOT NULL,
+    current_a_max SMALLINT NOT NULL,
+    temp_c_sum BIGINT NOT NULL,
+    temp_c_min SMALLINT NOT NULL,
+    temp_c_max SMALLINT NOT NULL,
+    PRIMARY KEY (device_id, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS telemetry_daily (
+    device_id VARCHAR(64) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+    bucket_start TIMESTAMPTZ NOT NULL,
+    sample_count INTEGER NOT NULL,
+    soc_percent_sum BIGINT NOT NULL,
+    soc_percent_min SMALLINT NOT NULL,
+    soc_percent_max SMALLINT NOT NULL,
+    voltage_v_sum BIGINT NOT NULL,
+    voltage_v_min INTEGER NOT NULL,
+    voltage_v_max INTEGER NOT NULL,
+    current_a_sum BIGINT NOT NULL,
+    current_a_min SMALLINT NOT NULL,
+    current_a_max SMALLINT NOT NULL,
+    temp_c_sum BIGINT NOT NULL,
+    temp_c_min SMALLINT NOT NULL,
+    temp_c_max SMALLINT NOT NULL,
+    PRIMARY KEY (device_id, bucket_start)
+);
+
+-- Cold archive: device-months moved from telemetry into files under ARCHIVE_DIR (archive.py)
+CREATE TABLE IF NOT EXISTS telemetry_archives (
+    device_id VARCHAR(64) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+    month_start TIMESTAMPTZ NOT NULL,
+    generation INTEGER NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    row_count INTEGER NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (device_id, month_start)
+);
 
--- Offline alerts: one row per detected offline event (avoids duplicate alerts)
+-- Alerts: one row per online -> offline transition of a device (worker) or metric rule trip (rules.py)
 CREATE TABLE IF NOT EXISTS alerts (
     id BIGSERIAL PRIMARY KEY,
     device_id VARCHAR(64) NOT NULL REFERENCES devices(device_id) ON DELETE CASCADE,
+    -- 'offline' (worker) or the metric rule that fired (rules.py)
+    alert_type VARCHAR(32) NOT NULL DEFAULT 'offline',
     detected_at TIMESTAMPTZ NOT NULL,
-    last_seen TIMESTAMPTZ NOT NULL
+    last_seen TIMESTAMPTZ NOT NULL,
+    detail VARCHAR(255)
 );
 
 CREATE INDEX IF NOT EXISTS idx_alerts_device_detected
     ON alerts (device_id, detected_at DESC);
+
+-- Worker replicas: one lease per live worker, renewed by heartbeats; devices are split between
+-- the unexpired workers by shard
+CREATE TABLE IF NOT EXISTS worker_leases (
+    worker_id VARCHAR(128) PRIMARY KEY,
+    expires_at TIMESTAMPTZ NOT NULL
+);
@@ -1,7 +1,11 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from pydantic import BaseModel, Field, field_validator
 import re
 
+# Samples further ahead of the server clock than this are rejected: clock skew allowance, and
+# inserts stay inside the monthly partitions of telemetry created ahead of time
+TIMESTAMP_MAX_FUTURE = timedelta(days=1)
+
 
 def _alphanumeric(v: str) -> str:
     if not v or not re.match(r"^[a-zA-Z0-9\-_]+$", v):
@@ -26,6 +30,21 @@ class TelemetryCreate(BaseModel):
     def device_id_alphanumeric(cls, v: str) -> str:
         return _alphanumeric(v)
 
+    @field_validator("timestamp")
+    @classmethod
+    def timestamp_in_stored_window(cls, v: datetime) -> datetime:
+        """Reject samples no telemetry partition would take, instead of failing the whole insert."""
+        from database import get_settings
+        from partitions import month_start
+        ts = v if v.tzinfo is not None else v.replace(tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        if ts > now + TIMESTAMP_MAX_FUTURE:
+            raise ValueError("timestamp must not be more than 1 day in the future")
+        retention_months = get_settings().telemetry_retention_months
+        if retention_months > 0 and ts < month_start(now, -retention_months):
+            raise ValueError(f"timestamp is older than the {retention_months}-month retention period")
+        return v
+
 
 class TelemetryRow(BaseModel):
     timestamp: datetime
@@ -40,6 +59,7 @@ class TelemetryRow(BaseModel):
 class TelemetryMetricsResponse(BaseModel):
     device_id: str
     data: list[TelemetryRow]
+    next_cursor: str | None = None
 
 
 class MetricSummary(BaseModel):
@@ -48,12 +68,62 @@ class MetricSummary(BaseModel):
     avg: float
 
 
+class TelemetryBucket(BaseModel):
+    timestamp: datetime
+    count: int
+    soc_percent: MetricSummary
+    voltage_v: MetricSummary
+    current_a: MetricSummary
+    temp_c: MetricSummary
+
+
+class TelemetryBucketsResponse(BaseModel):
+    device_id: str
+    resolution_seconds: int
+    buckets: list[TelemetryBucket]
+
+
 class DailySummaryResponse(BaseModel):
     device_id: str
     date: str
     summary: dict[str, MetricSummary]
 
 
+class DeviceLatest(BaseModel):
+    device_id: str
+    status: str
+    last_seen: datetime
+    latest: TelemetryRow | None = None
+
+
+class DeviceLatestResponse(BaseModel):
+    devices: list[DeviceLatest]
+    next_after: str | None = None
+
+
+class SummaryBatchRequest(BaseModel):
+    device_ids: list[str] = Field(..., min_length=1, max_length=5_000)
+    dates: list[date] = Field(..., min_length=1, max_length=31)
+
+    @field_validator("device_ids")
+    @classmethod
+    def device_ids_alphanumeric(cls, v: list[str]) -> list[str]:
+        return [_alphanumeric(device_id) for device_id in v]
+
+
+class SummaryBatchResponse(BaseModel):
+    summaries: list[DailySummaryResponse]
+    unknown_device_ids: list[str]
+
+
+class RangeSummaryResponse(BaseModel):
+    device_id: str
+    start_date: date
+    end_date: date
+    sample_count: int
+    summary: dict[str, MetricSummary]
+
+
 class ErrorDetail(BaseModel):
     loc: list[str]
     msg: str
@@ -63,3 +133,15 @@ class ErrorDetail(BaseModel):
 class ErrorResponse(BaseModel):
     detail: str
     errors: list[ErrorDetail] | None = None
+
+
+class BatchItemError(BaseModel):
+    index: int
+    detail: str
+    errors: list[ErrorDetail] | None = None
+
+
+class TelemetryBatchResponse(BaseModel):
+    accepted: int
+    rejected: list[BatchItemError]
+    rate_limited: list[int]
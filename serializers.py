@@ -0,0 +1,84 @@
+"""
+JSON encoders for metrics responses built from plain column tuples (no per-row models). The
+TypedDicts mirror the response models in schemas.py, so the bytes match what FastAPI would
+produce from the models, which remain the endpoints' response_model (OpenAPI).
+"""
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from models import METRIC_COLUMNS
+
+ROW_FIELDS = ("timestamp", *METRIC_COLUMNS)
+
+
+class TelemetryRowDict(TypedDict):
+    timestamp: datetime
+    soc_percent: float
+    voltage_v: float
+    current_a: float
+    temp_c: float
+
+
+class TelemetryColumnsDict(TypedDict):
+    timestamp: list[datetime]
+    soc_percent: list[float]
+    voltage_v: list[float]
+    current_a: list[float]
+    temp_c: list[float]
+
+
+class TelemetryMetricsPageDict(TypedDict):
+    device_id: str
+    data: list[TelemetryRowDict]
+    next_cursor: str | None
+
+
+_row_adapter = TypeAdapter(TelemetryRowDict)
+_columns_adapter = TypeAdapter(TelemetryColumnsDict)
+_page_adapter = TypeAdapter(TelemetryMetricsPageDict)
+
+
+def to_columns(rows: Sequence[Sequence[Any]]) -> dict[str, list]:
+    """Transpose (timestamp, soc, voltage, current, temp) tuples into one list per field."""
+    if not rows:
+        return {name: [] for name in ROW_FIELDS}
+    return {name: list(values) for name, values in zip(ROW_FIELDS, zip(*rows))}
+
+
+def encode_ndjson_rows(rows: Sequence[Sequence[Any]]) -> bytes:
+    """One JSON object per row, newline terminated."""
+    return b"".join(_row_adapter.dump_json(dict(zip(ROW_FIELDS, row))) + b"\n" for row in rows)
+
+
+def encode_columnar_chunk(rows: Sequence[Sequence[Any]]) -> bytes:
+    """One {"timestamp": [...], "soc_percent": [...], ...} object for the chunk, newline terminated."""
+    return _columns_adapter.dump_json(to_columns(rows)) + b"\n"
+
+
+def encode_metrics_page(device_id: str, rows: Sequence[Sequence[Any]], next_cursor: str | None) -> bytes:
+    """TelemetryMetricsResponse JSON from (timestamp, soc, voltage, current, temp, ...) tuples in one pass."""
+    data = [dict(zip(ROW_FIELDS, row)) for row in rows]
+    return _page_adapter.dump_json({"device_id": device_id, "data": data, "next_cursor": next_cursor})
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for the row after (timestamp, id)."""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
@@ -0,0 +1,105 @@
+"""
+Worker sharding: devices hash into a fixed number of shards (devices.shard) and live workers split
+the shards by rendezvous hashing over the members of the worker_leases table. Workers heartbeat
+their lease; when one stops, its lease expires and only its shards move to the survivors.
+"""
+import hashlib
+import os
+import socket
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import DEVICE_SHARDS, WorkerLease
+
+
+def device_shard(device_id: str) -> int:
+    """
+    Shard of a device: the low 10 bits of the first three hex digits of md5(device_id).
+    migrations/006_worker_sharding.sql computes the same value in SQL for the backfill.
+    """
+    digest = hashlib.md5(device_id.encode(), usedforsecurity=False).hexdigest()
+    return int(digest[:3], 16) % DEVICE_SHARDS
+
+
+def _weight(shard: int, worker_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{shard}:{worker_id}".encode(), digest_size=8).digest(), "big")
+
+
+def owned_shards(worker_id: str, members: Sequence[str]) -> frozenset[int]:
+    """Shards for which worker_id has the highest rendezvous weight among members."""
+    if worker_id not in members:
+        return frozenset()
+    if len(members) == 1:
+        return frozenset(range(DEVICE_SHARDS))
+    return frozenset(
+        shard
+        for shard in range(DEVICE_SHARDS)
+        if max(members, key=lambda member: _weight(shard, member)) == worker_id
+    )
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class ShardAssignment:
+    """The shards this worker currently owns; version increases whenever they change."""
+
+    shards: frozenset[int] = field(default_factory=lambda: frozenset(range(DEVICE_SHARDS)))
+    version: int = 0
+
+    @property
+    def owns_all(self) -> bool:
+        return len(self.shards) == DEVICE_SHARDS
+
+    def set(self, shards: frozenset[int]) -> bool:
+        if shards == self.shards:
+            return False
+        self.shards = shards
+        self.version += 1
+        return True
+
+
+class WorkerMembership:
+    """Lease row of this worker in worker_leases, and the live members read back on each heartbeat."""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        worker_id: str,
+        lease_seconds: float,
+    ):
+        self._session_factory = session_factory
+        self.worker_id = worker_id
+        self._lease = timedelta(seconds=lease_seconds)
+
+    async def heartbeat(self, now: datetime | None = None) -> list[str]:
+        """Renew (or take) this worker's lease, drop expired ones and return the live members, sorted."""
+        now = now or datetime.now(timezone.utc)
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(WorkerLease)
+                .where(WorkerLease.worker_id == self.worker_id)
+                .values(expires_at=now + self._lease)
+            )
+            if result.rowcount == 0:
+                await session.execute(
+                    insert(WorkerLease).values(worker_id=self.worker_id, expires_at=now + self._lease)
+                )
+            await session.execute(delete(WorkerLease).where(WorkerLease.expires_at <= now))
+            members = (
+                await session.execute(select(WorkerLease.worker_id).order_by(WorkerLease.worker_id))
+            ).scalars().all()
+            await session.commit()
+        return list(members)
+
+    async def leave(self) -> None:
+        """Give up the lease so the other workers take over this worker's shards right away."""
+        async with self._session_factory() as session:
+            await session.execute(delete(WorkerLease).where(WorkerLease.worker_id == self.worker_id))
+            await session.commit()
@@ -1,4 +1,4 @@
-"""Pytest fixtures. Use test DB (SQLite) and override get_session for tests that need it."""
+"""Pytest fixtures. Use test DB (SQLite) and override get_session for tests that need it; caches and alert rule state start empty."""
 import asyncio
 from collections.abc import AsyncGenerator
 
@@ -7,7 +7,10 @@ from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from starlette.testclient import TestClient
 
-from database import get_session
+import cache
+import rules
+from database import commit_session, get_read_session, get_session
+from fakes import FakeRedis
 from main import app
 from models import Base
 
@@ -59,7 +62,8 @@ def _override_get_session(session_factory):
         async with session_factory() as session:
             try:
                 yield session
-                await session.commit()
+                # As database.get_session: after_commit callbacks (caches, coalescer, rules) run
+                await commit_session(session)
             except Exception:
                 await session.rollback()
                 raise
@@ -75,8 +79,29 @@ def client():
     engine = _get_test_engine()
     sm = _get_test_sessionmaker()
     asyncio.run(_truncate_tables(engine))
+    asyncio.run(cache.close_caches())
+    rules.reset_rule_engine()
     app.dependency_overrides[get_session] = _override_get_session(sm)
+    app.dependency_overrides[get_read_session] = _override_get_session(sm)
     try:
         yield TestClient(app)
     finally:
         app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def session_factory():
+    """Sessionmaker bound to the test DB, tables truncated (for tests that bypass the HTTP client)."""
+    engine = _get_test_engine()
+    asyncio.run(_truncate_tables(engine))
+    asyncio.run(cache.close_caches())
+    rules.reset_rule_engine()
+    return _get_test_sessionmaker()
+
+
+@pytest.fixture
+async def fake_redis():
+    server = FakeRedis(password="s3cret")
+    url = await server.start()
+    yield server, url
+    await server.stop()
@@ -0,0 +1,96 @@
+"""Test doubles and sample helpers shared by the test modules."""
+import asyncio
+from datetime import datetime
+
+from database import commit_session
+from ingest import write_telemetry
+from schemas import TelemetryCreate
+
+
+def sample(device_id: str, timestamp: datetime | str, soc: float = 50.0, **metrics: float) -> TelemetryCreate:
+    """One validated sample; metrics not given default to 400 V, 0 A and 25 °C."""
+    return TelemetryCreate.model_validate(
+        {
+            "device_id": device_id,
+            "timestamp": timestamp,
+            "metrics": {"soc_percent": soc, "voltage_v": 400, "current_a": 0, "temp_c": 25, **metrics},
+        }
+    )
+
+
+async def write_samples(session_factory, items: list[TelemetryCreate]) -> None:
+    """Write samples in one transaction, bypassing the API and its rate limiter, and run the after-commit hooks."""
+    async with session_factory() as session:
+        await write_telemetry(session, items)
+        await commit_session(session)
+
+
+class FakeRedis:
+    """Local stand-in speaking just enough of the Redis protocol: AUTH, SELECT, INCR(BY), DECR(BY), GET, SET, DEL, PEXPIRE."""
+
+    def __init__(self, password: str | None = None):
+        self.password = password
+        self.data: dict[bytes, int | bytes] = {}
+        self.expiry: dict[bytes, int] = {}
+        self.commands: list[bytes] = []
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{port}/2"
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        authed = self.password is None
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                name = args[0].upper()
+                self.commands.append(name)
+                if name == b"AUTH":
+                    authed = args[-1].decode() == self.password
+                    writer.write(b"+OK\r\n" if authed else b"-WRONGPASS invalid password\r\n")
+                elif not authed:
+                    writer.write(b"-NOAUTH Authentication required.\r\n")
+                elif name == b"SELECT":
+                    writer.write(b"+OK\r\n")
+                elif name in (b"INCR", b"DECR", b"INCRBY", b"DECRBY"):
+                    amount = int(args[2]) if len(args) > 2 else 1
+                    value = self.data.get(args[1], 0) + (amount if name.startswith(b"INCR") else -amount)
+                    self.data[args[1]] = value
+                    writer.write(b":%d\r\n" % value)
+                elif name == b"SET":
+                    # Values are kept as given; SET key value PX ms
+                    self.data[args[1]] = args[2]
+                    if len(args) >= 5 and args[3].upper() == b"PX":
+                        self.expiry[args[1]] = int(args[4])
+                    writer.write(b"+OK\r\n")
+                elif name == b"DEL":
+                    removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                    writer.write(b":%d\r\n" % removed)
+                elif name == b"PEXPIRE":
+                    self.expiry[args[1]] = int(args[2])
+                    writer.write(b":1\r\n")
+                elif name == b"GET":
+                    value = self.data.get(args[1])
+                    if value is None:
+                        writer.write(b"$-1\r\n")
+                    else:
+                        raw = value if isinstance(value, bytes) else str(value).encode()
+                        writer.write(b"$%d\r\n%s\r\n" % (len(raw), raw))
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
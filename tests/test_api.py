@@ -1,4 +1,20 @@
 """API tests."""
+import asyncio
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import database
+import main
+import rate_limiter
+from database import Settings
+from fakes import sample, write_samples
+from schemas import TelemetryMetricsResponse, TelemetryRow
+from serializers import ROW_FIELDS, encode_metrics_page
 
 
 def test_health(client):
@@ -184,8 +200,10 @@ def test_get_summary_no_data_for_day(client):
         assert data["summary"][metric]["avg"] == 0
 
 
-def test_rate_limit_exceeds_per_device(client):
+def test_rate_limit_exceeds_per_device(client, monkeypatch):
     """POST /telemetry returns 429 when device exceeds rate limit (10/sec)."""
+    # Mid-window, so the requests cannot straddle a window boundary
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=lambda: 1_000.5))
     body = {
         "device_id": "rate-limit-dev",
         "timestamp": "2026-02-01T14:23:45Z",
@@ -197,3 +215,378 @@ def test_rate_limit_exceeds_per_device(client):
     r11 = client.post("/telemetry", json=body)
     assert r11.status_code == 429
     assert "rate limit" in r11.json()["detail"].lower()
+    assert 'telemetry_rate_limited_total{endpoint="telemetry"}' in client.get("/metrics").text
+
+
+def test_prometheus_metrics_exported(client):
+    """Route-templated request latency, query timings and rows returned appear on GET /metrics."""
+    body = {
+        "device_id": "prom-dev",
+        "timestamp": "2026-02-01T14:23:45Z",
+        "metrics": {"soc_percent": 50, "voltage_v": 400, "current_a": 0, "temp_c": 25},
+    }
+    assert client.post("/telemetry", json=body).status_code == 201
+    r = client.get(
+        "/devices/prom-dev/metrics",
+        params={"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z"},
+    )
+    assert r.status_code == 200
+    text = client.get("/metrics").text
+    assert 'telemetry_http_request_seconds_count{method="GET",route="/devices/{device_id}/metrics",status="200"}' in text
+    assert 'telemetry_http_request_seconds_count{method="POST",route="/telemetry",status="201"}' in text
+    assert 'telemetry_db_query_seconds_count{operation="insert"' in text
+    assert 'telemetry_metrics_rows_returned_bucket{format="json",le="1.0"}' in text
+    assert 'telemetry_phase_seconds_count{phase="write"}' in text
+
+
+def test_post_telemetry_batch_mixed(client):
+    """POST /telemetry/batch stores valid items for many devices and reports rejected ones by index."""
+    metrics = {"soc_percent": 50, "voltage_v": 400, "current_a": 0, "temp_c": 25}
+    items = [
+        {"device_id": "batch-a", "timestamp": "2026-02-01T10:00:00Z", "metrics": metrics},
+        {"device_id": "bad id!", "timestamp": "2026-02-01T10:00:00Z", "metrics": metrics},
+        {"device_id": "batch-b", "timestamp": "2026-02-01T10:00:30Z", "metrics": metrics},
+        {"device_id": "batch-a", "timestamp": "2026-02-01T10:00:30Z", "metrics": {**metrics, "soc_percent": 150}},
+        {"device_id": "batch-a", "timestamp": "2026-02-01T10:01:00Z", "metrics": {**metrics, "soc_percent": 49}},
+    ]
+    r = client.post("/telemetry/batch", json=items)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["accepted"] == 3
+    assert [e["index"] for e in body["rejected"]] == [1, 3]
+    assert any("metrics" in e["loc"] for e in body["rejected"][1]["errors"])
+    assert body["rate_limited"] == []
+
+    metrics_a = client.get(
+        "/devices/batch-a/metrics",
+        params={"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z"},
+    ).json()
+    assert [row["soc_percent"] for row in metrics_a["data"]] == [50.0, 49.0]
+    metrics_b = client.get(
+        "/devices/batch-b/metrics",
+        params={"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z"},
+    )
+    assert metrics_b.status_code == 200
+    assert len(metrics_b.json()["data"]) == 1
+
+
+def test_post_telemetry_batch_rejects_timestamps_outside_stored_window(client, monkeypatch):
+    """Samples no telemetry partition would hold are rejected per item; the rest of the batch is stored."""
+    monkeypatch.setattr(database, "_settings", Settings(telemetry_retention_months=3))
+    metrics = {"soc_percent": 50, "voltage_v": 400, "current_a": 0, "temp_c": 25}
+    now = datetime.now(timezone.utc)
+    items = [
+        {"device_id": "win-1", "timestamp": (now + timedelta(days=400)).isoformat(), "metrics": metrics},
+        {"device_id": "win-1", "timestamp": (now - timedelta(days=400)).isoformat(), "metrics": metrics},
+        {"device_id": "win-1", "timestamp": (now - timedelta(minutes=1)).isoformat(), "metrics": metrics},
+    ]
+    body = client.post("/telemetry/batch", json=items).json()
+    assert body["accepted"] == 1
+    assert [e["index"] for e in body["rejected"]] == [0, 1]
+    assert client.post("/telemetry", json=items[0]).status_code == 400
+
+
+def test_post_telemetry_batch_rate_limited(client):
+    """POST /telemetry/batch reports items beyond the per-device rate limit instead of failing the batch."""
+    metrics = {"soc_percent": 50, "voltage_v": 400, "current_a": 0, "temp_c": 25}
+    items = [
+        {"device_id": "batch-rl", "timestamp": f"2026-02-01T10:00:{i:02d}Z", "metrics": metrics}
+        for i in range(12)
+    ]
+    r = client.post("/telemetry/batch", json=items)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["accepted"] == 10
+    assert body["rate_limited"] == [10, 11]
+    assert body["rejected"] == []
+
+
+def test_get_metrics_streaming_formats(client):
+    """format=ndjson streams one row per line, format=columnar one column-oriented object per chunk."""
+    samples = [(0, 40.0), (30, 41.5), (60, 43.0)]
+    for second, soc in samples:
+        client.post(
+            "/telemetry",
+            json={
+                "device_id": "stream-dev",
+                "timestamp": f"2026-02-01T10:{second // 60:02d}:{second % 60:02d}Z",
+                "metrics": {"soc_percent": soc, "voltage_v": 385.2, "current_a": -45.3, "temp_c": 28.4},
+            },
+        )
+    params = {"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z"}
+    reference = client.get("/devices/stream-dev/metrics", params=params).json()["data"]
+
+    ndjson = client.get("/devices/stream-dev/metrics", params={**params, "format": "ndjson"})
+    assert ndjson.status_code == 200
+    assert ndjson.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert lines == reference
+
+    columnar = client.get("/devices/stream-dev/metrics", params={**params, "format": "columnar"})
+    assert columnar.status_code == 200
+    chunks = [json.loads(line) for line in columnar.text.splitlines()]
+    assert len(chunks) == 1
+    assert chunks[0]["soc_percent"] == [40.0, 41.5, 43.0]
+    assert chunks[0]["voltage_v"] == [385.2] * 3
+    assert chunks[0]["timestamp"] == [row["timestamp"] for row in reference]
+
+
+def test_get_metrics_resolution_buckets(client, session_factory):
+    """resolution returns per-bucket min/max/avg and allows ranges beyond 8 days."""
+    samples = [
+        ("2026-01-01T10:05:00Z", 10.0),
+        ("2026-01-01T10:35:00Z", 30.0),
+        ("2026-01-20T11:00:00Z", 50.0),
+    ]
+    asyncio.run(write_samples(session_factory, [sample("bucket-dev", ts, soc) for ts, soc in samples]))
+    r = client.get(
+        "/devices/bucket-dev/metrics",
+        params={"start_time": "2026-01-01T00:00:00Z", "end_time": "2026-01-31T00:00:00Z", "resolution": 3600},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["resolution_seconds"] == 3600
+    assert [b["count"] for b in body["buckets"]] == [2, 1]
+    first = body["buckets"][0]
+    assert first["timestamp"].startswith("2026-01-01T10:00:00")
+    assert first["soc_percent"] == {"min": 10.0, "max": 30.0, "avg": 20.0}
+    assert body["buckets"][1]["timestamp"].startswith("2026-01-20T11:00:00")
+
+    # Sub-hour resolutions aggregate raw telemetry instead of the hourly rollups
+    half_hour = client.get(
+        "/devices/bucket-dev/metrics",
+        params={"start_time": "2026-01-01T00:00:00Z", "end_time": "2026-01-02T00:00:00Z", "resolution": 1800},
+    ).json()
+    assert [b["soc_percent"]["avg"] for b in half_hour["buckets"]] == [10.0, 30.0]
+    assert half_hour["buckets"][1]["timestamp"].startswith("2026-01-01T10:30:00")
+
+    too_many = client.get(
+        "/devices/bucket-dev/metrics",
+        params={"start_time": "2026-01-01T00:00:00Z", "end_time": "2026-01-31T00:00:00Z", "resolution": 60},
+    )
+    assert too_many.status_code == 400
+
+
+def test_get_metrics_hour_buckets_with_unaligned_bounds(client, session_factory):
+    """Rollups serve only the hours inside the range; the partial edge hours count in-range samples only."""
+    samples = [
+        ("2026-01-01T10:05:00Z", 10.0),
+        ("2026-01-01T10:35:00Z", 30.0),
+        ("2026-01-01T11:10:00Z", 40.0),
+        ("2026-01-01T12:20:00Z", 60.0),
+        ("2026-01-01T12:50:00Z", 80.0),
+    ]
+    asyncio.run(write_samples(session_factory, [sample("edge-dev", ts, soc) for ts, soc in samples]))
+    params = {"start_time": "2026-01-01T10:30:00Z", "end_time": "2026-01-01T12:30:00Z"}
+    hourly = client.get("/devices/edge-dev/metrics", params={**params, "resolution": 3600}).json()["buckets"]
+    assert [(b["count"], b["soc_percent"]["max"]) for b in hourly] == [(1, 30.0), (1, 40.0), (1, 60.0)]
+    two_hours = client.get("/devices/edge-dev/metrics", params={**params, "resolution": 7200}).json()["buckets"]
+    assert [(b["count"], b["soc_percent"]["avg"]) for b in two_hours] == [(2, 35.0), (1, 60.0)]
+    # No whole hour inside the range: raw telemetry only
+    inside = {"start_time": "2026-01-01T10:30:00Z", "end_time": "2026-01-01T11:20:00Z", "resolution": 3600}
+    assert [b["count"] for b in client.get("/devices/edge-dev/metrics", params=inside).json()["buckets"]] == [1, 1]
+
+
+def test_get_metrics_max_points_lttb(client, session_factory):
+    """max_points keeps the endpoints and the extreme of each LTTB bucket."""
+    socs = [50.0] * 30
+    socs[7], socs[22] = 90.0, 5.0
+    samples = [sample("lttb-dev", f"2026-02-01T10:{i:02d}:00Z", soc) for i, soc in enumerate(socs)]
+    asyncio.run(write_samples(session_factory, samples))
+    r = client.get(
+        "/devices/lttb-dev/metrics",
+        params={"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z", "max_points": 4},
+    )
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert len(data) == 4
+    assert "10:00:00" in data[0]["timestamp"] and "10:29:00" in data[-1]["timestamp"]
+    assert [row["soc_percent"] for row in data[1:3]] == [90.0, 5.0]
+
+
+def test_get_metrics_max_points_refuses_capped_range(client, session_factory, monkeypatch):
+    """LTTB over a range with more than METRICS_MAX_ROWS samples is a 400, not a silently truncated shape."""
+    samples = [sample("lttb-cap", f"2026-02-01T10:{i:02d}:00Z") for i in range(6)]
+    asyncio.run(write_samples(session_factory, samples))
+    params = {"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z", "max_points": 3}
+    monkeypatch.setattr(main, "METRICS_MAX_ROWS", 5)
+    r = client.get("/devices/lttb-cap/metrics", params=params)
+    assert r.status_code == 400
+    assert "more than 5 samples" in r.json()["detail"]
+    monkeypatch.setattr(main, "METRICS_MAX_ROWS", 6)
+    assert len(client.get("/devices/lttb-cap/metrics", params=params).json()["data"]) == 3
+
+
+def test_get_summary_range(client, session_factory):
+    """GET /devices/{id}/summary/range aggregates the daily rollups of an inclusive date range."""
+    samples = [
+        ("2026-01-30T12:00:00Z", 10.0),
+        ("2026-01-31T12:00:00Z", 20.0),
+        ("2026-02-01T12:00:00Z", 60.0),
+        ("2026-02-02T12:00:00Z", 99.0),
+    ]
+    asyncio.run(write_samples(session_factory, [sample("range-dev", ts, soc) for ts, soc in samples]))
+    r = client.get(
+        "/devices/range-dev/summary/range",
+        params={"start_date": "2026-01-31", "end_date": "2026-02-01"},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["sample_count"] == 2
+    assert body["summary"]["soc_percent"] == {"min": 20.0, "max": 60.0, "avg": 40.0}
+
+    empty = client.get(
+        "/devices/range-dev/summary/range",
+        params={"start_date": "2025-01-01", "end_date": "2025-01-31"},
+    )
+    assert empty.status_code == 200
+    assert empty.json()["sample_count"] == 0
+    assert empty.json()["summary"]["voltage_v"] == {"min": 0, "max": 0, "avg": 0}
+
+    bad = client.get(
+        "/devices/range-dev/summary/range",
+        params={"start_date": "2026-02-02", "end_date": "2026-02-01"},
+    )
+    assert bad.status_code == 400
+
+
+def test_get_metrics_keyset_pagination(client, session_factory):
+    """page_size + next_cursor walk the full range exactly once, including rows sharing a timestamp."""
+    samples = [
+        ("2026-02-01T10:00:00Z", 1.0),
+        ("2026-02-01T10:00:30Z", 2.0),
+        ("2026-02-01T10:00:30Z", 3.0),
+        ("2026-02-01T10:01:00Z", 4.0),
+        ("2026-02-01T10:01:30Z", 5.0),
+    ]
+    asyncio.run(write_samples(session_factory, [sample("page-dev", ts, soc) for ts, soc in samples]))
+    params = {"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z", "page_size": 2}
+    seen, pages, cursor = [], 0, None
+    while True:
+        r = client.get("/devices/page-dev/metrics", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        body = r.json()
+        seen += [row["soc_percent"] for row in body["data"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == 3
+    assert seen == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+    bad = client.get("/devices/page-dev/metrics", params={**params, "cursor": "not-a-cursor"})
+    assert bad.status_code == 400
+    assert bad.json()["detail"] == "Invalid cursor"
+
+
+def test_metrics_page_encoding_matches_response_model(client):
+    """The tuple encoder produces the bytes the response model would, and the OpenAPI schema still names it."""
+    rows = [
+        (datetime(2026, 2, 1, 10, 0, tzinfo=timezone.utc), 67.5, 385.2, -45.3, 28.4, 1),
+        (datetime(2026, 2, 1, 10, 0, 30), 67.25, 385.0, 0.0, 28.5, 2),
+    ]
+    for next_cursor in (None, "abc"):
+        expected = TelemetryMetricsResponse(
+            device_id="enc-dev",
+            data=[TelemetryRow(**dict(zip(ROW_FIELDS, row))) for row in rows],
+            next_cursor=next_cursor,
+        ).model_dump_json()
+        assert encode_metrics_page("enc-dev", rows, next_cursor).decode() == expected
+
+    schema = client.get("/openapi.json").json()
+    response = schema["paths"]["/devices/{device_id}/metrics"]["get"]["responses"]["200"]
+    refs = json.dumps(response["content"]["application/json"]["schema"])
+    assert "TelemetryMetricsResponse" in refs and "TelemetryBucketsResponse" in refs
+
+
+def test_devices_latest_pages_by_device_id(client):
+    """GET /devices/latest returns each device's newest sample (late samples do not win), paged by device_id."""
+    metrics = {"soc_percent": 50, "voltage_v": 400, "current_a": 0, "temp_c": 25}
+    items = [
+        {"device_id": "lt-a", "timestamp": "2026-02-01T10:00:00Z", "metrics": metrics},
+        {"device_id": "lt-a", "timestamp": "2026-02-01T10:01:00Z", "metrics": {**metrics, "soc_percent": 49}},
+        {"device_id": "lt-a", "timestamp": "2026-02-01T09:00:00Z", "metrics": {**metrics, "soc_percent": 70}},
+        {"device_id": "lt-b", "timestamp": "2026-02-01T11:00:00Z", "metrics": {**metrics, "temp_c": 30}},
+        {"device_id": "lt-c", "timestamp": "2026-02-01T12:00:00Z", "metrics": metrics},
+    ]
+    assert client.post("/telemetry/batch", json=items).status_code == 200
+
+    page = client.get("/devices/latest", params={"page_size": 2}).json()
+    assert [d["device_id"] for d in page["devices"]] == ["lt-a", "lt-b"]
+    assert page["devices"][0]["latest"]["soc_percent"] == 49
+    assert page["devices"][1]["latest"]["temp_c"] == 30
+    assert page["devices"][0]["status"] == "online"
+    rest = client.get("/devices/latest", params={"page_size": 2, "after": page["next_after"]}).json()
+    assert [d["device_id"] for d in rest["devices"]] == ["lt-c"]
+    assert rest["next_after"] is None
+
+    only = client.get("/devices/latest", params=[("device_id", "lt-c"), ("device_id", "nope")]).json()
+    assert [d["device_id"] for d in only["devices"]] == ["lt-c"]
+
+
+def test_summary_batch_many_devices_and_dates(client):
+    """POST /devices/summary:batch answers every device x date pair and lists unknown devices."""
+    metrics = {"soc_percent": 50, "voltage_v": 400, "current_a": 0, "temp_c": 25}
+    items = [
+        {"device_id": "sb-a", "timestamp": "2026-02-01T10:00:00Z", "metrics": metrics},
+        {"device_id": "sb-a", "timestamp": "2026-02-01T11:00:00Z", "metrics": {**metrics, "soc_percent": 60}},
+        {"device_id": "sb-b", "timestamp": "2026-02-02T10:00:00Z", "metrics": metrics},
+    ]
+    assert client.post("/telemetry/batch", json=items).status_code == 200
+
+    r = client.post(
+        "/devices/summary:batch",
+        json={"device_ids": ["sb-b", "sb-a", "missing"], "dates": ["2026-02-02", "2026-02-01"]},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["unknown_device_ids"] == ["missing"]
+    pairs = {(s["device_id"], s["date"]): s["summary"]["soc_percent"] for s in body["summaries"]}
+    assert list(pairs) == [
+        ("sb-a", "2026-02-01"), ("sb-a", "2026-02-02"), ("sb-b", "2026-02-01"), ("sb-b", "2026-02-02"),
+    ]
+    assert pairs[("sb-a", "2026-02-01")] == {"min": 50, "max": 60, "avg": 55}
+    assert pairs[("sb-a", "2026-02-02")] == {"min": 0, "max": 0, "avg": 0}
+    # Matches the single-device endpoint
+    single = client.get("/devices/sb-b/summary", params={"date": "2026-02-02"}).json()
+    assert single in body["summaries"]
+
+    bad = client.post("/devices/summary:batch", json={"device_ids": ["bad id!"], "dates": ["2026-02-01"]})
+    assert bad.status_code == 400
+
+
+def test_export_arrow_and_parquet(client, session_factory):
+    """Export streams typed columns for the device set, by device and timestamp, in both formats."""
+    samples = [
+        sample("exp-b", "2026-02-01T00:00:00Z", 50.12),
+        sample("exp-b", "2026-02-01T00:00:30Z", 49.5),
+        sample("exp-a", "2026-02-01T00:01:00Z", 80.0),
+        sample("exp-a", "2026-02-03T00:00:00Z", 79.0),
+    ]
+    asyncio.run(write_samples(session_factory, samples))
+    params = {
+        "device_id": ["exp-b", "exp-a"],
+        "start_time": "2026-02-01T00:00:00Z",
+        "end_time": "2026-02-02T00:00:00Z",
+    }
+    arrow = client.get("/telemetry/export", params={**params, "format": "arrow"})
+    assert arrow.status_code == 200
+    assert arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(arrow.content).read_all()
+    assert table.schema.field("timestamp").type == pa.timestamp("us", tz="UTC")
+    assert table.schema.field("soc_percent").type == pa.float32()
+    assert table.column("device_id").to_pylist() == ["exp-a", "exp-b", "exp-b"]
+    assert table.column("soc_percent").to_pylist() == [80.0, pa.scalar(50.12, pa.float32()).as_py(), 49.5]
+    assert table.column("timestamp")[0].as_py() == datetime(2026, 2, 1, 0, 1, tzinfo=timezone.utc)
+
+    parquet = client.get("/telemetry/export", params=params)
+    assert parquet.status_code == 200
+    assert pq.read_table(io.BytesIO(parquet.content)).equals(table)
+
+    empty = client.get(
+        "/telemetry/export", params={**params, "end_time": "2026-02-01T00:00:00Z", "device_id": "exp-a"}
+    )
+    assert pq.read_table(io.BytesIO(empty.content)).num_rows == 0
+    unknown = client.get("/telemetry/export", params={**params, "device_id": ["exp-a", "nope"]})
+    assert unknown.status_code == 404
+    assert unknown.json()["detail"] == "Device not found: nope"
@@ -0,0 +1,162 @@
+"""Cold archive tests: file format, the archiver and transparent reads through the API."""
+import asyncio
+import io
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import func, select
+
+import archive
+import database
+from archive import (
+    archive_closed_months,
+    archive_month,
+    encode_archive,
+    read_archive,
+    remove_superseded,
+    to_micros,
+    write_archive,
+)
+from database import Settings
+from export import export_batches
+from fakes import sample, write_samples
+from models import Telemetry, TelemetryArchive, TelemetryDaily, TelemetryHourly
+from rollup import rebuild_rollups
+
+JAN = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "_settings", Settings(archive_dir=str(tmp_path), archive_after_months=1))
+    return tmp_path
+
+
+async def _count(session_factory, model) -> int:
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+def test_archive_roundtrip_reads_only_the_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_BLOCK_ROWS", 4)
+    base = to_micros(JAN)
+    rows = [(base + 30_000_000 * i, 5_000 - i, 40_025, -150, 2_500 + i % 3) for i in range(10)]
+    path = tmp_path / "dev" / "2026-01.1.tca"
+    write_archive(path, rows)
+    assert read_archive(path, 0, 2**63 - 1) == (0, 10, rows)
+    # Rows 5..8 span the second and third block
+    assert read_archive(path, rows[5][0], rows[8][0]) == (5, 10, rows[5:9])
+    assert read_archive(path, rows[-1][0] + 1, rows[-1][0] + 2) == (0, 10, [])
+    # Delta-encoded regular timestamps compress far below 24 raw bytes per row
+    many = [(base + 30_000_000 * i, 5_000, 40_000 + i % 7, -150, 2_500) for i in range(86_400)]
+    monkeypatch.setattr(archive, "ARCHIVE_BLOCK_ROWS", 4_096)
+    assert len(encode_archive(many)) < 86_400 * 2
+
+
+async def test_archiver_moves_closed_months_and_merges_late_samples(session_factory, archive_dir):
+    await write_samples(
+        session_factory, [sample("arc-1", JAN + timedelta(minutes=i), 50 + i / 100) for i in range(100)]
+    )
+    await write_samples(session_factory, [sample("arc-1", JAN + timedelta(days=31, minutes=i), 60.0) for i in range(5)])
+
+    # Only January is older than one full month before 2026-03-10
+    assert await archive_closed_months(session_factory, now=datetime(2026, 3, 10, tzinfo=timezone.utc)) == 100
+    assert await _count(session_factory, Telemetry) == 5
+    async with session_factory() as session:
+        entry = (await session.execute(select(TelemetryArchive))).scalar_one()
+    assert (entry.device_id, entry.generation, entry.row_count, entry.path) == ("arc-1", 1, 100, "arc-1/2026-01.1.tca")
+    # Nothing left to move on the next pass
+    assert await archive_closed_months(session_factory, now=datetime(2026, 3, 10, tzinfo=timezone.utc)) == 0
+
+    # A late January sample stays live until the month is re-swept, then joins a new file
+    await write_samples(session_factory, [sample("arc-1", JAN + timedelta(minutes=30, seconds=10), 1.0)])
+    assert await archive_month(session_factory, JAN) == 1
+    async with session_factory() as session:
+        entry = (await session.execute(select(TelemetryArchive))).scalar_one()
+    assert (entry.generation, entry.row_count) == (2, 101)
+    _first, _total, rows = read_archive(archive_dir / entry.path, 0, 2**63 - 1)
+    assert [row[1] for row in rows[30:33]] == [5_030, 100, 5_031]
+    # Readers may still hold the previous generation: it is only deleted once retained long enough
+    assert sorted(p.name for p in (archive_dir / "arc-1").iterdir()) == ["2026-01.1.tca", "2026-01.2.tca"]
+    now = datetime.now(timezone.utc)
+    assert await remove_superseded(session_factory, now - timedelta(hours=1)) == 0
+    assert await remove_superseded(session_factory, now + timedelta(seconds=1)) == 1
+    assert sorted(p.name for p in (archive_dir / "arc-1").iterdir()) == ["2026-01.2.tca"]
+
+
+def test_metrics_merge_archived_and_live_rows(client, session_factory, archive_dir):
+    """Pages, streams, buckets, summaries and exports read archived months as if they were live."""
+    first = JAN + timedelta(days=30, hours=23)
+    samples = [sample("arc-2", first + timedelta(minutes=i), 40 + i, voltage_v=400.25) for i in range(6)]
+    samples += [sample("arc-2", JAN + timedelta(days=31, minutes=i), 70 + i, voltage_v=400.25) for i in range(3)]
+    asyncio.run(write_samples(session_factory, samples))
+    asyncio.run(archive_month(session_factory, JAN))
+    # Late January sample, still live, with the timestamp of an archived one
+    asyncio.run(write_samples(session_factory, [sample("arc-2", first + timedelta(minutes=2), 99.0)]))
+    assert asyncio.run(_count(session_factory, Telemetry)) == 4
+
+    params = {"start_time": "2026-01-31T23:00:00Z", "end_time": "2026-02-01T01:00:00Z"}
+    expected = [40.0, 41.0, 42.0, 99.0, 43.0, 44.0, 45.0, 70.0, 71.0, 72.0]
+    socs, cursor = [], None
+    while True:
+        page = client.get(
+            "/devices/arc-2/metrics", params={**params, "page_size": 3, **({"cursor": cursor} if cursor else {})}
+        ).json()
+        socs += [row["soc_percent"] for row in page["data"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert socs == expected
+
+    ndjson = client.get("/devices/arc-2/metrics", params={**params, "format": "ndjson"})
+    assert [json.loads(line)["soc_percent"] for line in ndjson.text.splitlines()] == expected
+    assert json.loads(ndjson.text.splitlines()[0])["voltage_v"] == 400.25
+
+    buckets = client.get("/devices/arc-2/metrics", params={**params, "resolution": 1_800}).json()["buckets"]
+    assert [(b["count"], b["soc_percent"]["max"]) for b in buckets] == [(7, 99.0), (3, 72.0)]
+    assert buckets[0]["soc_percent"]["avg"] == pytest.approx((40 + 41 + 42 + 99 + 43 + 44 + 45) / 7)
+
+    summary = client.get("/devices/arc-2/summary", params={"date": "2026-01-31"}).json()
+    assert summary["summary"]["soc_percent"]["max"] == 99.0
+
+    export = client.get("/telemetry/export", params={**params, "device_id": "arc-2"})
+    assert pq.read_table(io.BytesIO(export.content)).column("soc_percent").to_pylist() == expected
+
+
+async def test_export_normalizes_naive_bounds_over_archived_months(session_factory, archive_dir):
+    await write_samples(
+        session_factory, [sample("arc-4", JAN + timedelta(days=30, hours=i), 50.0 + i) for i in range(3)]
+    )
+    await write_samples(
+        session_factory, [sample("arc-4", JAN + timedelta(days=31, hours=i), 60.0 + i) for i in range(3)]
+    )
+    await archive_month(session_factory, JAN)
+    # Naive bounds are UTC, as for the HTTP endpoints
+    start, end = datetime(2026, 1, 31, 1), datetime(2026, 2, 1, 1)
+    async with session_factory() as session:
+        batches = [batch async for batch in export_batches(session, ["arc-4"], start, end)]
+    assert [soc for batch in batches for soc in batch.column("soc_percent").to_pylist()] == [51.0, 52.0, 60.0, 61.0]
+
+
+async def test_rollup_rebuild_folds_archived_months(session_factory, archive_dir, monkeypatch):
+    """Rebuilding a range with archived months recomputes their rollups from the files too."""
+    await write_samples(session_factory, [sample("arc-3", JAN + timedelta(hours=i), 50.0 + i) for i in range(30)])
+    await archive_month(session_factory, JAN)
+    await write_samples(session_factory, [sample("arc-3", JAN + timedelta(hours=2, minutes=30), 10.0)])
+
+    async def rollups():
+        async with session_factory() as session:
+            hourly = (await session.execute(select(func.sum(TelemetryHourly.sample_count)))).scalar_one()
+            daily = (await session.execute(select(TelemetryDaily).order_by(TelemetryDaily.bucket_start))).scalars()
+            return hourly, [(d.sample_count, float(d.soc_percent_sum)) for d in daily]
+
+    before = await rollups()
+    assert before[0] == 31
+    assert await rebuild_rollups(session_factory, date(2026, 1, 1), date(2026, 1, 31), chunk_rows=7) == 31
+    assert await rollups() == before
+
+    monkeypatch.setattr(database, "_settings", Settings(archive_dir=""))
+    with pytest.raises(ValueError, match="ARCHIVE_DIR"):
+        await rebuild_rollups(session_factory, date(2026, 1, 1), date(2026, 1, 1))
@@ -0,0 +1,54 @@
+"""Benchmark harness tests: percentiles, the concurrent driver, fleet seeding and the offline scenario."""
+import asyncio
+import random
+
+from sqlalchemy import func, select
+
+from bench import bench_offline, drive, percentile, sample_metrics, seed_fleet
+from models import Device, Telemetry, TelemetryDaily
+from schemas import TelemetryMetrics
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert [percentile(values, p) for p in (50, 95, 99, 100)] == [50.0, 95.0, 99.0, 100.0]
+    assert percentile([], 99) == 0.0
+
+
+def test_sample_metrics_stay_inside_schema_bounds():
+    rng = random.Random(0)
+    for _ in range(2_000):
+        TelemetryMetrics(**sample_metrics(rng))
+
+
+async def test_drive_limits_concurrency_and_counts_errors():
+    in_flight = peak = 0
+
+    async def call(index: int) -> int:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return 500 if index % 10 == 0 else 200
+
+    result = await drive(50, 4, call)
+    assert peak == 4
+    assert (result.requests, result.errors) == (50, 5)
+    assert result.status_codes == {"200": 45, "500": 5}
+    assert result.latency_ms["p50"] <= result.latency_ms["p99"] <= result.latency_ms["max"]
+
+
+async def test_seed_fleet_and_offline_scenario(session_factory):
+    stats = await seed_fleet(session_factory, devices=3, days=1)
+    assert stats["rows"] == 3 * 2_880
+    async with session_factory() as session:
+        assert (await session.execute(select(func.count()).select_from(Telemetry))).scalar_one() == 3 * 2_880
+        daily = (await session.execute(select(TelemetryDaily.sample_count))).scalars().all()
+    assert daily == [2_880] * 3
+
+    result = await bench_offline(session_factory, days=1, runs=2)
+    assert result.requests == 2
+    async with session_factory() as session:
+        statuses = (await session.execute(select(Device.status))).scalars().all()
+    assert statuses == ["offline"] * 3
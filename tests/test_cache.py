@@ -0,0 +1,122 @@
+"""Cache tests: TTL/LRU local cache, shared backend, and the summary/device caches behind the API."""
+import asyncio
+import time
+
+from cache import (
+    LocalCache,
+    ReadThroughCache,
+    RedisCacheBackend,
+    get_device_cache,
+    get_summary_cache,
+    summary_key,
+)
+from fakes import FakeRedis, sample, write_samples
+from ingest import write_telemetry
+from loader import load_files
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache("t-lru", max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a is now most recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == (1, 3, 2)
+
+
+def test_local_cache_expires_entries(monkeypatch):
+    now = time.monotonic()
+    cache = LocalCache("t-ttl", max_entries=10, ttl_seconds=5)
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("a", 1)
+    monkeypatch.setattr(time, "monotonic", lambda: now + 6)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+async def test_read_through_cache_shares_entries_between_processes():
+    server = FakeRedis()
+    url = await server.start()
+    backends = [RedisCacheBackend(url), RedisCacheBackend(url)]
+    a, b = (
+        ReadThroughCache(LocalCache("t-shared", 10, 60), backend, encode=str.encode, decode=bytes.decode)
+        for backend in backends
+    )
+    try:
+        await a.set("k", "v")
+        assert await b.get("k") == "v"
+        assert b.local.get("k") == "v"
+        await a.invalidate("k")
+        b.local.clear()
+        assert await b.get("k") is None
+    finally:
+        for backend in backends:
+            await backend.close()
+        await server.stop()
+
+
+async def test_shared_backend_down_is_a_miss():
+    server = FakeRedis()
+    url = await server.start()
+    await server.stop()
+    backend = RedisCacheBackend(url)
+    cache = ReadThroughCache(LocalCache("t-down", 10, 60), backend, encode=str.encode, decode=bytes.decode)
+    await cache.set("k", "v")  # logged, not raised
+    cache.local.clear()
+    assert await cache.get("k") is None
+
+
+def test_closed_day_summary_cached_until_late_sample(client, session_factory):
+    asyncio.run(write_samples(session_factory, [sample("cache-dev", "2026-01-10T08:00:00Z", 40.0)]))
+    params = {"date": "2026-01-10"}
+    first = client.get("/devices/cache-dev/summary", params=params).json()
+    assert first["summary"]["soc_percent"]["max"] == 40.0
+    assert get_summary_cache().local.get(summary_key("cache-dev", "2026-01-10")) is not None
+
+    # A late sample for the closed day drops the cached summary
+    asyncio.run(write_samples(session_factory, [sample("cache-dev", "2026-01-10T09:00:00Z", 60.0)]))
+    assert get_summary_cache().local.get(summary_key("cache-dev", "2026-01-10")) is None
+    second = client.get("/devices/cache-dev/summary", params=params).json()
+    assert second["summary"]["soc_percent"]["max"] == 60.0
+
+    metrics = client.get("/metrics").text
+    assert 'telemetry_cache_requests_total{cache="summary",result="miss"}' in metrics
+    assert 'telemetry_cache_requests_total{cache="device"' in metrics
+
+
+async def test_rolled_back_write_leaves_caches_alone(session_factory):
+    """The device cache and summary invalidation follow only committed writes."""
+    key = summary_key("rb-cache", "2026-01-10")
+    get_summary_cache().local.set(key, "cached")
+    async with session_factory() as session:
+        await write_telemetry(session, [sample("rb-cache", "2026-01-10T08:00:00Z", 40.0)])
+        await session.rollback()
+    assert get_device_cache().local.get("rb-cache") is None
+    assert get_summary_cache().local.get(key) == "cached"
+
+    await write_samples(session_factory, [sample("rb-cache", "2026-01-10T08:00:00Z", 40.0)])
+    assert get_device_cache().local.get("rb-cache") is True
+    assert get_summary_cache().local.get(key) is None
+
+
+def test_summary_cache_uses_normalized_date_and_late_writes_invalidate(client, session_factory, tmp_path):
+    """The cached summary carries the normalized date; API writes and backfills drop it after commit."""
+    asyncio.run(write_samples(session_factory, [sample("norm-dev", "2026-01-10T08:00:00Z", 40.0)]))
+    params = {"date": "2026-01-10"}
+    assert client.get("/devices/norm-dev/summary", params={"date": "20260110"}).json()["date"] == "2026-01-10"
+    assert client.get("/devices/norm-dev/summary", params=params).json()["date"] == "2026-01-10"
+
+    # The HTTP write path runs the after_commit callbacks like production
+    late = sample("norm-dev", "2026-01-10T09:00:00Z", 50.0).model_dump(mode="json")
+    assert client.post("/telemetry", json=late).status_code == 201
+    assert get_summary_cache().local.get(summary_key("norm-dev", "2026-01-10")) is None
+    assert client.get("/devices/norm-dev/summary", params=params).json()["summary"]["soc_percent"]["max"] == 50.0
+
+    path = tmp_path / "late.csv"
+    path.write_text(
+        "device_id,timestamp,soc_percent,voltage_v,current_a,temp_c\n"
+        "norm-dev,2026-01-10T10:00:00Z,70,400,0,25\n"
+    )
+    asyncio.run(load_files([path], session_factory))
+    assert client.get("/devices/norm-dev/summary", params=params).json()["summary"]["soc_percent"]["max"] == 70.0
@@ -0,0 +1,84 @@
+"""Database tests: read replica routing (round-robin, fallback to the primary) and pool metrics."""
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from database import ReadRouter, Settings, _session_factory, create_pooled_engine
+
+# aiosqlite fails to open a file in a directory that does not exist: an unreachable replica
+UNREACHABLE_URL = "sqlite+aiosqlite:////nonexistent-dir/replica.db"
+
+
+async def _bind(router: ReadRouter) -> AsyncEngine:
+    session = await router.open_session()
+    try:
+        await session.execute(text("SELECT 1"))
+        return session.bind
+    finally:
+        await session.close()
+
+
+async def test_round_robin_between_replicas():
+    engines = [create_async_engine("sqlite+aiosqlite:///:memory:") for _ in range(2)]
+    primary = create_async_engine("sqlite+aiosqlite:///:memory:")
+    router = ReadRouter([_session_factory(e) for e in engines], _session_factory(primary), retry_seconds=30)
+    try:
+        used = [await _bind(router) for _ in range(4)]
+    finally:
+        for engine in (*engines, primary):
+            await engine.dispose()
+    assert used == [engines[0], engines[1], engines[0], engines[1]]
+
+
+async def test_unreachable_replica_falls_back_to_primary():
+    replica = create_async_engine(UNREACHABLE_URL)
+    primary = create_async_engine("sqlite+aiosqlite:///:memory:")
+    router = ReadRouter([_session_factory(replica)], _session_factory(primary), retry_seconds=30)
+    try:
+        assert await _bind(router) is primary
+        # Skipped without a connection attempt until retry_seconds pass
+        assert [index for index, _ in router.candidates()] == [None]
+        router._unhealthy_until[0] = 0.0
+        assert [index for index, _ in router.candidates()] == [0, None]
+    finally:
+        await replica.dispose()
+        await primary.dispose()
+
+
+async def test_pool_exports_checkouts_and_timeouts(tmp_path):
+    engine = create_pooled_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        "test-pool",
+        pool_size=1,
+        max_overflow=0,
+        settings=Settings(db_pool_timeout_seconds=0.05),
+    )
+    try:
+        async with engine.connect():
+            assert REGISTRY.get_sample_value("telemetry_db_pool_checked_out", {"pool": "test-pool"}) == 1
+            with pytest.raises(PoolTimeoutError):
+                async with engine.connect():
+                    pass
+    finally:
+        await engine.dispose()
+    assert REGISTRY.get_sample_value("telemetry_db_pool_checked_out", {"pool": "test-pool"}) == 0
+    assert REGISTRY.get_sample_value("telemetry_db_pool_capacity", {"pool": "test-pool"}) == 1
+    assert REGISTRY.get_sample_value("telemetry_db_pool_timeouts_total", {"pool": "test-pool"}) == 1
+    assert REGISTRY.get_sample_value("telemetry_db_pool_checkout_seconds_count", {"pool": "test-pool"}) == 2
+
+
+async def test_query_timing_survives_failed_statements():
+    """A failing statement does not shift the start time of the statements after it."""
+    engine = create_pooled_engine("sqlite+aiosqlite:///:memory:", "timing-test", 1, 0, Settings())
+    labels = {"pool": "timing-test", "operation": "select"}
+    try:
+        async with engine.connect() as conn:
+            with pytest.raises(Exception):
+                await conn.execute(text("SELECT * FROM missing_table"))
+            await conn.execute(text("SELECT 1"))
+            assert "query_start" not in (await conn.get_raw_connection()).info
+    finally:
+        await engine.dispose()
+    assert REGISTRY.get_sample_value("telemetry_db_query_seconds_count", labels) == 1
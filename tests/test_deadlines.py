@@ -0,0 +1,43 @@
+"""Deadline heap and last_seen notification payload tests."""
+from datetime import datetime, timedelta, timezone
+
+from deadlines import DeadlineHeap, parse_last_seen_payload
+
+T0 = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_heap_pops_due_in_deadline_order():
+    heap = DeadlineHeap()
+    for key, minutes in (("c", 3), ("a", 1), ("b", 2), ("d", 10)):
+        heap.push(key, T0 + timedelta(minutes=minutes))
+    assert heap.next_deadline() == T0 + timedelta(minutes=1)
+    assert [k for k, _ in heap.pop_due(T0 + timedelta(minutes=5), limit=10)] == ["a", "b", "c"]
+    assert len(heap) == 1
+    assert heap.pop_due(T0 + timedelta(minutes=5), limit=10) == []
+
+
+def test_heap_only_moves_deadlines_forward():
+    heap = DeadlineHeap()
+    heap.push("a", T0 + timedelta(minutes=1))
+    assert heap.push("a", T0 + timedelta(minutes=5)) is True
+    assert heap.push("a", T0 + timedelta(minutes=2)) is False
+    # The superseded entry does not fire
+    assert heap.pop_due(T0 + timedelta(minutes=3), limit=10) == []
+    assert heap.pop_due(T0 + timedelta(minutes=5), limit=10) == [("a", T0 + timedelta(minutes=5))]
+
+
+def test_heap_limit_and_compaction():
+    heap = DeadlineHeap()
+    for step in range(5):
+        for i in range(1_000):
+            heap.push(f"k{i}", T0 + timedelta(seconds=step * 1_000 + i))
+    assert len(heap) == 1_000
+    assert len(heap._heap) <= 2 * 1_000 + 1_024
+    due = heap.pop_due(T0 + timedelta(days=1), limit=300)
+    assert [k for k, _ in due] == [f"k{i}" for i in range(300)]
+
+
+def test_parse_last_seen_payload():
+    device_id, last_seen = parse_last_seen_payload('{"device_id" : "bat-1", "last_seen" : "2026-03-01T12:00:00.5+00:00"}')
+    assert device_id == "bat-1"
+    assert last_seen == T0 + timedelta(milliseconds=500)
@@ -0,0 +1,129 @@
+"""Write path tests: device upsert and snapshot, last_seen coalescing and scaled metric storage."""
+from datetime import datetime, timezone
+
+from sqlalchemy import select, text
+
+import ingest
+from database import commit_session
+from ingest import LastSeenCoalescer, upsert_device_snapshots, upsert_devices, write_telemetry
+from models import Device, Telemetry
+from schemas import TelemetryCreate
+
+
+def _ts(hour: int) -> datetime:
+    return datetime(2026, 2, 1, hour, 0, tzinfo=timezone.utc)
+
+
+METRICS = {"soc_percent": 50.0, "voltage_v": 400.0, "current_a": -1.5, "temp_c": 25.0}
+
+
+def _body(device_id: str, hour: int) -> dict:
+    return {"device_id": device_id, "timestamp": _ts(hour).isoformat(), "metrics": METRICS}
+
+
+def _row(device_id: str, hour: int, **metrics) -> dict:
+    return {"device_id": device_id, "timestamp": _ts(hour), **METRICS, **metrics}
+
+
+async def _device(session_factory, device_id: str) -> Device:
+    async with session_factory() as session:
+        return (await session.execute(select(Device).where(Device.device_id == device_id))).scalar_one()
+
+
+async def _last_seen(session_factory, device_id: str) -> datetime:
+    return (await _device(session_factory, device_id)).last_seen
+
+
+async def test_upsert_devices_only_moves_last_seen_forward(session_factory):
+    """A late sample does not rewind devices.last_seen."""
+    async with session_factory() as session:
+        await upsert_devices(session, {"up-1": _ts(12)})
+        await upsert_devices(session, {"up-1": _ts(9), "up-2": _ts(9)})
+        await session.commit()
+    assert (await _last_seen(session_factory, "up-1")).hour == 12
+    assert (await _last_seen(session_factory, "up-2")).hour == 9
+
+    async with session_factory() as session:
+        await upsert_devices(session, {"up-1": _ts(13)})
+        await session.commit()
+    assert (await _last_seen(session_factory, "up-1")).hour == 13
+
+
+async def test_coalescer_defers_known_devices(session_factory):
+    """First sight of a device is written immediately, later ones only on flush."""
+    coalescer = LastSeenCoalescer(session_factory, flush_interval_seconds=60)
+    first = _row("co-1", 8, soc_percent=80)
+    immediate, deferred = coalescer.split({"co-1": first})
+    assert (immediate, deferred) == ({"co-1": first}, {})
+    async with session_factory() as session:
+        await upsert_device_snapshots(session, immediate)
+        await session.commit()
+    coalescer.committed(immediate, deferred)
+
+    for row in (_row("co-1", 10, soc_percent=70), _row("co-1", 9, soc_percent=75)):
+        immediate, deferred = coalescer.split({"co-1": row})
+        assert immediate == {}
+        coalescer.committed(immediate, deferred)
+    assert (await _last_seen(session_factory, "co-1")).hour == 8
+    await coalescer.flush()
+    assert (await _last_seen(session_factory, "co-1")).hour == 10
+    assert (await _device(session_factory, "co-1")).soc_percent == 70
+
+
+async def test_coalescer_learns_devices_only_from_committed_writes(session_factory, monkeypatch):
+    """A rolled back first write leaves the device unknown, so the next write still upserts it."""
+    coalescer = LastSeenCoalescer(session_factory, flush_interval_seconds=60, max_known=2)
+    monkeypatch.setattr(ingest, "_coalescer", coalescer)
+    async with session_factory() as session:
+        await write_telemetry(session, [TelemetryCreate.model_validate(_body("rb-1", 8))])
+        await session.rollback()
+    async with session_factory() as session:
+        await write_telemetry(session, [TelemetryCreate.model_validate(_body("rb-1", 9))])
+        await commit_session(session)
+    assert (await _last_seen(session_factory, "rb-1")).hour == 9
+
+    # Bounded: the least recently seen device is forgotten and simply upserted again
+    coalescer.committed({"rb-2": _row("rb-2", 8), "rb-3": _row("rb-3", 8)}, {})
+    assert coalescer.split({"rb-1": _row("rb-1", 10)})[0] == {"rb-1": _row("rb-1", 10)}
+    assert coalescer.split({"rb-3": _row("rb-3", 10)})[0] == {}
+
+
+async def test_snapshot_follows_newest_sample(session_factory):
+    """devices keeps the metrics of the newest sample; late samples and last_seen-only upserts keep it."""
+    items = [
+        TelemetryCreate.model_validate({**_body("sn-1", 10), "metrics": {**METRICS, "soc_percent": 55.5}}),
+        TelemetryCreate.model_validate({**_body("sn-1", 9), "metrics": {**METRICS, "soc_percent": 90}}),
+    ]
+    async with session_factory() as session:
+        await write_telemetry(session, items)
+        await write_telemetry(session, [TelemetryCreate.model_validate(_body("sn-1", 8))])
+        await upsert_devices(session, {"sn-1": _ts(11)})
+        await session.commit()
+    device = await _device(session_factory, "sn-1")
+    assert (device.soc_percent, device.voltage_v, device.current_a, device.temp_c) == (55.5, 400.0, -1.5, 25.0)
+    assert device.last_seen.hour == 11
+
+    async with session_factory() as session:
+        await write_telemetry(session, [TelemetryCreate.model_validate(_body("sn-1", 12))])
+        await commit_session(session)
+    assert (await _device(session_factory, "sn-1")).soc_percent == METRICS["soc_percent"]
+
+
+async def test_metrics_stored_as_scaled_integers(session_factory):
+    """Metrics are written as integer hundredths and read back as the exact floats that were sent."""
+    item = TelemetryCreate.model_validate(
+        {
+            "device_id": "sc-1",
+            "timestamp": _ts(10).isoformat(),
+            "metrics": {"soc_percent": 12.34, "voltage_v": 499.99, "current_a": -0.07, "temp_c": 21.5},
+        }
+    )
+    async with session_factory() as session:
+        await write_telemetry(session, [item])
+        await commit_session(session)
+    async with session_factory() as session:
+        raw = (await session.execute(text("SELECT soc_percent, voltage_v, current_a, temp_c FROM telemetry"))).one()
+        row = (await session.execute(select(Telemetry))).scalar_one()
+    assert tuple(raw) == (1234, 49999, -7, 2150)
+    assert (row.soc_percent, row.voltage_v, row.current_a, row.temp_c) == (12.34, 499.99, -0.07, 21.5)
+    assert type(row.soc_percent) is float
@@ -0,0 +1,32 @@
+"""Partition planning tests (pure functions; the DDL itself needs PostgreSQL)."""
+from datetime import datetime, timezone
+
+from partitions import Partition, parse_bound, plan_partitions
+
+
+def _utc(year: int, month: int, day: int = 1) -> datetime:
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+def test_parse_bound():
+    """pg_get_expr output is parsed in any session time zone, MINVALUE/MAXVALUE become None."""
+    lower, upper = parse_bound("FOR VALUES FROM ('2026-01-01 01:00:00+01') TO ('2026-02-01 00:00:00+00')")
+    assert lower == _utc(2026, 1) and upper == _utc(2026, 2)
+    assert parse_bound("FOR VALUES FROM (MINVALUE) TO ('2026-02-01 00:00:00+00')") == (None, _utc(2026, 2))
+
+
+def test_plan_creates_missing_months_and_expires_old_partitions():
+    """Months ahead not covered by any partition are created; partitions past retention expire."""
+    existing = [
+        Partition("telemetry_legacy", None, _utc(2025, 10)),
+        Partition("telemetry_p202510", _utc(2025, 10), _utc(2025, 11)),
+        Partition("telemetry_p202601", _utc(2026, 1), _utc(2026, 2)),
+        Partition("telemetry_p202602", _utc(2026, 2), _utc(2026, 3)),
+    ]
+    plan = plan_partitions(existing, now=_utc(2026, 2, 17), months_ahead=2, retention_months=3)
+    assert [name for name, _, _ in plan.create] == ["telemetry_p202603", "telemetry_p202604"]
+    assert plan.create[0][1:] == (_utc(2026, 3), _utc(2026, 4))
+    assert plan.expire == ["telemetry_legacy", "telemetry_p202510"]
+
+    keep_all = plan_partitions(existing, now=_utc(2026, 2, 17), months_ahead=0, retention_months=0)
+    assert keep_all.create == [] and keep_all.expire == []
@@ -0,0 +1,91 @@
+"""Rate limiter tests: in-memory sliding-window counter and the Redis backend against a local stand-in."""
+import asyncio
+
+from fakes import FakeRedis
+from rate_limiter import RateLimiter, RedisRateLimiter
+
+
+def test_memory_limit_per_window():
+    limiter = RateLimiter(max_requests=3, window_seconds=1.0)
+    assert [limiter.hit("dev", 10.0 + i * 0.01) for i in range(4)] == [False, False, False, True]
+    # Other devices have their own counters
+    assert limiter.hit("other", 10.05) is False
+
+
+def test_memory_weights_previous_window():
+    """Halfway into the next window, half of the previous window's requests still count."""
+    limiter = RateLimiter(max_requests=4, window_seconds=1.0)
+    for i in range(4):
+        assert limiter.hit("dev", 10.1 + i * 0.01) is False
+    # estimate = 4 * 0.5 + current: two more fit, the third does not
+    assert [limiter.hit("dev", 11.5) for _ in range(3)] == [False, False, True]
+    # Two windows later nothing carries over
+    assert [limiter.hit("dev", 13.0) for _ in range(4)] == [False] * 4
+
+
+def test_memory_evicts_idle_devices():
+    limiter = RateLimiter(max_requests=10, window_seconds=1.0)
+    for i in range(100):
+        limiter.hit(f"dev-{i}", 5.0)
+    assert len(limiter) == 100
+    limiter.hit("dev-0", 6.2)
+    assert len(limiter) == 100  # previous window still counts
+    limiter.hit("dev-1", 7.2)
+    assert sorted(limiter._store) == ["dev-0", "dev-1"]
+
+
+async def test_redis_limit_shared_between_limiters(fake_redis):
+    """Two limiters (two API replicas) share one per-device budget."""
+    server, url = fake_redis
+    a = RedisRateLimiter(url, max_requests=4, window_seconds=60)
+    b = RedisRateLimiter(url, max_requests=4, window_seconds=60)
+    try:
+        results = [await limiter.is_rate_limited("dev") for limiter in (a, b, a, b, a, b)]
+        assert results == [False, False, False, False, True, True]
+        assert await a.is_rate_limited("other") is False
+    finally:
+        await a.close()
+        await b.close()
+    # Rejected requests are not counted, and keys expire after two windows
+    assert sorted(v for k, v in server.data.items() if k.startswith(b"ratelimit:dev:")) == [4]
+    assert set(server.expiry.values()) == {120_000}
+    assert server.commands.count(b"AUTH") == server.commands.count(b"SELECT") == 2
+
+
+async def test_admit_counts_a_batch_per_device(fake_redis):
+    """A batch is one limiter call: each device admits its first samples up to the limit."""
+    memory = RateLimiter(max_requests=4, window_seconds=60)
+    assert await memory.admit({"dev": 3, "other": 1}) == {"dev": 3, "other": 1}
+    assert await memory.admit({"dev": 3}) == {"dev": 1}
+
+    server, url = fake_redis
+    limiter = RedisRateLimiter(url, max_requests=4, window_seconds=60)
+    try:
+        assert await limiter.admit({"dev": 3, "other": 1}) == {"dev": 3, "other": 1}
+        assert server.commands.count(b"INCRBY") == 2 and server.commands.count(b"DECRBY") == 0
+        assert await limiter.admit({"dev": 3}) == {"dev": 1}
+        assert await limiter.is_rate_limited("dev") is True
+    finally:
+        await limiter.close()
+    # Only admitted samples stay counted
+    assert sorted(v for k, v in server.data.items() if k.startswith(b"ratelimit:dev:")) == [4]
+
+
+async def test_redis_concurrent_requests_reuse_pool(fake_redis):
+    server, url = fake_redis
+    limiter = RedisRateLimiter(url, max_requests=10, window_seconds=60, pool_size=2)
+    try:
+        results = await asyncio.gather(*(limiter.is_rate_limited("dev") for _ in range(15)))
+    finally:
+        await limiter.close()
+    assert results.count(False) == 10
+    assert server.commands.count(b"AUTH") <= 2
+
+
+async def test_redis_unavailable_fails_open():
+    server = FakeRedis()
+    url = await server.start()
+    await server.stop()
+    limiter = RedisRateLimiter(url, max_requests=1, window_seconds=60)
+    assert await limiter.is_rate_limited("dev") is False
+    assert await limiter.is_rate_limited("dev") is False
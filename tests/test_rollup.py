@@ -0,0 +1,48 @@
+"""Rollup maintenance and rebuild tests."""
+from datetime import date
+
+from sqlalchemy import delete, select
+
+from fakes import sample, write_samples
+from models import TelemetryDaily, TelemetryHourly
+from rollup import rebuild_rollups
+
+
+async def _rollups(session_factory):
+    async with session_factory() as session:
+        hourly = (await session.execute(select(TelemetryHourly).order_by(TelemetryHourly.bucket_start))).scalars().all()
+        daily = (await session.execute(select(TelemetryDaily).order_by(TelemetryDaily.bucket_start))).scalars().all()
+    return hourly, daily
+
+
+async def test_ingest_maintains_and_rebuild_restores_rollups(session_factory):
+    """Rollups are folded in across writes; rebuild recomputes the same rows from raw telemetry."""
+    samples = [
+        sample("roll-dev", ts, soc, current_a=-1.5)
+        for ts, soc in (
+            ("2026-02-01T10:00:00Z", 20),
+            ("2026-02-01T10:30:00Z", 60),
+            ("2026-02-01T11:15:00Z", 10),
+            ("2026-02-02T00:05:00Z", 90),
+        )
+    ]
+    await write_samples(session_factory, samples[:2])
+    await write_samples(session_factory, samples[2:])
+
+    hourly, daily = await _rollups(session_factory)
+    assert [(h.bucket_start.hour, h.sample_count) for h in hourly] == [(10, 2), (11, 1), (0, 1)]
+    assert [d.sample_count for d in daily] == [3, 1]
+    first_day = daily[0]
+    assert (float(first_day.soc_percent_min), float(first_day.soc_percent_max)) == (10.0, 60.0)
+    assert float(first_day.soc_percent_sum) == 90.0
+    assert float(first_day.current_a_sum) == -4.5
+
+    async with session_factory() as session:
+        await session.execute(delete(TelemetryHourly))
+        await session.execute(delete(TelemetryDaily))
+        await session.commit()
+    folded = await rebuild_rollups(session_factory, date(2026, 2, 1), date(2026, 2, 1))
+    assert folded == 3
+    hourly, daily = await _rollups(session_factory)
+    assert [(h.bucket_start.hour, h.sample_count) for h in hourly] == [(10, 2), (11, 1)]
+    assert [(d.sample_count, float(d.soc_percent_sum)) for d in daily] == [(3, 90.0)]
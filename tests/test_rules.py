@@ -0,0 +1,118 @@
+"""Alert rule tests: threshold hysteresis, z-score anomalies, late samples and alerts written on ingest."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import select
+
+import database
+from database import Settings, commit_session
+from ingest import write_telemetry
+from models import Alert
+from rules import AlertEvent, RuleEngine, ThresholdRule, ZScoreRule
+from schemas import TelemetryCreate
+
+T0 = datetime(2026, 2, 1, tzinfo=timezone.utc)
+METRICS = {"soc_percent": 50.0, "voltage_v": 400.0, "current_a": -1.5, "temp_c": 25.0}
+
+
+def _row(device_id: str, minute: int, **metrics) -> dict:
+    return {"device_id": device_id, "timestamp": T0 + timedelta(minutes=minute), **METRICS, **metrics}
+
+
+def _run(engine: RuleEngine, rows: list[dict]) -> list[AlertEvent]:
+    """Evaluate and commit, as a successful ingest transaction does."""
+    events, states = engine.evaluate(rows)
+    engine.committed(states, events)
+    return events
+
+
+def test_threshold_fires_once_until_cleared():
+    engine = RuleEngine([ThresholdRule("over_temperature", "temp_c", trigger=55.0, clear=50.0)])
+    temps = [40, 56, 60, 52, 56, 49, 57]
+    events = _run(engine, [_row("th-1", i, temp_c=t) for i, t in enumerate(temps)])
+    # 56 fires; 60, 52 and 56 are still active (not back at 50); 49 re-arms and 57 fires again
+    assert [(e.alert_type, e.timestamp) for e in events] == [
+        ("over_temperature", T0 + timedelta(minutes=1)),
+        ("over_temperature", T0 + timedelta(minutes=6)),
+    ]
+    assert events[0].detail == "temp_c=56 >= 55"
+
+
+def test_threshold_below_and_per_device_state():
+    engine = RuleEngine([ThresholdRule("deep_discharge", "soc_percent", trigger=5.0, clear=10.0, above=False)])
+    events = _run(engine, [_row("lo-1", 0, soc_percent=4), _row("lo-2", 0, soc_percent=30)])
+    assert [e.device_id for e in events] == ["lo-1"]
+    assert _run(engine, [_row("lo-1", 1, soc_percent=3), _row("lo-2", 1, soc_percent=5)])[0].device_id == "lo-2"
+    assert len(engine) == 2
+
+
+def test_zscore_flags_outlier_after_warmup():
+    rule = ZScoreRule("temperature_anomaly", "temp_c", warmup=30)
+    engine = RuleEngine([rule])
+    steady = [_row("z-1", i, temp_c=25 + (i % 3) * 0.5) for i in range(40)]
+    assert _run(engine, steady) == []
+    events = _run(engine, [_row("z-1", 40, temp_c=35), _row("z-1", 41, temp_c=36)])
+    assert [e.alert_type for e in events] == ["temperature_anomaly"]
+    # Early outliers are not judged: fewer than warmup samples
+    assert _run(RuleEngine([rule]), [_row("z-2", i, temp_c=25 + 10 * (i == 5)) for i in range(10)]) == []
+
+
+def test_samples_evaluated_in_time_order_and_late_ones_skipped():
+    engine = RuleEngine([ThresholdRule("over_temperature", "temp_c", trigger=55.0, clear=50.0)])
+    # Out of order in the batch: sorted, so 60 (minute 1) fires and 40 (minute 2) re-arms
+    assert len(_run(engine, [_row("o-1", 2, temp_c=40), _row("o-1", 1, temp_c=60)])) == 1
+    # Older than the newest evaluated sample: ignored
+    assert _run(engine, [_row("o-1", 0, temp_c=70)]) == []
+    assert len(_run(engine, [_row("o-1", 3, temp_c=70)])) == 1
+
+
+def test_state_and_alerts_only_move_on_commit():
+    """An evaluation that is not committed leaves the state as it was; idle devices are evicted."""
+    engine = RuleEngine([ThresholdRule("over_temperature", "temp_c", trigger=55.0, clear=50.0)], idle_seconds=60)
+    events, _states = engine.evaluate([_row("c-1", 0, temp_c=60)])
+    assert len(events) == 1 and len(engine) == 0
+    # The rolled back alert fires again; once committed the threshold stays active
+    events, states = engine.evaluate([_row("c-1", 0, temp_c=60)])
+    engine.committed(states, events, now=0.0)
+    assert engine.evaluate([_row("c-1", 1, temp_c=61)])[0] == []
+    # An older state committed late does not replace a newer one
+    _events, older = RuleEngine(engine.rules).evaluate([_row("c-1", -5, temp_c=20)])
+    engine.committed(older, [], now=1.0)
+    assert engine.evaluate([_row("c-1", 2, temp_c=61)])[0] == []
+
+    engine.committed(engine.evaluate([_row("c-2", 0, temp_c=20)])[1], [], now=30.0)
+    engine.committed({}, [], now=62.0)
+    assert len(engine) == 1  # c-1, last committed at 0.0, was idle for over 60 seconds
+
+
+@pytest.fixture
+def rules_enabled(monkeypatch):
+    monkeypatch.setattr(database, "_settings", Settings(alert_rules_enabled=True))
+
+
+async def test_rules_disabled_by_default(session_factory):
+    items = [TelemetryCreate(device_id="al-0", timestamp=T0, metrics={**METRICS, "temp_c": 57.5})]
+    async with session_factory() as session:
+        await write_telemetry(session, items)
+        await commit_session(session)
+    async with session_factory() as session:
+        assert (await session.execute(select(Alert))).scalars().all() == []
+
+
+async def test_ingest_writes_rule_alerts(session_factory, rules_enabled):
+    items = [
+        TelemetryCreate(device_id="al-1", timestamp=T0, metrics=METRICS),
+        TelemetryCreate(device_id="al-1", timestamp=T0 + timedelta(minutes=1), metrics={**METRICS, "temp_c": 57.5}),
+    ]
+    before = REGISTRY.get_sample_value("telemetry_alerts_total", {"type": "over_temperature"}) or 0
+    async with session_factory() as session:
+        await write_telemetry(session, items)
+        await commit_session(session)
+    async with session_factory() as session:
+        alerts = (await session.execute(select(Alert))).scalars().all()
+    assert [(a.device_id, a.alert_type, a.detail) for a in alerts] == [
+        ("al-1", "over_temperature", "temp_c=57.5 >= 55")
+    ]
+    assert alerts[0].last_seen.replace(tzinfo=timezone.utc) == T0 + timedelta(minutes=1)
+    assert REGISTRY.get_sample_value("telemetry_alerts_total", {"type": "over_temperature"}) == before + 1
@@ -0,0 +1,44 @@
+"""Worker sharding tests: device shards, rendezvous assignment and lease membership."""
+from datetime import datetime, timedelta, timezone
+
+from models import DEVICE_SHARDS
+from sharding import WorkerMembership, device_shard, owned_shards
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_device_shard_is_stable_and_in_range():
+    # Same value as the SQL backfill in migrations/006: md5('bat-1') starts with "036"
+    assert device_shard("bat-1") == 0x036
+    assert all(0 <= device_shard(f"dev-{i}") < DEVICE_SHARDS for i in range(1_000))
+
+
+def test_owned_shards_partition_the_keyspace():
+    members = ["w-a", "w-b", "w-c"]
+    owned = {m: owned_shards(m, members) for m in members}
+    assert sum(len(s) for s in owned.values()) == DEVICE_SHARDS
+    assert set().union(*owned.values()) == set(range(DEVICE_SHARDS))
+    # Roughly even split
+    assert all(len(s) > DEVICE_SHARDS // 5 for s in owned.values())
+    assert owned_shards("w-x", members) == frozenset()
+    assert owned_shards("w-a", ["w-a"]) == frozenset(range(DEVICE_SHARDS))
+
+
+def test_losing_a_worker_only_moves_its_shards():
+    before = {m: owned_shards(m, ["w-a", "w-b", "w-c"]) for m in ("w-a", "w-b")}
+    after = {m: owned_shards(m, ["w-a", "w-b"]) for m in ("w-a", "w-b")}
+    for m in ("w-a", "w-b"):
+        assert before[m] <= after[m]
+
+
+async def test_membership_expires_dead_workers(session_factory):
+    a = WorkerMembership(session_factory, "w-a", lease_seconds=30)
+    b = WorkerMembership(session_factory, "w-b", lease_seconds=30)
+    assert await a.heartbeat(NOW) == ["w-a"]
+    assert await b.heartbeat(NOW + timedelta(seconds=5)) == ["w-a", "w-b"]
+    # w-a keeps renewing, w-b stops: its lease runs out
+    assert await a.heartbeat(NOW + timedelta(seconds=20)) == ["w-a", "w-b"]
+    assert await a.heartbeat(NOW + timedelta(seconds=40)) == ["w-a"]
+    await b.heartbeat(NOW + timedelta(seconds=41))
+    await b.leave()
+    assert await a.heartbeat(NOW + timedelta(seconds=42)) == ["w-a"]
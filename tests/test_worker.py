@@ -0,0 +1,112 @@
+"""Offline detection tests: status transitions, one alert per offline period, batching, deadline mode."""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from ingest import upsert_devices
+from sharding import device_shard
+from models import Alert, Device
+from worker import DEADLINE_MAX_SLEEP_SECONDS, OfflineDeadlineMonitor, check_offline_devices
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+async def _statuses(session_factory) -> dict[str, str]:
+    async with session_factory() as session:
+        return dict((await session.execute(select(Device.device_id, Device.status))).all())
+
+
+async def _alert_count(session_factory) -> int:
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(Alert))).scalar_one()
+
+
+async def test_offline_alerted_once_until_device_reports(session_factory):
+    async with session_factory() as session:
+        await upsert_devices(
+            session, {"wk-stale": NOW - timedelta(minutes=30), "wk-fresh": NOW - timedelta(minutes=1)}
+        )
+        await session.commit()
+
+    assert await check_offline_devices(session_factory, now=NOW) == 1
+    assert await _statuses(session_factory) == {"wk-stale": "offline", "wk-fresh": "online"}
+    # Still offline on the next check: no new alert, whatever the alert history
+    assert await check_offline_devices(session_factory, now=NOW + timedelta(minutes=5)) == 0
+
+    # A late sample older than last_seen does not bring the device back
+    async with session_factory() as session:
+        await upsert_devices(session, {"wk-stale": NOW - timedelta(minutes=40)})
+        await session.commit()
+    assert (await _statuses(session_factory))["wk-stale"] == "offline"
+
+    # A newer sample does; going quiet again is a new offline period
+    async with session_factory() as session:
+        await upsert_devices(session, {"wk-stale": NOW})
+        await session.commit()
+    assert (await _statuses(session_factory))["wk-stale"] == "online"
+    assert await check_offline_devices(session_factory, now=NOW + timedelta(minutes=20)) == 2
+    assert await _alert_count(session_factory) == 3
+
+
+async def test_offline_check_batches_by_device_id(session_factory):
+    async with session_factory() as session:
+        await upsert_devices(session, {f"wk-{i:02d}": NOW - timedelta(hours=1) for i in range(25)})
+        await session.commit()
+
+    assert await check_offline_devices(session_factory, now=NOW, batch_size=10) == 25
+    assert set((await _statuses(session_factory)).values()) == {"offline"}
+    async with session_factory() as session:
+        alerted = (await session.execute(select(Alert.device_id).order_by(Alert.device_id))).scalars().all()
+    assert alerted == [f"wk-{i:02d}" for i in range(25)]
+
+
+async def test_deadline_monitor_fires_due_devices(session_factory):
+    async with session_factory() as session:
+        await upsert_devices(session, {"dl-1": NOW - timedelta(minutes=9), "dl-2": NOW - timedelta(minutes=5)})
+        await session.commit()
+    monitor = OfflineDeadlineMonitor(session_factory, threshold=timedelta(minutes=10))
+    await monitor.seed()
+    assert len(monitor) == 2
+    assert monitor.seconds_until_next(NOW) == DEADLINE_MAX_SLEEP_SECONDS
+    assert await monitor.fire_due(NOW) == 0
+
+    # dl-1 reports just before its deadline: the notification moves the deadline, nothing fires
+    async with session_factory() as session:
+        await upsert_devices(session, {"dl-1": NOW + timedelta(seconds=30)})
+        await session.commit()
+    monitor.on_last_seen("dl-1", NOW + timedelta(seconds=30))
+    assert await monitor.fire_due(NOW + timedelta(minutes=1, seconds=1)) == 0
+
+    assert await monitor.fire_due(NOW + timedelta(minutes=5, seconds=1)) == 1
+    assert await _statuses(session_factory) == {"dl-1": "online", "dl-2": "offline"}
+    assert await monitor.fire_due(NOW + timedelta(minutes=11)) == 1
+    assert await _alert_count(session_factory) == 2
+    assert len(monitor) == 0
+
+
+async def test_deadline_monitor_rearms_on_missed_notification(session_factory):
+    async with session_factory() as session:
+        await upsert_devices(session, {"dl-3": NOW - timedelta(minutes=10)})
+        await session.commit()
+    monitor = OfflineDeadlineMonitor(session_factory, threshold=timedelta(minutes=10))
+    await monitor.seed()
+    async with session_factory() as session:
+        await upsert_devices(session, {"dl-3": NOW})
+        await session.commit()
+    # The held deadline is stale; the stored last_seen re-arms it instead of alerting
+    assert await monitor.fire_due(NOW + timedelta(seconds=1)) == 0
+    assert len(monitor) == 1
+    assert await monitor.fire_due(NOW + timedelta(minutes=10, seconds=1)) == 1
+
+
+async def test_offline_check_limited_to_shards(session_factory):
+    device_ids = [f"sh-{i:02d}" for i in range(20)]
+    async with session_factory() as session:
+        await upsert_devices(session, {d: NOW - timedelta(hours=1) for d in device_ids})
+        await session.commit()
+    mine = {device_shard(d) for d in device_ids[:10]}
+    expected = {d for d in device_ids if device_shard(d) in mine}
+
+    assert await check_offline_devices(session_factory, now=NOW, shards=mine) == len(expected)
+    statuses = await _statuses(session_factory)
+    assert {d for d, s in statuses.items() if s == "offline"} == expected
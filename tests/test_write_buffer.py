@@ -0,0 +1,85 @@
+"""Write-behind buffer tests."""
+import asyncio
+
+from prometheus_client import REGISTRY
+from sqlalchemy import func, select
+
+import write_buffer
+from fakes import sample
+from models import Device, Telemetry
+from write_buffer import TelemetryWriteBuffer
+
+
+async def test_buffer_flushes_on_size_and_on_stop(session_factory):
+    """Flushers wait until flush_rows samples are queued and stop() writes the remainder."""
+    buffer = TelemetryWriteBuffer(session_factory, max_rows=100, flush_rows=4, flush_interval_seconds=60)
+    buffer.start()
+    for i in range(3):
+        assert buffer.offer(sample("buf-dev", f"2026-02-01T10:00:{i:02d}Z"))
+    await asyncio.sleep(0.05)
+    assert buffer.pending() == 3
+    assert buffer.offer(sample("buf-dev", "2026-02-01T10:00:03Z"))
+    await asyncio.sleep(0.05)
+    assert buffer.pending() == 0
+    for i in range(4, 6):
+        assert buffer.offer(sample("buf-dev", f"2026-02-01T10:00:{i:02d}Z"))
+    await buffer.stop()
+    assert not buffer.offer(sample("buf-dev", "2026-02-01T10:00:59Z"))
+    async with session_factory() as session:
+        count = (await session.execute(select(func.count()).select_from(Telemetry))).scalar_one()
+        device = (await session.execute(select(Device))).scalar_one()
+    assert count == 6
+    assert device.device_id == "buf-dev"
+    assert device.last_seen.second == 5
+
+
+async def test_failed_writes_retried_then_dropped_and_counted(session_factory, monkeypatch):
+    """A failing flush is retried with backoff; only a batch that fails every attempt is dropped."""
+    failures = 2
+    write = write_buffer.write_telemetry
+
+    async def flaky_write(session, items):
+        nonlocal failures
+        if failures:
+            failures -= 1
+            raise ConnectionError("database unavailable")
+        await write(session, items)
+
+    monkeypatch.setattr(write_buffer, "write_telemetry", flaky_write)
+    buffer = TelemetryWriteBuffer(
+        session_factory, max_rows=10, flush_rows=10, flush_interval_seconds=60, max_attempts=3, retry_seconds=0.001
+    )
+    dropped = REGISTRY.get_sample_value("telemetry_write_buffer_dropped_total") or 0
+    buffer.offer(sample("retry-dev", "2026-02-01T10:00:00Z"))
+    await buffer.flush()
+    async with session_factory() as session:
+        assert (await session.execute(select(func.count()).select_from(Telemetry))).scalar_one() == 1
+
+    failures = 3
+    buffer.offer(sample("retry-dev", "2026-02-01T10:00:01Z"))
+    buffer.offer(sample("retry-dev", "2026-02-01T10:00:02Z"))
+    await buffer.flush()
+    async with session_factory() as session:
+        assert (await session.execute(select(func.count()).select_from(Telemetry))).scalar_one() == 1
+    assert REGISTRY.get_sample_value("telemetry_write_buffer_dropped_total") == dropped + 2
+
+
+def test_post_telemetry_buffered(client, session_factory, monkeypatch):
+    """In buffered mode POST /telemetry returns 202 and 503 once the queue is full."""
+    buffer = TelemetryWriteBuffer(session_factory, max_rows=1, flush_rows=10, flush_interval_seconds=60)
+    monkeypatch.setattr(write_buffer, "_buffer", buffer)
+    body = sample("buf-api", "2026-02-01T10:00:00Z").model_dump(mode="json")
+    r = client.post("/telemetry", json=body)
+    assert r.status_code == 202
+    assert r.json() == {"status": "accepted"}
+    full = client.post("/telemetry", json=body)
+    assert full.status_code == 503
+    assert full.headers["retry-after"] == "1"
+
+    asyncio.run(buffer.flush())
+    metrics = client.get(
+        "/devices/buf-api/metrics",
+        params={"start_time": "2026-02-01T00:00:00Z", "end_time": "2026-02-02T00:00:00Z"},
+    )
+    assert metrics.status_code == 200
+    assert len(metrics.json()["data"]) == 1
@@ -1,17 +1,29 @@
 """
-Background worker: every 5 minutes, finds devices with no telemetry in the last 10 minutes,
-logs an offline alert and records it in the alerts table.
+Background worker: every 5 minutes (or, with WORKER_MODE=deadline, as soon as each device's
+deadline passes), moves devices with no telemetry in the last 10 minutes from
+online to offline, logging an alert and recording it in the alerts table for each transition.
+Ingestion sets a device back to online when a newer sample arrives, so each offline period
+alerts exactly once without looking at alert history. Any number of replicas can run: they
+split the devices by shard through leases in worker_leases (see sharding.py).
 Run: python -m worker
 """
 import asyncio
 import logging
 import sys
+import time
+from collections.abc import Collection, Sequence
 from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select
+from prometheus_client import start_http_server
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
 import database
-from models import Alert, Device
+from deadlines import LAST_SEEN_CHANNEL, DeadlineHeap, deadline_for, listen_last_seen
+from metrics import ALERTS_RAISED, WORKER_CYCLE_ALERTS, WORKER_CYCLE_SECONDS
+from models import DEVICE_SHARDS, Alert, Device
+from partitions import maintain_partitions
+from sharding import ShardAssignment, WorkerMembership, default_worker_id, device_shard, owned_shards
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,67 +35,302 @@ logger = logging.getLogger(__name__)
 
 OFFLINE_THRESHOLD_MINUTES = 10
 CHECK_INTERVAL_SECONDS = 5 * 60  # 5 minutes
-# Same offline period = last_seen within this many seconds (avoid duplicate alerts)
-DEDUP_LAST_SEEN_TOLERANCE_SECONDS = 60
+# Devices transitioned (and alerted) per transaction; keeps memory and lock time bounded
+OFFLINE_BATCH_SIZE = 1_000
+# Deadline mode: longest sleep between deadline checks, and wait before re-listening after an error
+DEADLINE_MAX_SLEEP_SECONDS = 1.0
+DEADLINE_RECONNECT_SECONDS = 5.0
+# Telemetry partition look-ahead / retention (no-op unless telemetry is partitioned), run by the
+# replica owning this shard
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = 6 * 60 * 60  # 6 hours
+MAINTENANCE_SHARD = 0
 
 
-async def check_offline_devices() -> None:
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=OFFLINE_THRESHOLD_MINUTES)
-    async with database.async_session_factory() as session:
+async def mark_devices_offline(
+    session: AsyncSession, device_ids: Sequence[str], cutoff: datetime
+) -> list[tuple[str, datetime]]:
+    """
+    Flip the given devices to offline if they are online and last seen before cutoff, and record
+    one alert each. Returns the (device_id, last_seen) pairs flipped, sorted by device_id. The
+    status guard makes a device that reported in the meantime (or another worker's flip) a no-op.
+    """
+    if not device_ids:
+        return []
+    result = await session.execute(
+        update(Device)
+        .where(Device.device_id.in_(device_ids), Device.status == "online", Device.last_seen < cutoff)
+        .values(status="offline")
+        .returning(Device.device_id, Device.last_seen)
+        .execution_options(synchronize_session=False)
+    )
+    flipped = sorted(result.all())
+    if flipped:
+        detected_at = datetime.now(timezone.utc)
+        await session.execute(
+            insert(Alert),
+            [
+                {"device_id": d, "alert_type": "offline", "detected_at": detected_at, "last_seen": seen}
+                for d, seen in flipped
+            ],
+        )
+    return flipped
+
+
+def log_offline_alerts(flipped: Sequence[tuple[str, datetime]]) -> None:
+    if flipped:
+        ALERTS_RAISED.labels("offline").inc(len(flipped))
+    for device_id, last_seen in flipped:
+        last_seen_str = last_seen.isoformat().replace("+00:00", "Z")
+        logger.warning("[ALERT] Device %s offline - last seen %s", device_id, last_seen_str)
+
+
+async def mark_offline_batch(
+    session: AsyncSession,
+    cutoff: datetime,
+    after: str | None,
+    batch_size: int = OFFLINE_BATCH_SIZE,
+    shards: Collection[int] | None = None,
+) -> tuple[list[tuple[str, datetime]], str | None]:
+    """
+    Apply mark_devices_offline to the next batch (by device_id, after the given one) of online
+    devices last seen before cutoff, found through the partial index on online devices, limited
+    to the given shards (None = all). Returns the flipped pairs and the device_id to continue
+    after, or None after the last batch.
+    """
+    candidates = (
+        select(Device.device_id)
+        .where(Device.status == "online", Device.last_seen < cutoff)
+        .order_by(Device.device_id)
+        .limit(batch_size)
+    )
+    if after is not None:
+        candidates = candidates.where(Device.device_id > after)
+    if shards is not None:
+        candidates = candidates.where(Device.shard.in_(sorted(shards)))
+    device_ids = (await session.execute(candidates)).scalars().all()
+    flipped = await mark_devices_offline(session, device_ids, cutoff)
+    return flipped, device_ids[-1] if len(device_ids) == batch_size else None
+
+
+async def check_offline_devices(
+    session_factory: async_sessionmaker[AsyncSession] | None = None,
+    now: datetime | None = None,
+    batch_size: int = OFFLINE_BATCH_SIZE,
+    shards: Collection[int] | None = None,
+) -> int:
+    """
+    Apply the online -> offline transition to all devices of the given shards (None = all), one
+    transaction per batch; returns alerts raised.
+    """
+    session_factory = session_factory or database.async_session_factory
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(minutes=OFFLINE_THRESHOLD_MINUTES)
+    start = time.perf_counter()
+    after = None
+    alerted = 0
+    while True:
+        async with session_factory() as session:
+            try:
+                flipped, after = await mark_offline_batch(session, cutoff, after, batch_size, shards)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        log_offline_alerts(flipped)
+        alerted += len(flipped)
+        if after is None:
+            WORKER_CYCLE_SECONDS.labels("poll").observe(time.perf_counter() - start)
+            WORKER_CYCLE_ALERTS.labels("poll").observe(alerted)
+            return alerted
+
+
+class OfflineDeadlineMonitor:
+    """
+    Event-driven offline detection (WORKER_MODE=deadline): one deadline (last_seen + threshold) per
+    online device in a DeadlineHeap, seeded from devices and moved forward by last_seen
+    notifications, so a device is flipped within about a second of its deadline and no tick scans
+    devices. Due devices go through the same transition as the periodic check. Only devices in
+    the assignment's shards are tracked; when the assignment changes the heap is re-seeded.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        threshold: timedelta = timedelta(minutes=OFFLINE_THRESHOLD_MINUTES),
+        batch_size: int = OFFLINE_BATCH_SIZE,
+        assignment: ShardAssignment | None = None,
+    ):
+        self._session_factory = session_factory
+        self._threshold = threshold
+        self._batch_size = batch_size
+        self._assignment = assignment or ShardAssignment()
+        self._seeded_version = -1
+        self._deadlines = DeadlineHeap()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def on_last_seen(self, device_id: str, last_seen: datetime) -> None:
+        if self._assignment.owns_all or device_shard(device_id) in self._assignment.shards:
+            self._deadlines.push(device_id, deadline_for(last_seen, self._threshold))
+
+    async def seed(self) -> None:
+        """Load a deadline for every online device of the owned shards (streamed, one entry per device)."""
+        self._deadlines = DeadlineHeap()
+        self._seeded_version = self._assignment.version
+        stmt = select(Device.device_id, Device.last_seen).where(Device.status == "online")
+        if not self._assignment.owns_all:
+            stmt = stmt.where(Device.shard.in_(sorted(self._assignment.shards)))
+        async with self._session_factory() as session:
+            result = await session.stream(stmt.execution_options(yield_per=self._batch_size))
+            async for rows in result.partitions():
+                for device_id, last_seen in rows:
+                    self.on_last_seen(device_id, last_seen)
+
+    def seconds_until_next(self, now: datetime | None = None) -> float:
+        next_deadline = self._deadlines.next_deadline()
+        if next_deadline is None:
+            return DEADLINE_MAX_SLEEP_SECONDS
+        now = now or datetime.now(timezone.utc)
+        return min(max((next_deadline - now).total_seconds(), 0.0), DEADLINE_MAX_SLEEP_SECONDS)
+
+    async def fire_due(self, now: datetime | None = None) -> int:
+        """Transition every device whose deadline has passed; returns alerts raised."""
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - self._threshold
+        start = time.perf_counter()
+        fired = False
+        alerted = 0
+        rearm: list[tuple[str, datetime]] = []
+        while due := self._deadlines.pop_due(now, self._batch_size):
+            fired = True
+            device_ids = [device_id for device_id, _ in due]
+            async with self._session_factory() as session:
+                try:
+                    flipped = await mark_devices_offline(session, device_ids, cutoff)
+                    # Not flipped but still online: reported after the deadline we held, so
+                    # re-arm from the stored last_seen in case its notification was missed
+                    pending = set(device_ids).difference(d for d, _ in flipped)
+                    if pending:
+                        result = await session.execute(
+                            select(Device.device_id, Device.last_seen).where(
+                                Device.device_id.in_(pending), Device.status == "online"
+                            )
+                        )
+                        rearm.extend(result.all())
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    # Retry these on the next tick
+                    for device_id, deadline in due:
+                        self._deadlines.push(device_id, deadline)
+                    raise
+            log_offline_alerts(flipped)
+            alerted += len(flipped)
+        # After the loop, so a device not yet past the strict cutoff is retried on the next tick
+        for device_id, last_seen in rearm:
+            self.on_last_seen(device_id, last_seen)
+        # Only ticks with due deadlines count as a cycle; idle ticks are once a second
+        if fired:
+            WORKER_CYCLE_SECONDS.labels("deadline").observe(time.perf_counter() - start)
+            WORKER_CYCLE_ALERTS.labels("deadline").observe(alerted)
+        return alerted
+
+    async def run(self, engine: AsyncEngine) -> None:
+        """LISTEN for last_seen updates, seed, then fire deadlines; re-seeds after losing the channel."""
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    listener = await listen_last_seen(conn, self.on_last_seen)
+                    # Seed after LISTEN so no update falls between the two
+                    await self.seed()
+                    logger.info("Tracking offline deadlines for %s online devices", len(self))
+                    while not listener.is_closed():
+                        if self._seeded_version != self._assignment.version:
+                            await self.seed()
+                            logger.info("Shards changed: tracking %s online devices", len(self))
+                        await self.fire_due()
+                        await asyncio.sleep(self.seconds_until_next())
+                logger.warning("Lost the %s notification channel, reconnecting", LAST_SEEN_CHANNEL)
+            except Exception as e:
+                logger.exception("Error in offline deadline monitor: %s", e)
+                await asyncio.sleep(DEADLINE_RECONNECT_SECONDS)
+
+
+async def _membership_loop(membership: WorkerMembership, assignment: ShardAssignment, interval: float) -> None:
+    """Heartbeat the lease and recompute the owned shards from the live members."""
+    while True:
         try:
-            result = await session.execute(
-                select(Device).where(Device.last_seen < cutoff)
-            )
-            devices = result.scalars().all()
-            if not devices:
-                return
-            device_ids = [d.device_id for d in devices]
-            # Latest alert per device (by detected_at desc)
-            alerts_result = await session.execute(
-                select(Alert).where(Alert.device_id.in_(device_ids)).order_by(Alert.detected_at.desc())
-            )
-            all_alerts = alerts_result.scalars().all()
-            latest_by_device: dict[str, Alert] = {}
-            for a in all_alerts:
-                if a.device_id not in latest_by_device:
-                    latest_by_device[a.device_id] = a
-            to_alert = []
-            for device in devices:
-                latest = latest_by_device.get(device.device_id)
-                if latest is not None:
-                    delta_sec = abs((device.last_seen - latest.last_seen).total_seconds())
-                    if delta_sec <= DEDUP_LAST_SEEN_TOLERANCE_SECONDS:
-                        continue  # already alerted for this offline period
-                to_alert.append(device)
-            for device in to_alert:
-                last_seen_str = device.last_seen.isoformat().replace("+00:00", "Z")
-                logger.warning("[ALERT] Device %s offline - last seen %s", device.device_id, last_seen_str)
-                session.add(
-                    Alert(
-                        device_id=device.device_id,
-                        detected_at=datetime.now(timezone.utc),
-                        last_seen=device.last_seen,
-                    )
+            members = await membership.heartbeat()
+            if assignment.set(owned_shards(membership.worker_id, members)):
+                logger.info(
+                    "Worker %s owns %s of %s shards (%s live workers)",
+                    membership.worker_id, len(assignment.shards), DEVICE_SHARDS, len(members),
                 )
-            if to_alert:
-                await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
+        except Exception as e:
+            logger.exception("Error during worker heartbeat: %s", e)
+        await asyncio.sleep(interval)
 
 
-async def run_worker() -> None:
-    database.init_db()
-    logger.info("Worker started: checking every %s seconds for devices offline > %s minutes",
-                CHECK_INTERVAL_SECONDS, OFFLINE_THRESHOLD_MINUTES)
+async def _maintenance_loop(assignment: ShardAssignment) -> None:
+    while True:
+        # One replica runs it: whichever owns shard 0
+        if MAINTENANCE_SHARD in assignment.shards:
+            try:
+                await maintain_partitions(database.async_session_factory)
+            except Exception as e:
+                logger.exception("Error during partition maintenance: %s", e)
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+
+
+async def _poll_loop(assignment: ShardAssignment) -> None:
     while True:
         try:
-            await check_offline_devices()
+            await check_offline_devices(shards=None if assignment.owns_all else assignment.shards)
         except Exception as e:
             logger.exception("Error during offline check: %s", e)
         await asyncio.sleep(CHECK_INTERVAL_SECONDS)
 
 
+async def run_worker() -> None:
+    database.init_db()
+    s = database.get_settings()
+    if s.worker_metrics_port:
+        start_http_server(s.worker_metrics_port)
+        logger.info("Serving metrics on port %s", s.worker_metrics_port)
+    membership = WorkerMembership(
+        database.async_session_factory, s.worker_id or default_worker_id(), s.worker_lease_seconds
+    )
+    # Join before working so the first pass already covers only this worker's shards
+    assignment = ShardAssignment()
+    assignment.set(owned_shards(membership.worker_id, await membership.heartbeat()))
+    logger.info("Worker %s owns %s of %s shards", membership.worker_id, len(assignment.shards), DEVICE_SHARDS)
+    if s.worker_mode == "deadline":
+        if database.engine.dialect.name != "postgresql":
+            raise RuntimeError("WORKER_MODE=deadline needs PostgreSQL (LISTEN/NOTIFY)")
+        async with database.async_session_factory() as session:
+            trigger = await session.execute(
+                text("SELECT 1 FROM pg_trigger WHERE tgname = 'devices_last_seen_notify_update'")
+            )
+            if trigger.first() is None:
+                raise RuntimeError("WORKER_MODE=deadline needs migrations/005_device_last_seen_notify.sql")
+        logger.info("Worker started: alerting when a device is silent for %s minutes (deadline mode)",
+                    OFFLINE_THRESHOLD_MINUTES)
+        monitor = OfflineDeadlineMonitor(database.async_session_factory, assignment=assignment)
+        offline = monitor.run(database.engine)
+    else:
+        logger.info("Worker started: checking every %s seconds for devices offline > %s minutes",
+                    CHECK_INTERVAL_SECONDS, OFFLINE_THRESHOLD_MINUTES)
+        offline = _poll_loop(assignment)
+    try:
+        await asyncio.gather(
+            _membership_loop(membership, assignment, s.worker_heartbeat_seconds),
+            _maintenance_loop(assignment),
+            offline,
+        )
+    finally:
+        await membership.leave()
+
+
 def main() -> None:
     asyncio.run(run_worker())
 
@@ -0,0 +1,147 @@
+"""
+Write-behind buffer for telemetry ingestion: requests enqueue validated samples and return,
+background flushers drain the queue into bulk inserts on a size or time trigger.
+"""
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from ingest import write_telemetry
+from metrics import WRITE_BUFFER_DROPPED
+from schemas import TelemetryCreate
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryWriteBuffer:
+    """Bounded in-process queue of samples flushed to the database by a few flusher tasks."""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_rows: int,
+        flush_rows: int,
+        flush_interval_seconds: float,
+        flushers: int = 1,
+        max_attempts: int = 5,
+        retry_seconds: float = 0.5,
+    ):
+        self._session_factory = session_factory
+        self._queue: asyncio.Queue[TelemetryCreate] = asyncio.Queue(maxsize=max_rows)
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval_seconds
+        self._flushers = flushers
+        self._max_attempts = max_attempts
+        self._retry_seconds = retry_seconds
+        self._flush_requested = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._closed = False
+
+    def offer(self, item: TelemetryCreate) -> bool:
+        """Enqueue a sample; return False when the buffer is full or shutting down."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return False
+        if self._queue.qsize() >= self._flush_rows:
+            self._flush_requested.set()
+        return True
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._flushers)]
+
+    async def stop(self) -> None:
+        """Stop accepting samples, wait for the flushers and write whatever is left."""
+        self._closed = True
+        self._flush_requested.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Drain the queue in chunks of at most flush_rows samples."""
+        while not self._queue.empty():
+            size = min(self._flush_rows, self._queue.qsize())
+            batch = [self._queue.get_nowait() for _ in range(size)]
+            await self._write(batch)
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self._flush_interval)
+            except TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def _write(self, batch: list[TelemetryCreate]) -> None:
+        """
+        Write one batch, retrying with exponential backoff (transient errors such as pool timeouts).
+        The samples were already acknowledged with 202: they are dropped, logged and counted only
+        after max_attempts failures. A retrying flusher takes no new work, so a long outage fills the
+        queue and the API answers 503 instead of accepting samples it cannot write.
+        """
+        for attempt in range(1, self._max_attempts + 1):
+            async with self._session_factory() as session:
+                try:
+                    await write_telemetry(session, batch)
+                    await database.commit_session(session)
+                    return
+                except Exception:
+                    await session.rollback()
+                    if attempt == self._max_attempts:
+                        WRITE_BUFFER_DROPPED.inc(len(batch))
+                        logger.exception(
+                            "Dropped %s buffered telemetry rows after %s failed writes", len(batch), attempt
+                        )
+                        return
+                    logger.warning(
+                        "Write of %s buffered telemetry rows failed (attempt %s of %s), retrying",
+                        len(batch),
+                        attempt,
+                        self._max_attempts,
+                        exc_info=True,
+                    )
+            await asyncio.sleep(self._retry_seconds * 2 ** (attempt - 1))
+
+
+_buffer: TelemetryWriteBuffer | None = None
+
+
+def get_write_buffer() -> TelemetryWriteBuffer | None:
+    """Return the running write buffer, or None when ingestion writes synchronously."""
+    return _buffer
+
+
+async def start_write_buffer() -> None:
+    global _buffer
+    s = database.get_settings()
+    if s.ingest_mode != "buffered" or _buffer is not None:
+        return
+    if database.async_session_factory is None:
+        database.init_db()
+    _buffer = TelemetryWriteBuffer(
+        database.async_session_factory,
+        max_rows=s.write_buffer_max_rows,
+        flush_rows=s.write_buffer_flush_rows,
+        flush_interval_seconds=s.write_buffer_flush_interval_seconds,
+        flushers=s.write_buffer_flushers,
+        max_attempts=s.write_buffer_max_attempts,
+        retry_seconds=s.write_buffer_retry_seconds,
+    )
+    _buffer.start()
+
+
+async def stop_write_buffer() -> None:
+    global _buffer
+    if _buffer is None:
+        return
+    await _buffer.stop()
+    _buffer = None